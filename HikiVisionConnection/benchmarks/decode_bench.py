@@ -0,0 +1,138 @@
+"""Micro-benchmark: per-part event handling, old print/json path vs. process_part.
+
+Runs synthetic JSON parts (AccessControllerEvents mixed with heartbeats) through
+the previous decode path (``decode`` + ``json.loads`` + ``EnterEvent(...)`` +
+``print`` of every event) and through ``HikiVisionConnection.process_part``
+(orjson on the part's memoryview, compiled validator, queued and sampled logging).
+Both run on one core; results are written to stderr and CPU time is used, so
+events/sec is per core. Log output goes to stdout, discard it or pipe it somewhere
+realistic:
+
+    cd HikiVisionConnection
+    PYTHONPATH=src python benchmarks/decode_bench.py --events 50000 > /dev/null
+    PYTHONPATH=src python benchmarks/decode_bench.py | cat > /dev/null
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from connection import HikiVisionConnection  # noqa: E402
+from log_setup import setup_logging  # noqa: E402
+from multipart import Part  # noqa: E402
+from schemas import EnterEvent  # noqa: E402
+
+
+class CountingPipeline:
+    def __init__(self):
+        self.count = 0
+
+    async def put(self, event):
+        self.count += 1
+
+
+def make_bodies(events: int, heartbeat_every: int) -> list[bytes]:
+    bodies = []
+    for i in range(events):
+        if heartbeat_every and i % heartbeat_every == 0:
+            heartbeat = {"ipAddress": "192.168.88.101", "eventType": "Non-AccessControllerEvent", "dateTime": "2025-08-20T08:00:00+05:00"}
+            bodies.append(json.dumps(heartbeat, indent="\t").encode())
+        event = {
+            "ipAddress": "192.168.88.101",
+            "portNo": 80,
+            "protocol": "HTTP",
+            "channelID": 1,
+            "dateTime": "2025-08-20T08:00:00+05:00",
+            "activePostCount": 1,
+            "eventType": "AccessControllerEvent",
+            "eventState": "active",
+            "eventDescription": "Access Controller Event",
+            "AccessControllerEvent": {
+                "deviceName": "Access Controller",
+                "majorEventType": 5,
+                "subEventType": 75,
+                "name": "Employee",
+                "cardReaderNo": 1,
+                "employeeNoString": f"{i:06d}",
+                "serialNo": i,
+                "userType": "normal",
+                "currentVerifyMode": "cardOrFace",
+                "attendanceStatus": "undefined",
+                "mask": "no",
+                "picturesNumber": 1,
+            },
+        }
+        bodies.append(json.dumps(event, indent="\t").encode())
+    return bodies
+
+
+async def legacy_process(body: bytes, pipeline: CountingPipeline, camera_type: str):
+    """process_part as it was before the fast path, minus the multipart split."""
+    try:
+        json_data = json.loads(body.decode(errors="ignore"))
+        event_type = json_data.get("eventType")
+        dt = json_data.get("dateTime")
+        if event_type == "AccessControllerEvent":
+            access_event = json_data.get("AccessControllerEvent", {})
+            person = access_event.get("employeeNoString") or "unknown"
+            if person != "unknown":
+                event = EnterEvent(user_id=person, time=dt, camera_type=camera_type)
+                await pipeline.put(event)
+                print(f"[✅] Queued AccessControllerEvent: {event.model_dump()}, data: {json_data}")
+        elif event_type == "Non-AccessControllerEvent":
+            print(f"[ℹ️] Ignored Non-AccessControllerEvent: {json_data}")
+        else:
+            print(f"[WARN] Unknown event type: {event_type}, data: {json_data}")
+    except Exception as e:
+        print(f"[ERROR] Failed to parse JSON: {e}")
+
+
+async def run_legacy(bodies: list[bytes]) -> int:
+    pipeline = CountingPipeline()
+    for body in bodies:
+        await legacy_process(body, pipeline, "enter")
+    return pipeline.count
+
+
+async def run_new(bodies: list[bytes]) -> int:
+    pipeline = CountingPipeline()
+    conn = HikiVisionConnection("192.168.88.101", "admin", "", "enter", pipeline)
+    empty = memoryview(b"")
+    for body in bodies:
+        await conn.process_part(Part(empty, memoryview(body), "application/json", len(body)))
+    return pipeline.count
+
+
+def run(name: str, func, bodies: list[bytes], repeat: int) -> float:
+    best = float("inf")
+    events = 0
+    for _ in range(repeat):
+        started = time.process_time()
+        events = asyncio.run(func(bodies))
+        best = min(best, time.process_time() - started)
+    print(f"{name:>8}: {len(bodies)} parts, {events} events in {best * 1000:9.2f} ms CPU  "
+          f"{len(bodies) / best:10.0f} parts/s/core", file=sys.stderr)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=20_000)
+    parser.add_argument("--heartbeat-every", type=int, default=1, help="one heartbeat per N events, 0 disables")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    setup_logging("INFO")
+    bodies = make_bodies(args.events, args.heartbeat_every)
+
+    old = run("legacy", run_legacy, bodies, args.repeat)
+    new = run("new", run_new, bodies, args.repeat)
+    print(f"speed-up: {old / new:.1f}x", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""End-to-end ingestion benchmark against emulated terminals.
+
+Starts emulator.py in a subprocess with ``--devices`` emulated terminals, then
+runs one HikiVisionConnection stream per device in this process, feeding the
+real EventPipeline. The broker is replaced by a stand-in publish function that
+confirms every event after ``--confirm-ms``. Latency is measured from the moment
+the emulator wrote an event (its ``serialNo`` carries the send time) to the
+moment the pipeline handed it to the broker.
+
+Reports events/s, latency percentiles, CPU use and RSS of the ingestion process.
+Run from HikiVisionConnection/ so the settings find .env.template:
+
+    PYTHONPATH=src python benchmarks/e2e_bench.py --devices 100 --rate 2 --duration 30
+    PYTHONPATH=src python benchmarks/e2e_bench.py --devices 20 --rate 5 --image-size 60000 --snapshots
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from config import settings  # noqa: E402
+from connection import HikiVisionConnection  # noqa: E402
+from dedupe import EventDeduplicator  # noqa: E402
+from emulator import add_arguments  # noqa: E402
+from health import HealthRegistry  # noqa: E402
+from log_setup import setup_logging  # noqa: E402
+from pipeline import EventPipeline  # noqa: E402
+from snapshots import SnapshotStore  # noqa: E402
+
+
+class BrokerStandIn:
+    """Accepts published batches and confirms them after a fixed delay."""
+
+    def __init__(self, confirm_delay: float):
+        self.confirm_delay = confirm_delay
+        self.measuring = False
+        self.events = 0
+        self.latencies_ms: list[float] = []
+
+    async def publish_batch(self, events) -> list[asyncio.Future]:
+        loop = asyncio.get_running_loop()
+        now_us = time.time_ns() // 1000
+        futures = []
+        for event in events:
+            if self.measuring:
+                self.events += 1
+                if event.serial_no:
+                    self.latencies_ms.append((now_us - event.serial_no) / 1000)
+            future = loop.create_future()
+            if self.confirm_delay:
+                loop.call_later(self.confirm_delay, future.set_result, None)
+            else:
+                future.set_result(None)
+            futures.append(future)
+        return futures
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    index = min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+
+
+def start_emulator(args) -> subprocess.Popen:
+    command = [
+        sys.executable, os.path.join(os.path.dirname(__file__), "emulator.py"),
+        "--devices", str(args.devices),
+        "--host", args.host,
+        "--base-port", str(args.base_port),
+        "--username", args.username,
+        "--password", args.password,
+        "--rate", str(args.rate),
+        "--heartbeat-interval", str(args.heartbeat_interval),
+        "--image-size", str(args.image_size),
+        "--employees", str(args.employees),
+        "--speed", str(args.speed),
+        "--timestamp-serials",
+    ]
+    if args.capture:
+        command += ["--capture", args.capture]
+    if args.no_subscribe:
+        command.append("--no-subscribe")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    process.stdout.readline()
+    return process
+
+
+async def run(args):
+    settings.stream.startup_spread = args.startup_spread
+    settings.snapshots.enabled = args.snapshots
+    broker = BrokerStandIn(args.confirm_ms / 1000)
+    pipeline = EventPipeline(
+        publish_batch=broker.publish_batch,
+        max_size=settings.pipeline.max_size,
+        batch_size=settings.pipeline.batch_size,
+        batch_timeout=settings.pipeline.batch_timeout,
+        policy="block",
+    )
+    await pipeline.start()
+    deduplicator = EventDeduplicator() if args.dedupe else None
+    snapshots = SnapshotStore(tempfile.mkdtemp(prefix="snapshots-")) if args.snapshots else None
+    registry = HealthRegistry()
+
+    connections = [
+        HikiVisionConnection(
+            f"{args.host}:{args.base_port + index}",
+            args.username,
+            args.password,
+            "enter" if index % 2 == 0 else "exit",
+            pipeline,
+            deduplicator=deduplicator,
+            health=registry.register(str(index)),
+            snapshots=snapshots,
+        )
+        for index in range(args.devices)
+    ]
+    tasks = [asyncio.create_task(conn.stream_events()) for conn in connections]
+
+    await asyncio.sleep(args.warmup)
+    streaming = sum(1 for health in registry.devices.values() if health.state.value == "streaming")
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.monotonic()
+    broker.measuring = True
+    await asyncio.sleep(args.duration)
+    broker.measuring = False
+    elapsed = time.monotonic() - started
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await pipeline.stop()
+    if snapshots is not None:
+        snapshots.close()
+
+    cpu = (usage_end.ru_utime - usage.ru_utime) + (usage_end.ru_stime - usage.ru_stime)
+    latencies = sorted(broker.latencies_ms)
+    bytes_received = sum(health.bytes_received for health in registry.devices.values())
+    print(f"devices streaming: {streaming}/{args.devices}")
+    print(f"events: {broker.events} in {elapsed:.1f} s = {broker.events / elapsed:.0f} events/s")
+    print(f"received: {bytes_received / 2 ** 20:.1f} MB over the whole run")
+    print(
+        "latency ms: "
+        f"p50 {percentile(latencies, 50):.2f}  p90 {percentile(latencies, 90):.2f}  "
+        f"p99 {percentile(latencies, 99):.2f}  max {latencies[-1] if latencies else float('nan'):.2f}"
+    )
+    print(f"cpu: {cpu:.2f} s = {cpu / elapsed * 100:.0f}% of one core")
+    print(f"rss: {rss_mb():.0f} MB now, {usage_end.ru_maxrss / 1024:.0f} MB peak")
+    if snapshots is not None:
+        print(f"snapshots: {snapshots.stats()}")
+    if deduplicator is not None:
+        print(f"dedupe: {deduplicator.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds to connect before measuring")
+    parser.add_argument("--startup-spread", type=float, default=1.0)
+    parser.add_argument("--confirm-ms", type=float, default=2.0, help="broker stand-in confirm delay")
+    parser.add_argument("--dedupe", action="store_true", help="run the dedupe stage")
+    parser.add_argument("--snapshots", action="store_true", help="store image parts in a temporary directory")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    setup_logging(args.log_level)
+    emulator = start_emulator(args)
+    try:
+        asyncio.run(run(args))
+    finally:
+        emulator.terminate()
+        emulator.wait()
+
+
+if __name__ == "__main__":
+    main()
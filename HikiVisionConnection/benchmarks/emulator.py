@@ -0,0 +1,324 @@
+"""Hikvision terminal emulator for load tests.
+
+Serves ``/ISAPI/Event/notification/alertStream`` (and ``subscribeEvent``) behind
+digest auth on ``--devices`` consecutive ports, with the multipart framing the
+terminals use. Each device either generates AccessControllerEvents, heartbeats and
+JPEG parts at the configured rates, or replays a recorded alertStream body
+(``curl --digest -u user:pass <url> -o capture.bin``), paced by the events'
+``dateTime`` and sped up by ``--speed``.
+
+With ``--timestamp-serials`` every event's ``serialNo`` is the send time in
+microseconds since the epoch, which lets e2e_bench.py measure per-event latency.
+
+    python benchmarks/emulator.py --devices 50 --rate 5 --image-size 60000
+    python benchmarks/emulator.py --devices 10 --capture capture.bin --speed 20
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import secrets
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from multipart import MultipartParser  # noqa: E402
+
+
+BOUNDARY = b"--MIME_boundary"
+REALM = "DS-K1T341"
+ALERT_STREAM = "/ISAPI/Event/notification/alertStream"
+SUBSCRIBE = "/ISAPI/Event/notification/subscribeEvent"
+
+_AUTH_PARAM_RE = re.compile(r'(\w+)=(?:"([^"]*)"|([^,\s]*))')
+
+
+def _md5(value: str) -> str:
+    return hashlib.md5(value.encode()).hexdigest()
+
+
+def make_part(content_type: str, body: bytes) -> bytes:
+    return (
+        BOUNDARY + b"\r\n"
+        + f"Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n".encode()
+        + body + b"\r\n"
+    )
+
+
+class Profile:
+    """What an emulated device sends."""
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        heartbeat_interval: float = 10.0,
+        image_size: int = 0,
+        employees: int = 100_000,
+        timestamp_serials: bool = False,
+        capture: list[tuple[float | None, str, bytes]] | None = None,
+        speed: float = 1.0,
+        loop_capture: bool = True,
+    ):
+        self.rate = rate
+        self.heartbeat_interval = heartbeat_interval
+        self.image_size = image_size
+        self.employees = employees
+        self.timestamp_serials = timestamp_serials
+        self.capture = capture
+        self.speed = speed
+        self.loop_capture = loop_capture
+
+
+def load_capture(path: str) -> list[tuple[float | None, str, bytes]]:
+    """Split a recorded alertStream body into (event time, content type, body) parts."""
+    with open(path, "rb") as f:
+        data = f.read()
+    parts = []
+    parser = MultipartParser(boundary=BOUNDARY)
+    for part in parser.feed(data + BOUNDARY):
+        body = bytes(part.body)
+        event_time = None
+        if part.content_type == "application/json":
+            try:
+                event_time = datetime.fromisoformat(json.loads(body)["dateTime"]).timestamp()
+            except (ValueError, KeyError, TypeError):
+                pass
+        parts.append((event_time, part.content_type, body))
+    return parts
+
+
+class EmulatedDevice:
+    def __init__(self, device_ip: str, username: str, password: str, profile: Profile, subscribe: bool = True):
+        self.device_ip = device_ip
+        self.username = username
+        self.password = password
+        self.profile = profile
+        self.subscribe = subscribe
+        self.serial = 0
+        self.events_sent = 0
+        self.bytes_sent = 0
+        self._nonces: set[str] = set()
+
+    # --- HTTP ----------------------------------------------------------------
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                method, target, _ = request_line.split(" ", 2)
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length:
+                    await reader.readexactly(length)
+
+                if not self._authorized(method, headers.get("authorization", "")):
+                    nonce = secrets.token_hex(16)
+                    self._nonces.add(nonce)
+                    await self._respond(
+                        writer, 401, f'WWW-Authenticate: Digest realm="{REALM}", qop="auth", nonce="{nonce}"\r\n'
+                    )
+                    continue
+
+                path = target.split("?", 1)[0]
+                if method == "GET" and path == ALERT_STREAM:
+                    await self.stream(writer, subscribed=False)
+                    return
+                if method == "POST" and path == SUBSCRIBE and self.subscribe:
+                    await self.stream(writer, subscribed=True)
+                    return
+                await self._respond(writer, 404 if path != SUBSCRIBE else 403)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _authorized(self, method: str, header: str) -> bool:
+        if not header.startswith("Digest "):
+            return False
+        params = {key: quoted or bare for key, quoted, bare in _AUTH_PARAM_RE.findall(header[7:])}
+        if params.get("username") != self.username or params.get("nonce") not in self._nonces:
+            return False
+        ha1 = _md5(f"{self.username}:{REALM}:{self.password}")
+        ha2 = _md5(f"{method}:{params.get('uri')}")
+        expected = _md5(f"{ha1}:{params['nonce']}:{params.get('nc')}:{params.get('cnonce')}:{params.get('qop')}:{ha2}")
+        return secrets.compare_digest(expected, params.get("response", ""))
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, extra_headers: str = ""):
+        reason = {401: "Unauthorized", 403: "Forbidden", 404: "Not Found"}[status]
+        writer.write(f"HTTP/1.1 {status} {reason}\r\n{extra_headers}Content-Length: 0\r\n\r\n".encode())
+        await writer.drain()
+
+    # --- Stream --------------------------------------------------------------
+
+    async def stream(self, writer: asyncio.StreamWriter, subscribed: bool):
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: multipart/mixed; boundary=MIME_boundary\r\n"
+            b"Connection: close\r\n\r\n"
+        )
+        if subscribed:
+            writer.write(make_part("application/json", json.dumps({"SubscribeEventResponse": {"id": 1}}).encode()))
+        parts = self.replay() if self.profile.capture is not None else self.generate()
+        async for data in parts:
+            writer.write(data)
+            self.bytes_sent += len(data)
+            await writer.drain()
+
+    def access_event(self, employee_no: str | None = None, pictures: int = 0) -> dict:
+        self.serial += 1
+        serial = time.time_ns() // 1000 if self.profile.timestamp_serials else self.serial
+        return {
+            "ipAddress": self.device_ip,
+            "portNo": 80,
+            "protocol": "HTTP",
+            "dateTime": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "activePostCount": 1,
+            "eventType": "AccessControllerEvent",
+            "eventState": "active",
+            "eventDescription": "Access Controller Event",
+            "AccessControllerEvent": {
+                "deviceName": "Access Controller",
+                "majorEventType": 5,
+                "subEventType": 75,
+                "employeeNoString": employee_no or str(random.randrange(self.profile.employees)),
+                "serialNo": serial,
+                "currentVerifyMode": "cardOrFace",
+                "picturesNumber": pictures,
+            },
+        }
+
+    def heartbeat(self) -> dict:
+        return {
+            "ipAddress": self.device_ip,
+            "dateTime": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "eventType": "Non-AccessControllerEvent",
+        }
+
+    async def generate(self):
+        profile = self.profile
+        image = os.urandom(profile.image_size) if profile.image_size else b""
+        started = time.monotonic()
+        next_heartbeat = started
+        sent = 0
+        while True:
+            now = time.monotonic()
+            if profile.heartbeat_interval and now >= next_heartbeat:
+                yield make_part("application/json", json.dumps(self.heartbeat()).encode())
+                next_heartbeat = now + profile.heartbeat_interval
+            due = int((now - started) * profile.rate) - sent if profile.rate else 0
+            for _ in range(due):
+                event = self.access_event(pictures=1 if image else 0)
+                data = make_part("application/json", json.dumps(event).encode())
+                if image:
+                    # Distinct bytes per event, so the snapshot store cannot deduplicate them.
+                    serial = event["AccessControllerEvent"]["serialNo"].to_bytes(8, "big")
+                    data += make_part("image/jpeg", serial + image[8:])
+                self.events_sent += 1
+                yield data
+            sent += due
+            await asyncio.sleep(0.01)
+
+    async def replay(self):
+        profile = self.profile
+        while True:
+            base_event_time = None
+            base = time.monotonic()
+            for event_time, content_type, body in profile.capture:
+                if event_time is not None:
+                    if base_event_time is None:
+                        base_event_time = event_time
+                    delay = base + (event_time - base_event_time) / profile.speed - time.monotonic()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                if content_type == "application/json" and b"AccessControllerEvent" in body:
+                    data = json.loads(body)
+                    if data.get("eventType") == "AccessControllerEvent":
+                        original = data.get("AccessControllerEvent", {})
+                        data = self.access_event(original.get("employeeNoString"), original.get("picturesNumber", 0))
+                        body = json.dumps(data).encode()
+                        self.events_sent += 1
+                yield make_part(content_type, body)
+            if not profile.loop_capture:
+                return
+
+
+async def serve(devices: list[EmulatedDevice], host: str = "127.0.0.1") -> list[asyncio.AbstractServer]:
+    servers = []
+    for device in devices:
+        port = int(device.device_ip.rsplit(":", 1)[1])
+        servers.append(await asyncio.start_server(device.handle, host, port))
+    return servers
+
+
+def build_devices(args) -> list[EmulatedDevice]:
+    capture = load_capture(args.capture) if args.capture else None
+    profile = Profile(
+        rate=args.rate,
+        heartbeat_interval=args.heartbeat_interval,
+        image_size=args.image_size,
+        employees=args.employees,
+        timestamp_serials=args.timestamp_serials,
+        capture=capture,
+        speed=args.speed,
+    )
+    return [
+        EmulatedDevice(f"{args.host}:{args.base_port + index}", args.username, args.password, profile, not args.no_subscribe)
+        for index in range(args.devices)
+    ]
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=18000)
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="emulator")
+    parser.add_argument("--rate", type=float, default=1.0, help="AccessControllerEvents per second per device")
+    parser.add_argument("--heartbeat-interval", type=float, default=10.0, help="seconds, 0 disables heartbeats")
+    parser.add_argument("--image-size", type=int, default=0, help="JPEG bytes sent after each event, 0 disables")
+    parser.add_argument("--employees", type=int, default=100_000, help="size of the random employee pool")
+    parser.add_argument("--timestamp-serials", action="store_true", help="use the send time in us as serialNo")
+    parser.add_argument("--capture", help="replay a recorded alertStream body instead of generating events")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed-up")
+    parser.add_argument("--no-subscribe", action="store_true", help="answer subscribeEvent with 403")
+
+
+async def run(args):
+    devices = build_devices(args)
+    servers = await serve(devices, args.host)
+    print(f"Emulating {len(devices)} devices on {args.host}:{args.base_port}-{args.base_port + len(devices) - 1}", flush=True)
+    try:
+        while True:
+            await asyncio.sleep(10)
+            events = sum(device.events_sent for device in devices)
+            sent = sum(device.bytes_sent for device in devices)
+            print(f"events sent: {events}, bytes sent: {sent}", flush=True)
+    finally:
+        for server in servers:
+            server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    try:
+        asyncio.run(run(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Micro-benchmark: JSON-per-message vs. the binary multi-event envelope.
+
+For each format and events-per-message setting reports the bytes on the wire
+per event (message body plus the AMQP publish frames, marshalled with pamqp)
+and the CPU cost per event of encoding on the producer, of decoding into event
+models on the consumer (``model_validate_json`` for JSON, ``envelope.decode``
+plus the model constructor for the envelope), and of the consumer's per-message
+AMQP work: unmarshalling the basic.deliver, content header and body frames and
+marshalling the basic.ack, as aiormq does for every message.
+
+    cd HikiVisionConnection
+    PYTHONPATH=src python benchmarks/envelope_bench.py --events 100000
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from pamqp import commands, frame, header, body as amqp_body
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import envelope  # noqa: E402
+from schemas import EnterEvent  # noqa: E402
+
+
+def make_events(count: int, snapshots: bool) -> list[EnterEvent]:
+    start = datetime(2025, 8, 20, 8, 0, tzinfo=timezone(timedelta(hours=5)))
+    return [
+        EnterEvent(
+            user_id=f"{i % 5000:06d}",
+            time=start + timedelta(seconds=i),
+            camera_type="enter" if i % 2 == 0 else "exit",
+            device_ip=f"192.168.88.{100 + i % 50}",
+            serial_no=i,
+            snapshot=f"2025/08/20/ab/{i:064x}.jpg" if snapshots else None,
+        )
+        for i in range(count)
+    ]
+
+
+def amqp_overhead(routing_key: str, content_type: str, body_size: int) -> int:
+    """Bytes of the method and content header frames of one basic.publish, plus the body frame's framing."""
+    properties = commands.Basic.Properties(content_type=content_type, delivery_mode=2)
+    return (
+        len(frame.marshal(commands.Basic.Publish(exchange="", routing_key=routing_key), 1))
+        + len(frame.marshal(header.ContentHeader(0, body_size, properties), 1))
+        + len(frame.marshal(amqp_body.ContentBody(b""), 1))
+    )
+
+
+def amqp_receive(routing_key: str, content_type: str, bodies: list[bytes]):
+    """Unmarshal the frames of every delivered message and marshal its ack."""
+    received = [
+        frame.marshal(commands.Basic.Deliver("ctag1.consumer", index + 1, False, "", routing_key), 1)
+        + frame.marshal(header.ContentHeader(0, len(b), commands.Basic.Properties(content_type=content_type, delivery_mode=2)), 1)
+        + frame.marshal(amqp_body.ContentBody(b), 1)
+        for index, b in enumerate(bodies)
+    ]
+
+    def receive():
+        for index, data in enumerate(received):
+            offset = 0
+            for _ in range(3):
+                consumed, _, _ = frame.unmarshal(data[offset:])
+                offset += consumed
+            frame.marshal(commands.Basic.Ack(index + 1), 1)
+
+    return receive
+
+
+def best_of(repeat: int, func) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        func()
+        best = min(best, time.process_time() - started)
+    return best
+
+
+def bench_json(events: list[EnterEvent], routing_key: str, repeat: int):
+    bodies = [event.model_dump_json().encode() for event in events]
+    size = sum(len(b) + amqp_overhead(routing_key, "application/json", len(b)) for b in bodies)
+    encode = best_of(repeat, lambda: [event.model_dump_json().encode() for event in events])
+    decode = best_of(repeat, lambda: [EnterEvent.model_validate_json(b) for b in bodies])
+    amqp = best_of(repeat, amqp_receive(routing_key, "application/json", bodies))
+    return size, encode, decode, amqp
+
+
+def bench_envelope(events: list[EnterEvent], per_message: int, routing_key: str, repeat: int):
+    groups = [events[i:i + per_message] for i in range(0, len(events), per_message)]
+    bodies = [envelope.encode(group) for group in groups]
+    size = sum(len(b) + amqp_overhead(routing_key, envelope.CONTENT_TYPE, len(b)) for b in bodies)
+
+    def decode_all():
+        for b in bodies:
+            for data in envelope.decode(b):
+                EnterEvent(**data)
+
+    encode = best_of(repeat, lambda: [envelope.encode(group) for group in groups])
+    decode = best_of(repeat, decode_all)
+    amqp = best_of(repeat, amqp_receive(routing_key, envelope.CONTENT_TYPE, bodies))
+    return size, encode, decode, amqp
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=50_000)
+    parser.add_argument("--per-message", type=int, nargs="+", default=[1, 10, 100, 1000])
+    parser.add_argument("--snapshots", action="store_true", help="give every event a snapshot path")
+    parser.add_argument("--routing-key", default="camera_events")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    events = make_events(args.events, args.snapshots)
+    decoded = [EnterEvent(**data) for data in envelope.decode(envelope.encode(events[:1000]))]
+    assert decoded == events[:1000], "envelope round trip changed the events"
+
+    n = len(events)
+    rows = [("json", 1, *bench_json(events, args.routing_key, args.repeat))]
+    for per_message in args.per_message:
+        rows.append(("envelope", per_message, *bench_envelope(events, per_message, args.routing_key, args.repeat)))
+
+    print(f"{'format':>8} {'ev/msg':>6} {'bytes/event':>11} {'encode us/ev':>12} {'decode us/ev':>12} {'amqp us/ev':>10}")
+    for name, per_message, size, encode, decode, amqp in rows:
+        print(
+            f"{name:>8} {per_message:>6} {size / n:>11.1f} {encode / n * 1e6:>12.2f} "
+            f"{decode / n * 1e6:>12.2f} {amqp / n * 1e6:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
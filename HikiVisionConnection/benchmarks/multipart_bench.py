@@ -0,0 +1,121 @@
+"""Micro-benchmark: old buffer-slicing parser vs. the incremental MultipartParser.
+
+Feeds a recorded alertStream capture (raw HTTP body, e.g. saved with
+``curl --digest -u user:pass <url> -o capture.bin``) or a synthetic stream
+through both parsers in fixed-size chunks.
+
+    python benchmarks/multipart_bench.py --events 2000 --image-size 150000
+    python benchmarks/multipart_bench.py --capture capture.bin --chunk-size 4096
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from multipart import MultipartParser  # noqa: E402
+
+
+BOUNDARY = b"--MIME_boundary"
+
+
+def legacy_parts(chunks, boundary=BOUNDARY):
+    """The parser connection.py used before MultipartParser, including process_part's split."""
+    buffer = b""
+    for chunk in chunks:
+        buffer += chunk
+        while True:
+            boundary_index = buffer.find(boundary)
+            if boundary_index == -1:
+                break
+
+            part = buffer[:boundary_index]
+            buffer = buffer[boundary_index + len(boundary):]
+            part = part.lstrip(b"\r\n")
+
+            if part.strip():
+                header_end = part.find(b"\r\n\r\n")
+                if header_end == -1:
+                    continue
+                yield part[:header_end].decode(errors="ignore"), part[header_end + 4:]
+
+
+def new_parts(chunks, boundary=BOUNDARY):
+    parser = MultipartParser(boundary=boundary)
+    for chunk in chunks:
+        for part in parser.feed(chunk):
+            yield part.content_type, len(part.body)
+
+
+def make_part(content_type: str, body: bytes, with_length: bool) -> bytes:
+    headers = f"Content-Type: {content_type}\r\n"
+    if with_length:
+        headers += f"Content-Length: {len(body)}\r\n"
+    return BOUNDARY + b"\r\n" + headers.encode() + b"\r\n" + body + b"\r\n"
+
+
+def synthetic_stream(events: int, image_size: int, heartbeat_every: int, with_length: bool) -> bytes:
+    image = bytes(range(256)) * (image_size // 256 + 1)
+    image = image[:image_size]
+    parts = []
+    for i in range(events):
+        if heartbeat_every and i % heartbeat_every == 0:
+            heartbeat = {"ipAddress": "192.168.88.101", "eventType": "Non-AccessControllerEvent", "dateTime": "2025-08-20T08:00:00+05:00"}
+            parts.append(make_part("application/json", json.dumps(heartbeat).encode(), with_length))
+        event = {
+            "ipAddress": "192.168.88.101",
+            "dateTime": "2025-08-20T08:00:00+05:00",
+            "eventType": "AccessControllerEvent",
+            "AccessControllerEvent": {"employeeNoString": f"{i:06d}", "serialNo": i, "picturesNumber": 1 if image_size else 0},
+        }
+        parts.append(make_part("application/json", json.dumps(event).encode(), with_length))
+        if image_size:
+            parts.append(make_part("image/jpeg", image, with_length))
+    return b"".join(parts) + BOUNDARY
+
+
+def chunked(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def run(name, parse, chunks, total_bytes, repeat):
+    best = float("inf")
+    count = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = sum(1 for _ in parse(chunks))
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:>8}: {count} parts in {best * 1000:9.2f} ms  "
+          f"{total_bytes / best / 1e6:9.1f} MB/s  {count / best:12.0f} parts/s")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--capture", help="raw alertStream body recorded from a device")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--image-size", type=int, default=100_000, help="JPEG part size, 0 disables images")
+    parser.add_argument("--heartbeat-every", type=int, default=5)
+    parser.add_argument("--no-content-length", action="store_true", help="omit Content-Length headers")
+    parser.add_argument("--chunk-size", type=int, default=4096)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, "rb") as f:
+            data = f.read()
+    else:
+        data = synthetic_stream(args.events, args.image_size, args.heartbeat_every, not args.no_content_length)
+
+    chunks = chunked(data, args.chunk_size)
+    print(f"stream: {len(data) / 1e6:.1f} MB in {len(chunks)} chunks of {args.chunk_size} B")
+
+    old = run("legacy", legacy_parts, chunks, len(data), args.repeat)
+    new = run("new", new_parts, chunks, len(data), args.repeat)
+    print(f"speed-up: {old / new:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+"""Backfill events the streams missed from the terminals' own event log.
+
+Gaps are found while streaming (see ``gaps.py``) and journaled per device. The
+backfill pages through ``/ISAPI/AccessControl/AcsEvent`` for each gap, several
+devices at once but each device at most ``requests_per_second``, and hands the
+events to the event pipeline like streamed ones. Only events whose serialNo
+lies between the gap's known serials (the last streamed before it and the
+first streamed after it) are published, so nothing the stream already
+delivered is sent twice. Progress is checkpointed after every page, so
+an interrupted run resumes where it stopped.
+
+The consumer stores backfilled events in its raw event store, where repeats
+(e.g. a page replayed after a crash) are skipped. Events that arrive behind its
+reorder watermark are not applied in arrival order: the affected users' days of
+user_logs are rebuilt from the raw store instead (``late_rebuild_days``).
+
+Run inside the ingestion service (``backfill.enabled``), or by hand for a range:
+
+    PYTHONPATH=src python src/backfill.py --device 192.168.88.101 --start 2026-10-17T08:00+05:00 --end 2026-10-17T12:00+05:00
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+import httpx
+
+from config import settings
+from gaps import GapJournal
+from schemas import EnterEvent
+
+
+logger = logging.getLogger("backfill")
+
+SEARCH_PATH = "/ISAPI/AccessControl/AcsEvent?format=json"
+ACCESS_CONTROL_MAJOR = 5
+
+
+class RateLimiter:
+    """At most ``rate`` acquisitions per second, evenly spaced."""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            delay = self._next - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._next = max(self._next, loop.time()) + self.interval
+
+
+class Checkpoint:
+    """Backfill progress of one device: gaps finished and position in the current one."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.gaps_done = 0
+        self.position = 0
+        self.published = 0
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            self.gaps_done = data["gaps_done"]
+            self.position = data["position"]
+            self.published = data.get("published", 0)
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+    def save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"gaps_done": self.gaps_done, "position": self.position, "published": self.published}, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class Backfiller:
+    def __init__(
+        self,
+        journal: GapJournal,
+        publish: Callable[[EnterEvent], Awaitable[None]],
+        requests_per_second: float = 2.0,
+        concurrency: int = 4,
+        page_size: int = 30,
+        margin: float = 5.0,
+        timeout: float = 30.0,
+    ):
+        self.journal = journal
+        self.publish = publish
+        self.requests_per_second = requests_per_second
+        self.page_size = page_size
+        self.margin = timedelta(seconds=margin)
+        self.timeout = timeout
+        self._devices = asyncio.Semaphore(concurrency)
+        self._limiters: dict[str, RateLimiter] = {}
+        self.requests = 0
+        self.published = 0
+        self.skipped = 0
+        self.failures = 0
+        self.gaps_done = 0
+
+    def _limiter(self, device_ip: str) -> RateLimiter:
+        limiter = self._limiters.get(device_ip)
+        if limiter is None:
+            limiter = self._limiters[device_ip] = RateLimiter(self.requests_per_second)
+        return limiter
+
+    async def _search(self, client: httpx.AsyncClient, device: dict, condition: dict) -> dict:
+        await self._limiter(device["device_ip"]).wait()
+        self.requests += 1
+        response = await client.post(
+            f"http://{device['device_ip']}{SEARCH_PATH}",
+            json={"AcsEventCond": condition},
+            auth=httpx.DigestAuth(device["username"], device["password"]),
+        )
+        response.raise_for_status()
+        return response.json().get("AcsEvent", {})
+
+    def _event(self, device: dict, item: dict, after_serial: int | None, before_serial: int | None) -> EnterEvent | None:
+        serial_no = item.get("serialNo")
+        person = item.get("employeeNoString")
+        if not person:
+            return None
+        if settings.stream.minor_events and item.get("minor") not in settings.stream.minor_events:
+            return None
+        if serial_no is not None:
+            if after_serial is not None and serial_no <= after_serial:
+                return None
+            if before_serial is not None and serial_no >= before_serial:
+                return None
+        return EnterEvent(
+            user_id=person,
+            time=item.get("time"),
+            camera_type=device["camera_type"],
+            device_ip=device["device_ip"],
+            serial_no=serial_no,
+            site=device.get("site"),
+            building=device.get("building"),
+        )
+
+    async def backfill_range(
+        self,
+        client: httpx.AsyncClient,
+        device: dict,
+        start: datetime,
+        end: datetime,
+        after_serial: int | None = None,
+        before_serial: int | None = None,
+        checkpoint: Checkpoint | None = None,
+    ) -> int:
+        """Publish the device's events between ``start`` and ``end``; returns how many."""
+        position = checkpoint.position if checkpoint is not None else 0
+        search_id = uuid.uuid4().hex
+        published = 0
+        while True:
+            result = await self._search(client, device, {
+                "searchID": search_id,
+                "searchResultPosition": position,
+                "maxResults": self.page_size,
+                "major": ACCESS_CONTROL_MAJOR,
+                "minor": 0,
+                "startTime": (start - self.margin).isoformat(timespec="seconds"),
+                "endTime": (end + self.margin).isoformat(timespec="seconds"),
+            })
+            items = result.get("InfoList") or []
+            page_published = 0
+            for item in items:
+                event = self._event(device, item, after_serial, before_serial)
+                if event is None:
+                    self.skipped += 1
+                    continue
+                await self.publish(event)
+                page_published += 1
+            published += page_published
+            self.published += page_published
+            position += result.get("numOfMatches", len(items))
+            if checkpoint is not None:
+                checkpoint.position = position
+                checkpoint.published += page_published
+                checkpoint.save()
+            if result.get("responseStatusStrg") != "MORE" or not items:
+                return published
+
+    async def backfill_device(self, device: dict):
+        """Work through the device's journaled gaps, resuming from its checkpoint."""
+        device_ip = device["device_ip"]
+        gaps = self.journal.read(device_ip)
+        checkpoint = Checkpoint(self.journal.checkpoint_path(device_ip))
+        if checkpoint.gaps_done > len(gaps):
+            # Left over from a journal that was truncated since.
+            checkpoint.gaps_done = checkpoint.position = 0
+        if checkpoint.gaps_done == len(gaps):
+            return
+        async with self._devices:
+            try:
+                async with httpx.AsyncClient(timeout=self.timeout) as client:
+                    for gap in gaps[checkpoint.gaps_done:]:
+                        published = await self.backfill_range(
+                            client,
+                            device,
+                            datetime.fromisoformat(gap["start"]),
+                            datetime.fromisoformat(gap["end"]),
+                            gap.get("after_serial"),
+                            gap.get("before_serial"),
+                            checkpoint,
+                        )
+                        logger.info(
+                            "Backfilled %s gap on %s (%s - %s): %d events",
+                            gap["reason"], device_ip, gap["start"], gap["end"], published,
+                        )
+                        checkpoint.gaps_done += 1
+                        checkpoint.position = 0
+                        checkpoint.save()
+                        self.gaps_done += 1
+            except (httpx.HTTPError, ValueError) as e:
+                self.failures += 1
+                logger.warning("Backfill of %s stopped, resuming next run: %s", device_ip, e)
+                return
+        # No await since the read: the stream cannot have added a gap in between.
+        if len(self.journal.read(device_ip)) == checkpoint.gaps_done:
+            # Checkpoint first: a crash in between repeats gaps instead of skipping new ones.
+            checkpoint.remove()
+            self.journal.truncate(device_ip)
+
+    async def backfill_device_range(self, device: dict, start: datetime, end: datetime) -> int:
+        """Publish everything the device logged between ``start`` and ``end``, without checkpoints."""
+        async with self._devices:
+            async with httpx.AsyncClient(timeout=self.timeout) as client:
+                return await self.backfill_range(client, device, start, end)
+
+    async def run_once(self, devices: list[dict]):
+        await asyncio.gather(*(self.backfill_device(device) for device in devices))
+
+    async def run(self, devices: Callable[[], list[dict]], interval: float):
+        """Backfill the journaled gaps of ``devices()`` every ``interval`` seconds until cancelled."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.run_once(devices())
+            except Exception:
+                logger.exception("Backfill run failed")
+
+    def stats(self) -> dict:
+        return {
+            "gaps_recorded": self.journal.recorded,
+            "gaps_done": self.gaps_done,
+            "requests": self.requests,
+            "published": self.published,
+            "skipped": self.skipped,
+            "failures": self.failures,
+        }
+
+
+async def backfill_once(devices: list[dict], start: datetime | None, end: datetime | None):
+    """Standalone run: a range of the given devices, or their journaled gaps."""
+    from pipeline import EventPipeline
+    from producer import close_rabbit, init_rabbit, publish_events
+    from spool import Spool
+
+    await init_rabbit(retry_interval=5)
+    pipeline = EventPipeline(
+        publish_batch=publish_events,
+        max_size=settings.pipeline.max_size,
+        batch_size=settings.pipeline.batch_size,
+        batch_timeout=settings.pipeline.batch_timeout,
+        policy="block",
+        spool=Spool(os.path.join(settings.backfill.directory, "spool")),
+    )
+    await pipeline.start()
+    backfiller = Backfiller(
+        GapJournal(settings.backfill.directory),
+        pipeline.put,
+        requests_per_second=settings.backfill.requests_per_second,
+        concurrency=settings.backfill.concurrency,
+        page_size=settings.backfill.page_size,
+        margin=settings.backfill.margin,
+    )
+    try:
+        if start is None:
+            await backfiller.run_once(devices)
+        else:
+            await asyncio.gather(*(backfiller.backfill_device_range(device, start, end) for device in devices))
+    finally:
+        await pipeline.stop()
+        await close_rabbit()
+    logger.info("Backfill finished: %s", backfiller.stats())
+
+
+def main():
+    from devices import load_devices
+    from log_setup import setup_logging
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--device", action="append", help="device_ip; repeatable, default all devices")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="without --start/--end the journaled gaps are backfilled")
+    parser.add_argument("--end", type=datetime.fromisoformat)
+    args = parser.parse_args()
+    if (args.start is None) != (args.end is None):
+        parser.error("--start and --end go together")
+
+    setup_logging(settings.logging.level)
+    devices = [device for device in load_devices() if not args.device or device["device_ip"] in args.device]
+    asyncio.run(backfill_once(devices, args.start, args.end))
+
+
+if __name__ == "__main__":
+    main()
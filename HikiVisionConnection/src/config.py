@@ -1,3 +1,4 @@
+from typing import Literal
 from pydantic_settings import BaseSettings
 from pydantic import BaseModel
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -18,8 +19,129 @@ class HikiVisionCongif(BaseModel):
 class RabbitMq(BaseModel):
     url: str
     queue_name: str
+    batch_size: int = 100
+    batch_window: float = 0.02
+    max_outstanding_confirms: int = 1000
+    confirm_timeout: float = 10.0
+    # "envelope" packs up to events_per_message events per message; "json" is one event per message.
+    encoding: Literal["envelope", "json"] = "envelope"
+    events_per_message: int = 100
+    # Topic exchange events are published to, with routing key site.building.camera_type;
+    # empty publishes straight to queue_name on the default exchange.
+    exchange: str = "camera_events"
+    # Append the user_id hash modulo partitions (site.building.camera_type.N) for hash-partitioned
+    # consumer queues (each consumer sets the same partitions and its own partition); 0 disables.
+    # Envelopes only share a routing key, so they get smaller.
+    partitions: int = 0
+    # Declare queue_name bound to every routing key ("#"): the consolidated queue of a single
+    # consumer deployment. Disable when consumers bind their own per-site or per-partition queues.
+    bind_queue: bool = True
 
 
+class PipelineConfig(BaseModel):
+    max_size: int = 10000
+    batch_size: int = 100
+    batch_timeout: float = 0.05
+    policy: Literal["block", "drop_oldest", "spill"] = "block"
+    metrics_interval: float = 60.0
+
+
+class SpoolConfig(BaseModel):
+    directory: str = "spool"
+    segment_bytes: int = 16 * 1024 * 1024
+    max_bytes: int = 512 * 1024 * 1024
+    fsync_every: int = 100
+    fsync_interval: float = 1.0
+    replay_batch_size: int = 1000
+    replay_interval: float = 5.0
+    # Failed replay passes before a batch is retried record by record and unpublishable records are quarantined.
+    replay_max_attempts: int = 5
+
+
+class DedupeConfig(BaseModel):
+    enabled: bool = True
+    serial_ttl: float = 300.0
+    employee_window: float = 2.0
+    max_entries: int = 100_000
+
+
+
+class DevicesConfig(BaseModel):
+    file: str | None = "devices.json"
+    # Location of devices that do not name theirs; routing key words, so no dots.
+    site: str = "main"
+    building: str = "main"
+
+
+class SupervisorConfig(BaseModel):
+    workers: int = 1
+    poll_interval: float = 5.0
+    restart_delay: float = 1.0
+
+
+class StreamConfig(BaseModel):
+    connect_timeout: float = 10.0
+    # A few heartbeat intervals; a silent stream longer than this is treated as stalled.
+    idle_timeout: float = 90.0
+    backoff_base: float = 1.0
+    backoff_cap: float = 60.0
+    startup_spread: float = 10.0
+    # Ask the device for only the events we use; devices without subscribeEvent fall back to alertStream.
+    subscribe: bool = True
+    heartbeat: int = 30
+    event_types: list[str] = ["AccessControllerEvent"]
+    # AccessControllerEvent minor codes to subscribe to, e.g. 75 for face authentication passed; empty means all.
+    minor_events: list[int] = []
+
+
+class SnapshotConfig(BaseModel):
+    # Image parts are dropped in the parser unless snapshots are enabled.
+    enabled: bool = False
+    directory: str = "snapshots"
+    workers: int = 2
+    max_pending: int = 100
+    # How long an event announcing a picture waits for its image part.
+    hold_timeout: float = 2.0
+    max_bytes: int = 10 * 1024 ** 3
+    max_age_days: int = 30
+    retention_interval: float = 600.0
+
+
+class BackfillConfig(BaseModel):
+    # Journal stream gaps and fetch their events from the devices' AcsEvent search.
+    enabled: bool = True
+    directory: str = "backfill"
+    interval: float = 300.0
+    requests_per_second: float = 2.0
+    concurrency: int = 4
+    page_size: int = 30
+    # Seconds added around each gap; the serialNo bounds keep the overlap out.
+    margin: float = 5.0
+
+
+class StatusConfig(BaseModel):
+    host: str = "0.0.0.0"
+    # Worker N of the supervisor listens on port + N; unset disables the status API.
+    port: int | None = 8081
+
+
+class IngestConfig(BaseModel):
+    # pull: one alertStream connection per device; push: devices POST to the push listener.
+    mode: Literal["pull", "push", "both"] = "pull"
+
+
+class PushConfig(BaseModel):
+    host: str = "0.0.0.0"
+    port: int = 8090
+    path: str = "/hikvision/events"
+
+
+class LoggingConfig(BaseModel):
+    level: str = "INFO"
+    # Per message template: at most sample_burst records every sample_interval seconds.
+    sample_burst: int = 10
+    sample_interval: float = 60.0
+
 
 class AppSettings(BaseSettings):
     model_config = SettingsConfigDict(
@@ -30,6 +152,18 @@ class AppSettings(BaseSettings):
     )
     camera: HikiVisionCongif
     rabbit: RabbitMq
+    pipeline: PipelineConfig = PipelineConfig()
+    spool: SpoolConfig = SpoolConfig()
+    dedupe: DedupeConfig = DedupeConfig()
+    devices: DevicesConfig = DevicesConfig()
+    supervisor: SupervisorConfig = SupervisorConfig()
+    stream: StreamConfig = StreamConfig()
+    snapshots: SnapshotConfig = SnapshotConfig()
+    backfill: BackfillConfig = BackfillConfig()
+    status: StatusConfig = StatusConfig()
+    ingest: IngestConfig = IngestConfig()
+    push: PushConfig = PushConfig()
+    logging: LoggingConfig = LoggingConfig()
 
     
 
@@ -1,183 +1,457 @@
 import asyncio
 import httpx
-import os
-from datetime import datetime
-import json
-import traceback
+import random
+import logging
+import re
+import orjson
 from schemas import EnterEvent
 from config import settings
-from producer import init_rabbit , close_rabbit , publish_event
-
-
-
-CAMERAS = [
-    
-    # {
-    #     "device_ip": "192.168.0.104",
-    #     "username": settings.camera.username,
-    #     "password": settings.camera.password,
-    #     "camera_type": "enter"
-    # }
-    {
-        "device_ip": "192.168.88.101",
-        "username": settings.camera.username,
-        "password": settings.camera.password,
-        "camera_type": "enter"
-    },
-    {
-        "device_ip": "192.168.88.102",
-        "username": settings.camera.username,
-        "password": settings.camera.password,
-        "camera_type": "exit"
-    },
-    {
-        "device_ip": "192.168.88.103",
-        "username": settings.camera.username,
-        "password": settings.camera.password,
-        "camera_type": "enter"
-    },
-    {
-        "device_ip": "192.168.88.104",
-        "username": settings.camera.username,
-        "password": settings.camera.password,
-        "camera_type": "exit"
-    },
-    {
-        "device_ip": "192.168.88.105",
-        "username": settings.camera.username,
-        "password": settings.camera.password,
-        "camera_type": "enter"
-    },
-    {
-        "device_ip": "192.168.88.106",
-        "username": settings.camera.username,
-        "password": settings.camera.password,
-        "camera_type": "exit"
-    }
-]
+from producer import init_rabbit , close_rabbit , publish_events
+from pipeline import EventPipeline
+from spool import Spool
+from dedupe import EventDeduplicator
+from multipart import MultipartParser, Part
+from devices import load_devices
+from health import DeviceHealth, HealthRegistry, StreamState, backoff_delay
+from http_server import HttpServer, Response
+from push import PushListener
+from log_setup import setup_logging
+from snapshots import SnapshotStore
+from gaps import GapJournal, GapTracker
+from backfill import Backfiller
+
+
+logger = logging.getLogger("connection")
+
+_EVENT_TYPE_RE = re.compile(rb'"eventType"\s*:\s*"([^"]*)"')
+# The compiled pydantic-core validator, without BaseModel.__init__ on top.
+_validate_event = EnterEvent.__pydantic_validator__.validate_python
+
+
+class StreamError(Exception):
+    """The device refused or ended the alert stream."""
 
 
 class HikiVisionConnection:
-    def __init__(self, device_ip: str , username:str, password:str ,camera_type: str):
+    def __init__(self, device_ip: str , username:str, password:str ,camera_type: str, pipeline: EventPipeline, deduplicator: EventDeduplicator | None = None, health: DeviceHealth | None = None, snapshots: SnapshotStore | None = None, gaps: GapTracker | None = None, site: str | None = None, building: str | None = None):
         self.device_ip = device_ip
         self.username = username
         self.password = password
         self.url = f"http://{self.device_ip}/ISAPI/Event/notification/alertStream?format=json"
+        self.subscribe_url = f"http://{self.device_ip}/ISAPI/Event/notification/subscribeEvent?format=json"
+        self.subscribe = settings.stream.subscribe
         self.boundary = b"--MIME_boundary"
         self.camera_type = camera_type
+        self.site = site
+        self.building = building
+        self.pipeline = pipeline
+        self.deduplicator = deduplicator
+        self.health = health or DeviceHealth(device_ip)
+        self.snapshots = snapshots
+        self.gaps = gaps
+        # An event announcing a picture waits here for the image part that follows it.
+        self._held: EnterEvent | None = None
+        self._held_timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
         
 
+    def subscription(self) -> dict:
+        """SubscribeEvent body limiting the stream to the event types we handle."""
+        event_list = []
+        for event_type in settings.stream.event_types:
+            entry = {"type": event_type}
+            if event_type == "AccessControllerEvent" and settings.stream.minor_events:
+                entry["minorEvent"] = ",".join(str(code) for code in settings.stream.minor_events)
+            event_list.append(entry)
+        return {
+            "SubscribeEvent": {
+                "heartbeat": settings.stream.heartbeat,
+                "eventMode": "list",
+                "EventList": event_list,
+            }
+        }
+
+    async def open_stream(self, client: httpx.AsyncClient, auth: httpx.DigestAuth) -> httpx.Response:
+        """Open a subscribeEvent stream, or the full alertStream if the device has no subscriptions."""
+        if self.subscribe:
+            request = client.build_request("POST", self.subscribe_url, json=self.subscription())
+            response = await client.send(request, auth=auth, stream=True)
+            if not 400 <= response.status_code < 500:
+                self.health.source = "subscribeEvent"
+                return response
+            await response.aclose()
+            logger.info("%s rejected event subscription (HTTP %s), using alertStream", self.device_ip, response.status_code)
+            self.subscribe = False
+
+        self.health.source = "alertStream"
+        return await client.send(client.build_request("GET", self.url), auth=auth, stream=True)
+
     async def connection_stream(self):
-        """Connect to Hikvision device and yield each multipart 'part' as bytes."""
+        """Connect to Hikvision device and yield each multipart part.
+
+        Yielded parts are views into the parser buffer and are only valid until the
+        next iteration. Image parts are dropped unless snapshots are enabled.
+        """
         auth = httpx.DigestAuth(self.username, self.password)
+        # The read timeout doubles as stall detection: a live device sends heartbeats.
+        timeout = httpx.Timeout(settings.stream.connect_timeout, read=settings.stream.idle_timeout)
+        skip_types = () if settings.snapshots.enabled else ("image/",)
 
-        async with httpx.AsyncClient(timeout=None) as client:
-            async with client.stream("GET", self.url, auth=auth) as response:
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            self.health.transition(StreamState.CONNECTING)
+            response = await self.open_stream(client, auth)
+            try:
                 if response.status_code != 200:
-                    print(f"[ERROR] Failed to connect: {response.status_code}")
-                    return
+                    raise StreamError(f"HTTP {response.status_code}")
 
-                print(f"[INFO] Connected to {self.device_ip}. Waiting for events...")
+                self.health.transition(StreamState.STREAMING)
+                logger.info("Connected to %s (%s). Waiting for events...", self.device_ip, self.health.source)
 
-                buffer = b""
+                parser = MultipartParser(boundary=self.boundary, skip_types=skip_types)
+                skipped = 0
                 async for chunk in response.aiter_bytes():
-                    buffer += chunk
-                    while True:
-                        boundary_index = buffer.find(self.boundary)
-                        if boundary_index == -1:
-                            break
-
-                        part = buffer[:boundary_index]
-                        buffer = buffer[boundary_index + len(self.boundary):]
-                        part = part.lstrip(b"\r\n")
-
-                        if part.strip():
-                            yield part
-
-    def save_image(self, image_bytes: bytes):
-        """Save image to images/ with timestamp and update user log."""
-        os.makedirs("images", exist_ok=True)
-        filename = f"images/{datetime.now():%Y%m%d_%H%M%S_%f}.jpg"
-        with open(filename, "wb") as f:
-            f.write(image_bytes)
-
-        print(f"[📷] Image saved: {filename}")
-        return filename
-
-    async def process_part(self, part: bytes):
+                    self.health.data_received(len(chunk))
+                    for part in parser.feed(chunk):
+                        yield part
+                    if parser.skipped_parts != skipped:
+                        self.health.parts_dropped(parser.skipped_parts - skipped)
+                        skipped = parser.skipped_parts
+            finally:
+                await response.aclose()
+
+    async def hold_for_snapshot(self, event: EnterEvent):
+        await self.release_held()
+        self._held = event
+        self._held_timer = asyncio.get_running_loop().call_later(
+            settings.snapshots.hold_timeout, self._hold_expired
+        )
+
+    async def release_held(self, snapshot: str | None = None):
+        """Queue the held event, with ``snapshot`` attached if its image arrived."""
+        if self._held_timer is not None:
+            self._held_timer.cancel()
+            self._held_timer = None
+        event, self._held = self._held, None
+        if event is not None:
+            event.snapshot = snapshot
+            await self.pipeline.put(event)
+
+    def _hold_expired(self):
+        # The image never came; publish the event without it.
+        self._held_timer = None
+        task = asyncio.create_task(self.release_held())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def save_snapshot(self, part: Part):
+        if self._held is None:
+            logger.debug("Image from %s without a pending event, discarded", self.device_ip)
+            return
+        day = self._held.time.date() if self._held.time else None
+        await self.release_held(self.snapshots.save(bytes(part.body), day))
+
+    async def process_part(self, part: Part):
         """Process one part of the multipart stream."""
-        header_end = part.find(b"\r\n\r\n")
-        if header_end == -1:
+        if self.snapshots is not None and part.content_type.startswith("image/"):
+            await self.save_snapshot(part)
             return
+        if self._held is not None:
+            await self.release_held()
 
-        headers_raw = part[:header_end].decode(errors="ignore")
-        content = part[header_end + 4:]
+        if part.content_type == "application/json":
+            body = part.body
+            # Heartbeats and other event types are recognised without decoding the body.
+            match = _EVENT_TYPE_RE.search(body)
+            if match is not None and match.group(1) != b"AccessControllerEvent":
+                self.health.event_received()
+                logger.debug("Ignored %s from %s", match.group(1).decode("latin-1"), self.device_ip)
+                return
 
-        if "application/json" in headers_raw:
             try:
-                json_data = json.loads(content.decode(errors="ignore"))
+                json_data = orjson.loads(body)
+                self.health.event_received()
                 event_type = json_data.get("eventType")
-                dt = json_data.get("dateTime")
 
-                if event_type == "AccessControllerEvent":
-                    name = json_data.get("AccessControllerEvent", {}).get("employeeNoString")
+                if "SubscribeEventResponse" in json_data:
+                    logger.info("Subscribed to events on %s: %s", self.device_ip, json_data["SubscribeEventResponse"])
+
+                elif event_type == "AccessControllerEvent":
+                    access_event = json_data.get("AccessControllerEvent", {})
+                    name = access_event.get("employeeNoString")
+                    serial_no = access_event.get("serialNo")
                     person = name if name else "unknown"
-                    
+                    if self.gaps is not None:
+                        self.gaps.event_seen(serial_no, json_data.get("dateTime"))
+
                     if person == "unknown":
                         pass
+                    elif self.deduplicator and self.deduplicator.is_duplicate(self.device_ip, serial_no, person):
+                        pass
                     else:
-                        event = EnterEvent(
-                            user_id=person, 
-                            time=dt,
-                            camera_type=self.camera_type
-                            )
-                        await publish_event(event=event)
-                        print(f"[✅] Published AccessControllerEvent: {event.model_dump()}, data: {json_data}")
-
-                elif event_type == "Non-AccessControllerEvent":
-                    print(f"[ℹ️] Ignored Non-AccessControllerEvent: {json_data}")
+                        event = _validate_event({
+                            "user_id": person,
+                            "time": json_data.get("dateTime"),
+                            "camera_type": self.camera_type,
+                            "device_ip": self.device_ip,
+                            "serial_no": serial_no,
+                            "site": self.site,
+                            "building": self.building,
+                        })
+                        if self.snapshots is not None and access_event.get("picturesNumber"):
+                            await self.hold_for_snapshot(event)
+                        else:
+                            await self.pipeline.put(event)
+                        logger.debug("Queued AccessControllerEvent from %s: user %s", self.device_ip, person)
 
                 else:
-                    print(f"[WARN] Unknown event type: {event_type}, data: {json_data}")
+                    logger.warning("Unknown event type from %s: %s", self.device_ip, event_type)
 
-            except Exception as e:
-                print(f"[ERROR] Failed to parse JSON: {e}")
-                print(traceback.format_exc())
+            except Exception:
+                logger.exception("Failed to parse event from %s", self.device_ip)
 
-        # elif "image/jpeg" in headers_raw:
-        #     self.save_image(content)
         else:
-            print("[WARN] Unknown content type in part")
+            logger.warning("Unknown content type in part from %s: %s", self.device_ip, part.content_type)
 
 
     async def stream_events(self):
-        """Main loop: read parts from the stream and process them. Includes reconnection logic."""
-        while True:
-            try:
-                print(f"[INFO] Attempting to connect to {self.device_ip}...")
-                async for part in self.connection_stream():
-                    await self.process_part(part)
-            except (httpx.ConnectError, httpx.ReadError) as e:
-                print(f"[ERROR] Connection to {self.device_ip} failed: {e}")
-                print(f"[INFO] Retrying connection in 30 seconds...")
-                await asyncio.sleep(30)
-            except Exception as e:
-                print(f"[ERROR] Unhandled streaming error from {self.device_ip}: {e}")
-                print(traceback.format_exc())
-                print(f"[INFO] Retrying connection in 30 seconds...")
-                await asyncio.sleep(30)
+        """Main loop: read parts from the stream and process them.
 
+        Reconnects with jittered exponential backoff; the first connection is
+        delayed by a random share of ``startup_spread`` so devices do not all
+        connect at once.
+        """
+        await asyncio.sleep(random.uniform(0, settings.stream.startup_spread))
 
-async def main():
-    await init_rabbit()
+        try:
+            while True:
+                try:
+                    logger.info("Attempting to connect to %s...", self.device_ip)
+                    async for part in self.connection_stream():
+                        self.health.part_received()
+                        await self.process_part(part)
+                    error = "stream closed by device"
+                except httpx.ReadTimeout:
+                    error = f"no data for {settings.stream.idle_timeout} seconds"
+                    self.health.transition(StreamState.STALLED)
+                except (httpx.TransportError, StreamError) as e:
+                    error = f"{type(e).__name__}: {e}"
+                except Exception as e:
+                    logger.exception("Unhandled streaming error from %s", self.device_ip)
+                    error = f"{type(e).__name__}: {e}"
+
+                delay = backoff_delay(
+                    attempt=self.health.consecutive_failures,
+                    base=settings.stream.backoff_base,
+                    cap=settings.stream.backoff_cap,
+                )
+                self.health.retry_in = round(delay, 1)
+                self.health.transition(StreamState.BACKOFF, error=error)
+                if self.gaps is not None:
+                    self.gaps.stream_down()
+                logger.warning("Connection to %s lost (%s), retrying in %.1f seconds...", self.device_ip, error, delay)
+                await asyncio.sleep(delay)
+        finally:
+            await self.release_held()
+            if self.gaps is not None:
+                self.gaps.close()
 
-    connections = [
-        HikiVisionConnection(**cam) for cam in CAMERAS
-    ]
 
-    await asyncio.gather(*(conn.stream_events() for conn in connections))
+async def report_stats(interval: float, **sources):
+    """Periodically log the stats of every pipeline stage."""
+    while True:
+        await asyncio.sleep(interval)
+        for name, source in sources.items():
+            if source is not None:
+                logger.info("Stats %s: %s", name, source.stats())
 
-    await close_rabbit()
+
+async def run_ingestion(
+    devices: list[dict],
+    spool_directory: str,
+    device_updates: asyncio.Queue | None = None,
+    status_port: int | None = None,
+):
+    """Stream ``devices`` into RabbitMQ until cancelled.
+
+    When ``device_updates`` is given, every device list put on it replaces the
+    current one: new devices are connected, removed ones are cancelled, and
+    streams of unchanged devices keep running.
+
+    In push mode devices are not polled; the push listener accepts
+    notifications from every configured device, whichever worker it lands on.
+    """
+    pull = settings.ingest.mode in ("pull", "both")
+    # Streams start right away; until the broker is reachable events go to the spool.
+    rabbit_task = asyncio.create_task(init_rabbit(retry_interval=5))
+
+    spool = Spool(
+        directory=spool_directory,
+        segment_bytes=settings.spool.segment_bytes,
+        max_bytes=settings.spool.max_bytes,
+        fsync_every=settings.spool.fsync_every,
+        fsync_interval=settings.spool.fsync_interval,
+    )
+    pipeline = EventPipeline(
+        publish_batch=publish_events,
+        max_size=settings.pipeline.max_size,
+        batch_size=settings.pipeline.batch_size,
+        batch_timeout=settings.pipeline.batch_timeout,
+        policy=settings.pipeline.policy,
+        spool=spool,
+        replay_batch_size=settings.spool.replay_batch_size,
+        replay_interval=settings.spool.replay_interval,
+        replay_max_attempts=settings.spool.replay_max_attempts,
+    )
+    await pipeline.start()
+
+    deduplicator = None
+    if settings.dedupe.enabled:
+        deduplicator = EventDeduplicator(
+            serial_ttl=settings.dedupe.serial_ttl,
+            employee_window=settings.dedupe.employee_window,
+            max_entries=settings.dedupe.max_entries,
+        )
+
+    snapshots = None
+    retention_task = None
+    if settings.snapshots.enabled:
+        snapshots = SnapshotStore(
+            root=settings.snapshots.directory,
+            workers=settings.snapshots.workers,
+            max_pending=settings.snapshots.max_pending,
+            max_bytes=settings.snapshots.max_bytes,
+            max_age_days=settings.snapshots.max_age_days,
+        )
+        retention_task = asyncio.create_task(snapshots.run_retention(settings.snapshots.retention_interval))
+
+    journal = backfiller = backfill_task = None
+    if settings.backfill.enabled:
+        journal = GapJournal(settings.backfill.directory)
+        backfiller = Backfiller(
+            journal,
+            pipeline.put,
+            requests_per_second=settings.backfill.requests_per_second,
+            concurrency=settings.backfill.concurrency,
+            page_size=settings.backfill.page_size,
+            margin=settings.backfill.margin,
+        )
+
+    def make_connection(device: dict, health: DeviceHealth, track_gaps: bool = False) -> HikiVisionConnection:
+        gaps = None
+        # Pull streams only: a push worker sees just its share of a device's serials (SO_REUSEPORT),
+        # and the backfill only drains the journals of the devices this worker streams.
+        if journal is not None and track_gaps:
+            gaps = GapTracker(device["device_ip"], journal, serial_gaps=not settings.stream.minor_events)
+        return HikiVisionConnection(
+            **device, pipeline=pipeline, deduplicator=deduplicator, health=health, snapshots=snapshots, gaps=gaps
+        )
+
+    push_listener = None
+    if settings.ingest.mode in ("push", "both"):
+        push_listener = PushListener(
+            load_devices(),
+            make_connection,
+            host=settings.push.host,
+            port=settings.push.port,
+            path=settings.push.path,
+            skip_types=() if settings.snapshots.enabled else ("image/",),
+        )
+        await push_listener.start()
+
+    registry = HealthRegistry()
+    status_server = None
+    if status_port is not None:
+        async def health(request) -> Response:
+            devices = push_listener.registry.stats() if push_listener else {}
+            devices.update(registry.stats())
+            return Response.json(devices)
+
+        async def stats(request) -> Response:
+            return Response.json({
+                "pipeline": pipeline.stats(),
+                "dedupe": deduplicator.stats() if deduplicator else None,
+                "push": push_listener.stats() if push_listener else None,
+                "snapshots": snapshots.stats() if snapshots else None,
+                "backfill": backfiller.stats() if backfiller else None,
+            })
+
+        status_server = HttpServer(settings.status.host, status_port)
+        status_server.route("GET", "/health", health)
+        status_server.route("GET", "/stats", stats)
+        await status_server.start()
+
+    streams: dict[str, tuple[dict, asyncio.Task]] = {}
+
+    def apply_devices(new_devices: list[dict]):
+        if push_listener is not None:
+            # The listener serves every device, not just this worker's share.
+            try:
+                push_listener.set_devices(load_devices())
+            except (ValueError, OSError) as e:
+                logger.error("Could not reload devices for the push listener, keeping the current ones: %s", e)
+        if not pull:
+            return
+        wanted = {device["device_ip"]: device for device in new_devices}
+        for device_ip, (device, task) in list(streams.items()):
+            if wanted.get(device_ip) != device:
+                logger.info("Stopping stream for %s", device_ip)
+                task.cancel()
+                del streams[device_ip]
+                registry.unregister(device_ip)
+        for device_ip, device in wanted.items():
+            if device_ip not in streams:
+                conn = make_connection(device, registry.register(device_ip), track_gaps=True)
+                streams[device_ip] = (device, asyncio.create_task(conn.stream_events()))
+
+    stats_task = asyncio.create_task(
+        report_stats(
+            settings.pipeline.metrics_interval,
+            pipeline=pipeline,
+            dedupe=deduplicator,
+            push=push_listener,
+            snapshots=snapshots,
+            backfill=backfiller,
+        )
+    )
+    if backfiller is not None and pull:
+        # Gaps of this worker's streams; push devices have no stream to miss events from.
+        backfill_task = asyncio.create_task(
+            backfiller.run(lambda: [device for device, _ in streams.values()], settings.backfill.interval)
+        )
+
+    try:
+        apply_devices(devices)
+        if device_updates is None:
+            await asyncio.gather(*(task for _, task in streams.values()))
+            if push_listener is not None:
+                await asyncio.Event().wait()
+        else:
+            while True:
+                apply_devices(await device_updates.get())
+    finally:
+        for _, task in streams.values():
+            task.cancel()
+        # Let the streams hand over events still waiting for their snapshot.
+        await asyncio.gather(*(task for _, task in streams.values()), return_exceptions=True)
+        stats_task.cancel()
+        if backfill_task is not None:
+            backfill_task.cancel()
+        if retention_task is not None:
+            retention_task.cancel()
+        rabbit_task.cancel()
+        if push_listener is not None:
+            await push_listener.stop()
+        if status_server is not None:
+            await status_server.stop()
+        await pipeline.stop()
+        await close_rabbit()
+        if snapshots is not None:
+            await asyncio.to_thread(snapshots.close)
+
+
+async def main():
+    setup_logging(settings.logging.level, settings.logging.sample_burst, settings.logging.sample_interval)
+    await run_ingestion(load_devices(), settings.spool.directory, status_port=settings.status.port)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+
+class TTLCache:
+    """Bounded LRU map whose entries expire ``ttl`` seconds after they were last touched."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evicted = 0
+        self._entries: OrderedDict[Hashable, float] = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def seen(self, key: Hashable, now: float) -> bool:
+        """Record ``key`` at ``now``; return True if it was already live."""
+        self._expire(now)
+        entries = self._entries
+        hit = key in entries
+        entries[key] = now + self.ttl
+        entries.move_to_end(key)
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+            self.evicted += 1
+        return hit
+
+    def _expire(self, now: float):
+        # Entries are ordered by last touch and share one TTL, so expiry is FIFO.
+        entries = self._entries
+        while entries:
+            key, expires_at = next(iter(entries.items()))
+            if expires_at > now:
+                break
+            del entries[key]
+
+
+class EventDeduplicator:
+    """Drop repeated AccessControllerEvents before they reach the broker.
+
+    An event is a duplicate if the same device already sent its ``serialNo``
+    within ``serial_ttl`` seconds, or if the same device recognised the same
+    employee within the last ``employee_window`` seconds. The employee window
+    slides, so a person standing in front of a terminal produces one event.
+    """
+
+    def __init__(self, serial_ttl: float = 300.0, employee_window: float = 2.0, max_entries: int = 100_000):
+        self._serials = TTLCache(ttl=serial_ttl, max_entries=max_entries)
+        self._employees = TTLCache(ttl=employee_window, max_entries=max_entries)
+        self.passed = 0
+        self.suppressed_serial = 0
+        self.suppressed_employee = 0
+
+    def is_duplicate(self, device_ip: str, serial_no: int | None, employee_no: str) -> bool:
+        now = time.monotonic()
+        serial_hit = serial_no is not None and self._serials.seen((device_ip, serial_no), now)
+        employee_hit = self._employees.seen((device_ip, employee_no), now)
+
+        if serial_hit:
+            self.suppressed_serial += 1
+            return True
+        if employee_hit:
+            self.suppressed_employee += 1
+            return True
+        self.passed += 1
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "passed": self.passed,
+            "suppressed_serial": self.suppressed_serial,
+            "suppressed_employee": self.suppressed_employee,
+            "tracked_serials": len(self._serials),
+            "tracked_employees": len(self._employees),
+            "evicted": self._serials.evicted + self._employees.evicted,
+        }
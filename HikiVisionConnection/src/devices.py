@@ -0,0 +1,93 @@
+import json
+import logging
+import os
+from config import settings
+
+
+logger = logging.getLogger("devices")
+
+
+CAMERAS = [
+    
+    # {
+    #     "device_ip": "192.168.0.104",
+    #     "username": settings.camera.username,
+    #     "password": settings.camera.password,
+    #     "camera_type": "enter"
+    # }
+    {
+        "device_ip": "192.168.88.101",
+        "username": settings.camera.username,
+        "password": settings.camera.password,
+        "camera_type": "enter"
+    },
+    {
+        "device_ip": "192.168.88.102",
+        "username": settings.camera.username,
+        "password": settings.camera.password,
+        "camera_type": "exit"
+    },
+    {
+        "device_ip": "192.168.88.103",
+        "username": settings.camera.username,
+        "password": settings.camera.password,
+        "camera_type": "enter"
+    },
+    {
+        "device_ip": "192.168.88.104",
+        "username": settings.camera.username,
+        "password": settings.camera.password,
+        "camera_type": "exit"
+    },
+    {
+        "device_ip": "192.168.88.105",
+        "username": settings.camera.username,
+        "password": settings.camera.password,
+        "camera_type": "enter"
+    },
+    {
+        "device_ip": "192.168.88.106",
+        "username": settings.camera.username,
+        "password": settings.camera.password,
+        "camera_type": "exit"
+    }
+]
+
+
+def load_devices(path: str | None = None) -> list[dict]:
+    """Load the device list from the JSON devices file, or CAMERAS without one.
+
+    The file holds a list of objects with ``device_ip`` and ``camera_type``;
+    ``username``/``password`` default to the camera credentials from settings,
+    ``site``/``building`` to ``devices.site``/``devices.building``. A file that
+    cannot be parsed raises ``ValueError``; a configured file that does not
+    exist falls back to CAMERAS with a warning.
+    """
+    path = path or settings.devices.file
+    if not path or not os.path.exists(path):
+        if path:
+            logger.warning("Devices file %s not found, using the %d built-in cameras", path, len(CAMERAS))
+        else:
+            logger.info("No devices file configured, using the %d built-in cameras", len(CAMERAS))
+        return [
+            {**camera, "site": settings.devices.site, "building": settings.devices.building}
+            for camera in CAMERAS
+        ]
+
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+
+    try:
+        return [
+            {
+                "device_ip": entry["device_ip"],
+                "username": entry.get("username", settings.camera.username),
+                "password": entry.get("password", settings.camera.password),
+                "camera_type": entry["camera_type"],
+                "site": entry.get("site", settings.devices.site),
+                "building": entry.get("building", settings.devices.building),
+            }
+            for entry in entries
+        ]
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"Invalid device entry in {path}: {e!r}") from e
@@ -0,0 +1,141 @@
+"""Compact binary envelope carrying many events in one AMQP message.
+
+Layout, big-endian::
+
+    header  magic "HE", version u8, event count u16
+    event   flags u8, time us since the epoch i64, UTC offset minutes i16,
+            serial_no u64, then the strings camera_type, user_id, device_ip
+            and snapshot, each as length u8 + UTF-8 bytes
+
+Optional fields that are None have their flag bit cleared and take no string
+bytes (integers are still written, as 0). Messages are published with
+``content_type=CONTENT_TYPE``; anything else is a single JSON event.
+
+The consumer has its own copy of this module
+(HikiVisionFastApi/src/consumer/envelope.py); change both together and bump
+VERSION when the layout changes.
+"""
+import struct
+from datetime import datetime, timedelta, timezone
+
+
+CONTENT_TYPE = "application/x-hikvision-events"
+MAGIC = b"HE"
+VERSION = 1
+
+_HEADER = struct.Struct(">2sBH")
+_EVENT = struct.Struct(">BqhQ")
+
+HAS_TIME = 0x01
+HAS_SERIAL = 0x02
+HAS_USER = 0x04
+HAS_DEVICE = 0x08
+HAS_SNAPSHOT = 0x10
+NAIVE_TIME = 0x20
+
+MAX_EVENTS = 0xFFFF
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+_zones: dict[int, timezone] = {}
+
+
+class EnvelopeError(ValueError):
+    """A message is not a valid envelope of a supported version."""
+
+
+def _string(value: str) -> bytes:
+    data = value.encode()
+    if len(data) > 0xFF:
+        raise EnvelopeError(f"String field longer than 255 bytes: {value[:32]!r}...")
+    return bytes((len(data),)) + data
+
+
+def encode(events) -> bytes:
+    """Pack events (anything with the EnterEvent attributes) into one envelope."""
+    if len(events) > MAX_EVENTS:
+        raise EnvelopeError(f"At most {MAX_EVENTS} events fit in one envelope")
+    chunks = [_HEADER.pack(MAGIC, VERSION, len(events))]
+    for event in events:
+        flags = 0
+        micros = offset = 0
+        if event.time is not None:
+            flags |= HAS_TIME
+            utcoffset = event.time.utcoffset()
+            if utcoffset is None:
+                flags |= NAIVE_TIME
+                micros = (event.time.replace(tzinfo=timezone.utc) - _EPOCH) // _MICROSECOND
+            else:
+                micros = (event.time - _EPOCH) // _MICROSECOND
+                offset = utcoffset // timedelta(minutes=1)
+        serial_no = event.serial_no or 0
+        if event.serial_no is not None:
+            flags |= HAS_SERIAL
+        tail = [_string(event.camera_type)]
+        for flag, value in ((HAS_USER, event.user_id), (HAS_DEVICE, event.device_ip), (HAS_SNAPSHOT, event.snapshot)):
+            if value is not None:
+                flags |= flag
+                tail.append(_string(value))
+        try:
+            chunks.append(_EVENT.pack(flags, micros, offset, serial_no))
+        except struct.error as e:
+            # e.g. a negative or 64-bit overflowing serialNo
+            raise EnvelopeError(f"Event does not fit the envelope: {e}") from e
+        chunks.extend(tail)
+    return b"".join(chunks)
+
+
+def decode(data: bytes) -> list[dict]:
+    """Unpack an envelope into one dict per event, with the EnterEvent field names."""
+    if len(data) < _HEADER.size:
+        raise EnvelopeError("Truncated envelope header")
+    magic, version, count = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise EnvelopeError("Not an event envelope")
+    if version != VERSION:
+        raise EnvelopeError(f"Unsupported envelope version {version}")
+    events = []
+    position = _HEADER.size
+    unpack = _EVENT.unpack_from
+    try:
+        for _ in range(count):
+            flags, micros, offset, serial_no = unpack(data, position)
+            position += _EVENT.size
+            length = data[position]
+            camera_type = data[position + 1:position + 1 + length].decode()
+            position += 1 + length
+            user_id = device_ip = snapshot = None
+            if flags & HAS_USER:
+                length = data[position]
+                user_id = data[position + 1:position + 1 + length].decode()
+                position += 1 + length
+            if flags & HAS_DEVICE:
+                length = data[position]
+                device_ip = data[position + 1:position + 1 + length].decode()
+                position += 1 + length
+            if flags & HAS_SNAPSHOT:
+                length = data[position]
+                snapshot = data[position + 1:position + 1 + length].decode()
+                position += 1 + length
+            time = None
+            if flags & NAIVE_TIME:
+                time = (_EPOCH + micros * _MICROSECOND).replace(tzinfo=None)
+            elif flags & HAS_TIME:
+                zone = _zones.get(offset)
+                if zone is None:
+                    zone = _zones[offset] = timezone(timedelta(minutes=offset))
+                # Exact: microseconds since the epoch fit a double and fromtimestamp rounds to the microsecond.
+                time = datetime.fromtimestamp(micros / 1_000_000, zone)
+            events.append({
+                "user_id": user_id,
+                "time": time,
+                "camera_type": camera_type,
+                "device_ip": device_ip,
+                "serial_no": serial_no if flags & HAS_SERIAL else None,
+                "snapshot": snapshot,
+            })
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise EnvelopeError(f"Malformed envelope: {e}") from e
+    if position != len(data):
+        raise EnvelopeError("Trailing bytes after the last event")
+    return events
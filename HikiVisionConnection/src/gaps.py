@@ -0,0 +1,142 @@
+import json
+import logging
+import os
+from datetime import datetime
+
+
+logger = logging.getLogger("gaps")
+
+
+def _file_name(device_ip: str) -> str:
+    return device_ip.replace(":", "_").replace("/", "_")
+
+
+class GapJournal:
+    """Append-only per-device list of time ranges whose events may be missing.
+
+    One JSON line per gap in ``<directory>/<device>.gaps.jsonl``::
+
+        {"start": iso, "end": iso, "after_serial": int | null,
+         "before_serial": int | null, "reason": "serial" | "downtime"}
+
+    Events of the gap are those between ``start`` and ``end`` whose serialNo
+    lies strictly between the known serials. The backfill job reads the journal
+    and keeps its progress in a checkpoint next to it.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.recorded = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, device_ip: str) -> str:
+        return os.path.join(self.directory, f"{_file_name(device_ip)}.gaps.jsonl")
+
+    def checkpoint_path(self, device_ip: str) -> str:
+        return os.path.join(self.directory, f"{_file_name(device_ip)}.checkpoint.json")
+
+    def record(
+        self,
+        device_ip: str,
+        start: datetime,
+        end: datetime,
+        reason: str,
+        after_serial: int | None = None,
+        before_serial: int | None = None,
+    ):
+        gap = {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "after_serial": after_serial,
+            "before_serial": before_serial,
+            "reason": reason,
+        }
+        with open(self.path(device_ip), "a") as f:
+            f.write(json.dumps(gap) + "\n")
+        self.recorded += 1
+        logger.info("Recorded %s gap on %s: %s - %s", reason, device_ip, gap["start"], gap["end"])
+
+    def read(self, device_ip: str) -> list[dict]:
+        try:
+            with open(self.path(device_ip)) as f:
+                return [json.loads(line) for line in f if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def truncate(self, device_ip: str):
+        """Forget every gap; called once all of them were backfilled."""
+        try:
+            os.remove(self.path(device_ip))
+        except FileNotFoundError:
+            pass
+
+
+class GapTracker:
+    """Spots missing events of one device stream and writes them to the journal.
+
+    Two signals: a jump in the device's serialNo between consecutive events,
+    and the time the stream was down. A serialNo going backwards means the
+    device was reset; tracking starts over. Serial gaps are only meaningful when
+    the stream carries every AccessControllerEvent, so they are off when
+    ``serial_gaps`` is False (e.g. a subscription limited to some minor events).
+
+    An outage runs from the last event before it to the first event after the
+    reconnect, and is bounded by both their serials, so the backfill skips
+    what the stream delivered on either side. Until that first event it is
+    only held in memory; ``close`` records it without the upper bound.
+    """
+
+    def __init__(self, device_ip: str, journal: GapJournal, serial_gaps: bool = True):
+        self.device_ip = device_ip
+        self.journal = journal
+        self.serial_gaps = serial_gaps
+        self.last_serial: int | None = None
+        self.last_time: datetime | None = None
+        self.down_since: datetime | None = None
+
+    def event_seen(self, serial_no: int | None, event_time: str | None):
+        try:
+            time = datetime.fromisoformat(event_time) if event_time else None
+        except ValueError:
+            time = None
+        if serial_no is None:
+            return
+        if self.down_since is not None:
+            self._record_downtime(serial_no)
+        elif (
+            self.serial_gaps
+            and self.last_serial is not None
+            and serial_no > self.last_serial + 1
+            and self.last_time is not None
+            and time is not None
+        ):
+            self.journal.record(
+                self.device_ip, self.last_time, time, "serial",
+                after_serial=self.last_serial, before_serial=serial_no,
+            )
+        if self.last_serial is None or serial_no > self.last_serial:
+            self.last_serial = serial_no
+            self.last_time = time or self.last_time
+        elif serial_no < self.last_serial:
+            # The device was reset; start over from here.
+            self.last_serial, self.last_time = serial_no, time
+
+    def stream_down(self):
+        if self.down_since is None:
+            self.down_since = datetime.now().astimezone()
+
+    def close(self):
+        """Record an outage the stream has not delivered an event after yet."""
+        if self.down_since is not None:
+            self._record_downtime(None)
+
+    def _record_downtime(self, before_serial: int | None):
+        after_serial = self.last_serial
+        if after_serial is not None and before_serial is not None and before_serial <= after_serial:
+            # Reset during the outage: the serials before and after it are not comparable.
+            after_serial = before_serial = None
+        self.journal.record(
+            self.device_ip, self.last_time or self.down_since, datetime.now().astimezone(), "downtime",
+            after_serial=after_serial, before_serial=before_serial,
+        )
+        self.down_since = None
@@ -0,0 +1,124 @@
+import logging
+import random
+import time
+from enum import Enum
+
+
+logger = logging.getLogger("health")
+
+
+class StreamState(str, Enum):
+    CONNECTING = "connecting"
+    STREAMING = "streaming"
+    STALLED = "stalled"
+    BACKOFF = "backoff"
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter, so devices do not reconnect in lockstep."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class DeviceHealth:
+    """Connection state of one device stream and when it last produced data.
+
+    Byte and part rates are averaged over ``rate_window`` seconds and refreshed
+    once per window, so they show what the device actually sends us.
+    """
+
+    def __init__(self, device_ip: str, rate_window: float = 60.0):
+        self.device_ip = device_ip
+        self.rate_window = rate_window
+        self.state = StreamState.CONNECTING
+        self.state_since = time.monotonic()
+        self.last_part_at: float | None = None
+        self.last_event_at: float | None = None
+        self.connects = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.last_error: str | None = None
+        self.retry_in: float | None = None
+        self.source: str | None = None
+        self.bytes_received = 0
+        self.parts_received = 0
+        self.parts_skipped = 0
+        self.bytes_per_sec: float | None = None
+        self.parts_per_sec: float | None = None
+        self._rate_mark = (self.state_since, 0, 0)
+
+    def transition(self, state: StreamState, error: str | None = None):
+        if state != self.state:
+            if error:
+                logger.warning("%s: %s -> %s (%s)", self.device_ip, self.state.value, state.value, error)
+            else:
+                logger.info("%s: %s -> %s", self.device_ip, self.state.value, state.value)
+            self.state = state
+            self.state_since = time.monotonic()
+        if state == StreamState.STREAMING:
+            self.connects += 1
+            self.consecutive_failures = 0
+            self.retry_in = None
+        if error is not None:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = error
+
+    def data_received(self, nbytes: int):
+        self.bytes_received += nbytes
+        self._roll(time.monotonic())
+
+    def part_received(self):
+        self.last_part_at = time.monotonic()
+        self.parts_received += 1
+
+    def parts_dropped(self, count: int):
+        """Parts that arrived but were discarded unparsed (e.g. images)."""
+        self.parts_received += count
+        self.parts_skipped += count
+
+    def _roll(self, now: float):
+        since, bytes_mark, parts_mark = self._rate_mark
+        elapsed = now - since
+        if elapsed >= self.rate_window:
+            self.bytes_per_sec = (self.bytes_received - bytes_mark) / elapsed
+            self.parts_per_sec = (self.parts_received - parts_mark) / elapsed
+            self._rate_mark = (now, self.bytes_received, self.parts_received)
+
+    def event_received(self):
+        self.last_event_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        self._roll(now)
+        return {
+            "state": self.state.value,
+            "source": self.source,
+            "seconds_in_state": round(now - self.state_since, 1),
+            "seconds_since_last_part": round(now - self.last_part_at, 1) if self.last_part_at else None,
+            "seconds_since_last_event": round(now - self.last_event_at, 1) if self.last_event_at else None,
+            "connects": self.connects,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+            "retry_in": self.retry_in,
+            "bytes_received": self.bytes_received,
+            "parts_received": self.parts_received,
+            "parts_skipped": self.parts_skipped,
+            "bytes_per_sec": round(self.bytes_per_sec, 1) if self.bytes_per_sec is not None else None,
+            "parts_per_sec": round(self.parts_per_sec, 2) if self.parts_per_sec is not None else None,
+        }
+
+
+class HealthRegistry:
+    def __init__(self):
+        self.devices: dict[str, DeviceHealth] = {}
+
+    def register(self, device_ip: str) -> DeviceHealth:
+        health = self.devices[device_ip] = DeviceHealth(device_ip)
+        return health
+
+    def unregister(self, device_ip: str):
+        self.devices.pop(device_ip, None)
+
+    def stats(self) -> dict:
+        return {device_ip: health.snapshot() for device_ip, health in self.devices.items()}
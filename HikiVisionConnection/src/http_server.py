@@ -0,0 +1,157 @@
+import asyncio
+import json
+import logging
+from typing import Awaitable, Callable
+from urllib.parse import parse_qs, urlsplit
+
+
+logger = logging.getLogger("http_server")
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class Request:
+    __slots__ = ("method", "path", "query", "headers", "body", "client_ip")
+
+    def __init__(self, method: str, path: str, query: dict, headers: dict[str, str], body: bytes, client_ip: str):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.client_ip = client_ip
+
+
+class Response:
+    __slots__ = ("status", "body", "content_type")
+
+    def __init__(self, status: int = 200, body: bytes = b"", content_type: str = "text/plain"):
+        self.status = status
+        self.body = body
+        self.content_type = content_type
+
+    @classmethod
+    def json(cls, data, status: int = 200) -> "Response":
+        return cls(status=status, body=json.dumps(data, default=str).encode(), content_type="application/json")
+
+
+Handler = Callable[[Request], Awaitable[Response]]
+
+
+class HttpServer:
+    """Minimal asyncio HTTP/1.1 server for the status API and device push notifications.
+
+    Supports keep-alive and ``Content-Length`` bodies, which is all the devices
+    and monitoring probes send; chunked request bodies are rejected with 411.
+    """
+
+    def __init__(self, host: str, port: int, max_body: int = 10 * 1024 * 1024, reuse_port: bool = False):
+        self.host = host
+        self.port = port
+        self.max_body = max_body
+        self.reuse_port = reuse_port
+        self.routes: dict[tuple[str, str], Handler] = {}
+        self._server: asyncio.AbstractServer | None = None
+
+    def route(self, method: str, path: str, handler: Handler):
+        self.routes[(method.upper(), path)] = handler
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port, reuse_port=self.reuse_port or None
+        )
+        logger.info("Listening on %s:%s", self.host, self.port)
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername")
+        client_ip = peer[0] if peer else ""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ", 2)
+                except ValueError:
+                    await self._write(writer, Response(400), keep_alive=False)
+                    return
+
+                headers = {}
+                for line in header_lines:
+                    if ":" in line:
+                        name, value = line.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+
+                if "chunked" in headers.get("transfer-encoding", "").lower():
+                    await self._write(writer, Response(411), keep_alive=False)
+                    return
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._write(writer, Response(400, b"invalid Content-Length"), keep_alive=False)
+                    return
+                if length > self.max_body:
+                    await self._write(writer, Response(413), keep_alive=False)
+                    return
+                body = await reader.readexactly(length) if length else b""
+
+                url = urlsplit(target)
+                request = Request(
+                    method=method.upper(),
+                    path=url.path,
+                    query=parse_qs(url.query),
+                    headers=headers,
+                    body=body,
+                    client_ip=client_ip,
+                )
+                response = await self._dispatch(request)
+
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._write(writer, response, keep_alive)
+                if not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            known_path = any(path == request.path for _, path in self.routes)
+            return Response(405 if known_path else 404)
+        try:
+            return await handler(request)
+        except Exception:
+            logger.exception("Error handling %s %s", request.method, request.path)
+            return Response(500)
+
+    async def _write(self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool):
+        head = (
+            f"HTTP/1.1 {response.status} {REASONS.get(response.status, '')}\r\n"
+            f"Content-Type: {response.content_type}\r\n"
+            f"Content-Length: {len(response.body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + response.body)
+        await writer.drain()
@@ -0,0 +1,197 @@
+import re
+from typing import Iterator
+
+
+_CONTENT_TYPE_RE = re.compile(rb"content-type[ \t]*:[ \t]*([^\r\n;]+)", re.IGNORECASE)
+_CONTENT_LENGTH_RE = re.compile(rb"content-length[ \t]*:[ \t]*(\d+)", re.IGNORECASE)
+
+HEADER_END = b"\r\n\r\n"
+CRLF = b"\r\n"
+
+# Parser states
+_BOUNDARY = 0
+_HEADERS = 1
+_BODY = 2
+_SKIP = 3
+
+
+class Part:
+    """One part of the multipart stream.
+
+    ``headers`` and ``body`` are memoryviews into the parser buffer. They are only
+    valid until the parser is resumed; copy them (``bytes(part.body)``) to keep them.
+    """
+
+    __slots__ = ("headers", "body", "content_type", "content_length")
+
+    def __init__(self, headers: memoryview, body: memoryview, content_type: str, content_length: int | None):
+        self.headers = headers
+        self.body = body
+        self.content_type = content_type
+        self.content_length = content_length
+
+    def release(self):
+        self.headers.release()
+        self.body.release()
+
+
+class MultipartParser:
+    """Incremental multipart parser for the Hikvision alertStream.
+
+    Chunks are appended to a single bytearray and parts are handed out as views,
+    so bytes are never re-copied while a part is still arriving. When a part has a
+    ``Content-Length`` header the body is sliced directly; otherwise the parser
+    falls back to scanning for the next boundary, resuming where the last scan stopped.
+
+    Parts whose content type starts with one of ``skip_types`` (e.g. ``"image/"``)
+    are not yielded. When they carry a ``Content-Length`` their bytes are discarded
+    as they arrive instead of being buffered until the part is complete.
+    """
+
+    compact_threshold = 64 * 1024
+
+    def __init__(
+        self,
+        boundary: bytes = b"--MIME_boundary",
+        max_part_size: int = 16 * 1024 * 1024,
+        skip_types: tuple[str, ...] = (),
+    ):
+        self.boundary = boundary
+        self.max_part_size = max_part_size
+        self.skip_types = skip_types
+        self.skipped_parts = 0
+        self.skipped_bytes = 0
+        self._skip_remaining = 0
+        self._buf = bytearray()
+        self._pos = 0
+        self._scan = 0
+        self._state = _BOUNDARY
+        self._header_start = 0
+        self._body_start = 0
+        self._content_type = ""
+        self._content_length: int | None = None
+
+    def feed(self, chunk: bytes) -> Iterator[Part]:
+        """Append ``chunk`` and yield every part completed by it."""
+        self._compact()
+        self._buf += chunk
+
+        while True:
+            part = self._next_part()
+            if part is None:
+                break
+            try:
+                yield part
+            finally:
+                part.release()
+
+        if len(self._buf) - self._pos > self.max_part_size:
+            # Garbage or a runaway part: drop it and resync on the next boundary.
+            self._pos = self._scan = len(self._buf)
+            self._state = _BOUNDARY
+
+    def _compact(self):
+        # Only move the tail once enough consumed bytes have piled up in front of it.
+        pos = self._pos
+        if not pos or (pos < self.compact_threshold and pos < len(self._buf)):
+            return
+        del self._buf[:pos]
+        self._pos = 0
+        self._scan = max(self._scan - pos, 0)
+        self._header_start -= pos
+        self._body_start -= pos
+
+    def _find_boundary(self, start: int) -> int:
+        buf = self._buf
+        index = buf.find(self.boundary, max(self._scan, start))
+        if index == -1:
+            self._scan = max(start, len(buf) - len(self.boundary) + 1)
+        return index
+
+    def _next_part(self) -> Part | None:
+        buf = self._buf
+
+        while True:
+            if self._state == _BOUNDARY:
+                index = self._find_boundary(self._pos)
+                if index == -1:
+                    return None
+                self._pos = self._scan = index + len(self.boundary)
+                self._state = _HEADERS
+
+            elif self._state == _HEADERS:
+                pos = self._pos
+                end = len(buf)
+                while pos < end and buf[pos] in b"\r\n":
+                    pos += 1
+                self._pos = pos
+
+                header_end = buf.find(HEADER_END, pos)
+                if header_end == -1:
+                    return None
+
+                boundary_index = buf.find(self.boundary, pos, header_end)
+                if boundary_index != -1:
+                    # Part without a header block; skip it like the old parser did.
+                    self._pos = self._scan = boundary_index
+                    self._state = _BOUNDARY
+                    continue
+
+                content_type = _CONTENT_TYPE_RE.search(buf, pos, header_end)
+                content_length = _CONTENT_LENGTH_RE.search(buf, pos, header_end)
+                self._content_type = content_type.group(1).decode("latin-1").strip().lower() if content_type else ""
+                self._content_length = int(content_length.group(1)) if content_length else None
+                self._header_start = pos
+                self._body_start = self._scan = header_end + len(HEADER_END)
+                self._state = _BODY
+                if self._content_length is not None and self._skipped(self._content_type):
+                    self._pos = self._body_start
+                    self._skip_remaining = self._content_length
+                    self._state = _SKIP
+
+            elif self._state == _SKIP:
+                take = min(len(buf) - self._pos, self._skip_remaining)
+                self._pos = self._scan = self._pos + take
+                self._skip_remaining -= take
+                self.skipped_bytes += take
+                if self._skip_remaining:
+                    return None
+                self.skipped_parts += 1
+                self._state = _BOUNDARY
+
+            else:
+                body_start = self._body_start
+
+                if self._content_length is not None:
+                    body_end = body_start + self._content_length
+                    if len(buf) < body_end:
+                        return None
+                    self._pos = self._scan = body_end
+                    self._state = _BOUNDARY
+                else:
+                    index = self._find_boundary(body_start)
+                    if index == -1:
+                        return None
+                    body_end = index
+                    if buf.endswith(CRLF, body_start, body_end):
+                        body_end -= len(CRLF)
+                    self._pos = self._scan = index + len(self.boundary)
+                    self._state = _HEADERS
+
+                if self._skipped(self._content_type):
+                    self.skipped_parts += 1
+                    self.skipped_bytes += body_end - body_start
+                    continue
+
+                view = memoryview(buf)
+                part = Part(
+                    headers=view[self._header_start:body_start - len(HEADER_END)],
+                    body=view[body_start:body_end],
+                    content_type=self._content_type,
+                    content_length=self._content_length,
+                )
+                view.release()
+                return part
+
+    def _skipped(self, content_type: str) -> bool:
+        return bool(self.skip_types) and content_type.startswith(self.skip_types)
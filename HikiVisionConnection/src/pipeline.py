@@ -0,0 +1,287 @@
+import asyncio
+import logging
+from enum import Enum
+from typing import Awaitable, Callable
+
+from schemas import EnterEvent
+from spool import Spool, SpoolCursor
+
+
+logger = logging.getLogger("pipeline")
+
+
+class BackpressurePolicy(str, Enum):
+    BLOCK = "block"
+    DROP_OLDEST = "drop_oldest"
+    SPILL = "spill"
+
+
+class PipelineMetrics:
+    def __init__(self):
+        self.enqueued = 0
+        self.published = 0
+        self.failed = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.batches = 0
+        self.max_depth = 0
+
+    def snapshot(self, depth: int) -> dict:
+        return {
+            "depth": depth,
+            "max_depth": self.max_depth,
+            "enqueued": self.enqueued,
+            "published": self.published,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "batches": self.batches,
+        }
+
+
+class EventPipeline:
+    """Bounded queue between the camera readers and the RabbitMQ publisher.
+
+    Readers call ``put`` and return to the socket immediately; a single publisher
+    task drains the queue in batches and hands them to ``publish_batch``, which
+    returns one delivery future per event. Batches are settled in the background,
+    so the next batch is published while earlier confirms are outstanding.
+
+    When the queue is full the configured backpressure policy decides whether
+    readers wait, the oldest event is dropped, or the event is spilled to the
+    spool. Events the broker fails to confirm always go to the spool, which is
+    replayed in order, in bulk, once publishing works again.
+    """
+
+    def __init__(
+        self,
+        publish_batch: Callable[[list[EnterEvent]], Awaitable[list[asyncio.Future]]],
+        max_size: int = 10000,
+        batch_size: int = 100,
+        batch_timeout: float = 0.05,
+        policy: BackpressurePolicy | str = BackpressurePolicy.BLOCK,
+        spool: Spool | None = None,
+        replay_batch_size: int = 1000,
+        replay_interval: float = 5.0,
+        replay_max_attempts: int = 5,
+    ):
+        self.publish_batch = publish_batch
+        self.queue: asyncio.Queue[EnterEvent] = asyncio.Queue(maxsize=max_size)
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.policy = BackpressurePolicy(policy)
+        if self.policy == BackpressurePolicy.SPILL and spool is None:
+            raise ValueError("The spill backpressure policy needs a spool")
+        self.spool = spool
+        self.replay_batch_size = replay_batch_size
+        self.replay_interval = replay_interval
+        self.replay_max_attempts = replay_max_attempts
+        self._replay_failures = 0
+        self.metrics = PipelineMetrics()
+        self._tasks: list[asyncio.Task] = []
+        self._settling: set[asyncio.Task] = set()
+
+    async def put(self, event: EnterEvent):
+        """Hand an event to the publisher according to the backpressure policy."""
+        if self.policy == BackpressurePolicy.BLOCK:
+            await self.queue.put(event)
+        elif self.policy == BackpressurePolicy.DROP_OLDEST:
+            while self.queue.full():
+                self.queue.get_nowait()
+                self.queue.task_done()
+                self.metrics.dropped += 1
+            self.queue.put_nowait(event)
+        elif self.queue.full():
+            await self._spill([event])
+            return
+        else:
+            self.queue.put_nowait(event)
+
+        self.metrics.enqueued += 1
+        self.metrics.max_depth = max(self.metrics.max_depth, self.queue.qsize())
+
+    async def start(self):
+        self._tasks = [asyncio.create_task(self._run())]
+        if self.spool is not None:
+            self._tasks.append(asyncio.create_task(self._replay_loop()))
+
+    async def stop(self):
+        """Publish whatever is still queued, then stop the background tasks."""
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.spool is not None:
+            await asyncio.to_thread(self.spool.close)
+
+    def stats(self) -> dict:
+        stats = self.metrics.snapshot(depth=self.queue.qsize())
+        if self.spool is not None:
+            stats["spool"] = self.spool.stats()
+        return stats
+
+    async def _next_batch(self) -> list[EnterEvent]:
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_timeout
+
+        while len(batch) < self.batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                futures = await self.publish_batch(batch)
+            except Exception as e:
+                await self._settle(batch, [e] * len(batch))
+            else:
+                task = asyncio.create_task(self._settle_when_done(batch, futures))
+                self._settling.add(task)
+                task.add_done_callback(self._settling.discard)
+
+    async def _settle_when_done(self, batch: list[EnterEvent], futures: list[asyncio.Future]):
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        await self._settle(batch, results)
+
+    async def _settle(self, batch: list[EnterEvent], results: list):
+        """Count confirmed events and spill or count the failed ones."""
+        failed = [event for event, result in zip(batch, results) if isinstance(result, BaseException)]
+        self.metrics.published += len(batch) - len(failed)
+        self.metrics.batches += 1
+        try:
+            if failed:
+                error = next(result for result in results if isinstance(result, BaseException))
+                logger.warning("%d of %d events were not confirmed: %r", len(failed), len(batch), error)
+                if self.spool is not None:
+                    await self._spill(failed)
+                else:
+                    self.metrics.failed += len(failed)
+        finally:
+            for _ in batch:
+                self.queue.task_done()
+
+    async def _spill(self, events: list[EnterEvent]):
+        payloads = [event.model_dump_json().encode() for event in events]
+        try:
+            await asyncio.to_thread(self.spool.append, payloads)
+        except OSError as e:
+            logger.error("Failed to spool %d events: %s", len(events), e)
+            self.metrics.failed += len(events)
+            return
+        self.metrics.spilled += len(events)
+
+    async def _replay_loop(self):
+        while True:
+            try:
+                await self._replay_spool()
+            except Exception:
+                logger.exception("Spool replay error")
+            await asyncio.sleep(self.replay_interval)
+
+    async def drain_spool(self) -> bool:
+        """Replay the whole spool now, as the replay loop would; False if the broker kept failing.
+
+        For the spool command, outside the service.
+        """
+        for attempt in range(self.replay_max_attempts + 1):
+            if attempt:
+                await asyncio.sleep(self.replay_interval)
+            await self._replay_spool()
+            if not self._replay_failures:
+                return True
+        return False
+
+    async def _replay_spool(self):
+        """Publish spooled events in order, committing the cursor after each confirmed batch.
+
+        When a batch fails partway the cursor is committed past the records
+        confirmed before the first failure, so they are not published again.
+        Delivery stays at-least-once: records confirmed after a failed one, and
+        a batch that was confirmed but whose commit was lost to a crash, are
+        published again. With its raw event store on (``raw_events``), the
+        consumer applies only events its access_events dedupe key has not seen,
+        so a repeat changes no log; without it a repeat is applied again, and
+        a repeated enter after the day's log was closed opens a second one.
+
+        A batch that failed ``replay_max_attempts`` passes in a row is retried one
+        record at a time, and records that can never be published (invalid JSON,
+        an event the encoder rejects) are quarantined, so one bad record does not
+        hold back everything spooled after it.
+        """
+        while True:
+            positions: list[SpoolCursor] = []
+            records, cursor = await asyncio.to_thread(self.spool.read, self.replay_batch_size, positions)
+            if not records:
+                self._replay_failures = 0
+                return
+
+            if self._replay_failures >= self.replay_max_attempts:
+                if not await self._replay_records(records, positions):
+                    return
+            else:
+                error, confirmed = await self._publish_records(records)
+                if error is not None:
+                    if confirmed:
+                        await asyncio.to_thread(self.spool.commit, positions[confirmed - 1])
+                    # The rest of the batch is retried on the next pass.
+                    self._replay_failures += 1
+                    logger.warning(
+                        "Spool replay of %d events failed after %d (attempt %d), retrying later: %r",
+                        len(records), confirmed, self._replay_failures, error,
+                    )
+                    return
+
+            self._replay_failures = 0
+            await asyncio.to_thread(self.spool.commit, cursor)
+
+    async def _publish_records(self, records: list[bytes]) -> tuple[BaseException | None, int]:
+        """Publish spooled records; returns the first error, or None once all are confirmed.
+
+        Also returns how many records were confirmed before the first failure.
+        """
+        try:
+            events = [EnterEvent.model_validate_json(payload) for payload in records]
+            results = await asyncio.gather(*await self.publish_batch(events), return_exceptions=True)
+        except Exception as e:
+            results = [e]
+        confirmed = next(
+            (index for index, result in enumerate(results) if isinstance(result, BaseException)), len(results)
+        )
+        if confirmed < len(results):
+            self.metrics.published += confirmed
+            self.metrics.replayed += confirmed
+            return results[confirmed], confirmed
+        self.metrics.published += len(events)
+        self.metrics.replayed += len(events)
+        self.metrics.batches += 1
+        return None, confirmed
+
+    async def _replay_records(self, records: list[bytes], positions: list[SpoolCursor]) -> bool:
+        """Publish one record at a time; False if the broker failed and the rest waits for the next pass."""
+        for index, payload in enumerate(records):
+            error, _ = await self._publish_records([payload])
+            if error is None:
+                continue
+            if not isinstance(error, ValueError):
+                # Not the record's fault (broker down, unroutable, timeout): keep it spooled.
+                logger.warning("Spool replay failed, retrying later: %r", error)
+                if index:
+                    await asyncio.to_thread(self.spool.commit, positions[index - 1])
+                return False
+            logger.error("Quarantined a spooled record that cannot be published: %r", error)
+            await asyncio.to_thread(self.spool.quarantine, payload, repr(error))
+        return True
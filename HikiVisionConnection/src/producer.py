@@ -1,38 +1,268 @@
+import asyncio
+import logging
+import zlib
+from typing import Callable
 import aio_pika
+from pamqp.commands import Basic
+import envelope
 from schemas import EnterEvent
 from config import settings
 
-# Global connection & channel
+logger = logging.getLogger("producer")
+
+# Global connection, channel & publisher
 _connection: aio_pika.RobustConnection | None = None
 _channel: aio_pika.Channel | None = None
+_publisher: "BatchPublisher | None" = None
 
-async def init_rabbit():
-    """Initialize RabbitMQ connection and channel once."""
-    global _connection, _channel
-    _connection = await aio_pika.connect_robust(settings.rabbit.url)
-    _channel = await _connection.channel()
-    await _channel.declare_queue(name=settings.rabbit.url, durable=True)
-    print("[RabbitMQ] Connection and channel initialized.")
-
-async def publish_event(event: EnterEvent):
-    """Publish a Pydantic event to RabbitMQ."""
-    if _channel is None:
-        raise RuntimeError("RabbitMQ channel not initialized. Call init_rabbit() first.")
 
-    message = aio_pika.Message(
-        body=event.model_dump_json().encode(),
-        delivery_mode=aio_pika.DeliveryMode.PERSISTENT
-    )
+class DeliveryError(Exception):
+    """The broker did not confirm a published event."""
+
+
+def _word(value: str) -> str:
+    return value.replace(".", "_") or "_"
+
+
+def topic_routing_key(partitions: int = 0) -> Callable[[EnterEvent], str]:
+    """Routing keys ``site.building.camera_type``, plus ``.N`` with N = crc32(user_id) % partitions.
+
+    Consumers bind e.g. ``#`` (everything), ``campus_a.#`` (one site) or
+    ``*.*.*.3`` (one hash partition: every event of a user lands in the same
+    queue, as the consumer's per-user ordering needs).
+    """
+    def routing_key(event: EnterEvent) -> str:
+        key = ".".join((
+            _word(event.site or settings.devices.site),
+            _word(event.building or settings.devices.building),
+            _word(event.camera_type),
+        ))
+        if partitions:
+            key = f"{key}.{zlib.crc32((event.user_id or '').encode()) % partitions}"
+        return key
+
+    return routing_key
+
+
+class BatchPublisher:
+    """Publish events in size/time-bounded batches with publisher confirms.
+
+    Every event gets a future that resolves once the broker has acked it. Publishes
+    of a batch are pipelined: up to ``max_outstanding`` messages may be waiting for
+    their confirm at once, and callers queueing beyond that wait for a free slot.
+
+    With ``encoding="envelope"`` up to ``events_per_message`` events share one
+    message in the binary ``envelope`` format and one confirm; ``"json"`` sends
+    one JSON event per message, for consumers that predate the envelope.
+
+    ``routing_key`` is a fixed key or a function of the event; only events with
+    the same key share a message. Messages go to ``exchange``, or to the default
+    exchange (straight to the queue named by the key) without one.
+    """
+
+    def __init__(
+        self,
+        channel: aio_pika.Channel,
+        routing_key: str | Callable[[EnterEvent], str],
+        batch_size: int = 100,
+        batch_window: float = 0.02,
+        max_outstanding: int = 1000,
+        confirm_timeout: float = 10.0,
+        encoding: str = "envelope",
+        events_per_message: int = 100,
+        exchange: aio_pika.abc.AbstractExchange | None = None,
+    ):
+        self.channel = channel
+        self.routing_key = routing_key
+        self.exchange = exchange
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.confirm_timeout = confirm_timeout
+        self.encoding = encoding
+        self.events_per_message = min(events_per_message, envelope.MAX_EVENTS)
+        self._outstanding = asyncio.Semaphore(max_outstanding)
+        self._pending: list[tuple[EnterEvent, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._flush_lock = asyncio.Lock()
+
+    def publish(self, event: EnterEvent) -> asyncio.Future:
+        """Queue one event and return its delivery future."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((event, future))
+        if len(self._pending) == self.batch_size:
+            self._schedule_flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.batch_window, self._schedule_flush)
+        return future
 
-    await _channel.default_exchange.publish(
-        message=message,
-        routing_key=settings.rabbit.queue_name
+    def publish_many(self, events: list[EnterEvent]) -> list[asyncio.Future]:
+        return [self.publish(event) for event in events]
+
+    async def flush(self):
+        """Start publishing everything queued so far."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        async with self._flush_lock:
+            batch, self._pending = self._pending, []
+            if callable(self.routing_key):
+                by_key: dict[str, list[tuple[EnterEvent, asyncio.Future]]] = {}
+                for item in batch:
+                    by_key.setdefault(self.routing_key(item[0]), []).append(item)
+            else:
+                by_key = {self.routing_key: batch} if batch else {}
+            size = 1 if self.encoding == "json" else self.events_per_message
+            groups = [
+                (routing_key, items[start:start + size])
+                for routing_key, items in by_key.items()
+                for start in range(0, len(items), size)
+            ]
+            for routing_key, group in groups:
+                for message, events in self._messages(group):
+                    await self._outstanding.acquire()
+                    task = asyncio.create_task(self._publish_message(routing_key, message, events))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        """Flush and wait for every outstanding confirm."""
+        await self.flush()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _schedule_flush(self):
+        task = asyncio.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _messages(
+        self, group: list[tuple[EnterEvent, asyncio.Future]]
+    ) -> list[tuple[aio_pika.Message, list[tuple[EnterEvent, asyncio.Future]]]]:
+        """The messages carrying a group: one envelope, plus one JSON message per event it cannot carry.
+
+        An event the envelope rejects (a string over 255 bytes, a negative
+        serialNo) must not fail the rest of its group, nor the spool replay later.
+        """
+        if self.encoding == "json":
+            return [(self._json_message(item[0]), [item]) for item in group]
+        try:
+            return [(self._envelope_message([event for event, _ in group]), group)]
+        except envelope.EnvelopeError:
+            pass
+        packable, messages = [], []
+        for item in group:
+            try:
+                envelope.encode([item[0]])
+            except envelope.EnvelopeError as e:
+                logger.warning("Event %s from %s sent as JSON: %s", item[0].serial_no, item[0].device_ip, e)
+                messages.append((self._json_message(item[0]), [item]))
+            else:
+                packable.append(item)
+        if packable:
+            messages.insert(0, (self._envelope_message([event for event, _ in packable]), packable))
+        return messages
+
+    def _envelope_message(self, events: list[EnterEvent]) -> aio_pika.Message:
+        return aio_pika.Message(
+            body=envelope.encode(events),
+            content_type=envelope.CONTENT_TYPE,
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+        )
+
+    def _json_message(self, event: EnterEvent) -> aio_pika.Message:
+        return aio_pika.Message(
+            body=event.model_dump_json().encode(),
+            content_type="application/json",
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+        )
+
+    async def _publish_message(
+        self, routing_key: str, message: aio_pika.Message, group: list[tuple[EnterEvent, asyncio.Future]]
+    ):
+        try:
+            exchange = self.exchange or self.channel.default_exchange
+            # mandatory: a message no queue is bound for comes back (raising, see init_rabbit)
+            # instead of being acked and dropped, so its events stay in the spool.
+            confirmation = await exchange.publish(
+                message=message,
+                routing_key=routing_key,
+                mandatory=True,
+                timeout=self.confirm_timeout,
+            )
+            if not isinstance(confirmation, Basic.Ack):
+                raise DeliveryError(f"Broker did not ack events: {confirmation}")
+            for _, future in group:
+                if not future.done():
+                    future.set_result(None)
+        except Exception as e:
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._outstanding.release()
+
+
+async def init_rabbit(retry_interval: float | None = None):
+    """Initialize RabbitMQ connection, confirming channel and publisher once.
+
+    With ``retry_interval`` the initial connection is retried until the broker is
+    reachable instead of raising.
+    """
+    global _connection, _channel, _publisher
+    while True:
+        try:
+            _connection = await aio_pika.connect_robust(settings.rabbit.url)
+            break
+        except (ConnectionError, OSError, aio_pika.exceptions.AMQPError) as e:
+            if retry_interval is None:
+                raise
+            logger.warning("Broker unavailable (%s), retrying in %s seconds...", e, retry_interval)
+            await asyncio.sleep(retry_interval)
+    _channel = await _connection.channel(publisher_confirms=True, on_return_raises=True)
+    exchange = None
+    routing_key: str | Callable[[EnterEvent], str] = settings.rabbit.queue_name
+    if settings.rabbit.exchange:
+        exchange = await _channel.declare_exchange(
+            settings.rabbit.exchange, aio_pika.ExchangeType.TOPIC, durable=True
+        )
+        routing_key = topic_routing_key(settings.rabbit.partitions)
+    if exchange is None or settings.rabbit.bind_queue:
+        queue = await _channel.declare_queue(name=settings.rabbit.queue_name, durable=True)
+        if exchange is not None:
+            await queue.bind(exchange, routing_key="#")
+    _publisher = BatchPublisher(
+        channel=_channel,
+        routing_key=routing_key,
+        exchange=exchange,
+        batch_size=settings.rabbit.batch_size,
+        batch_window=settings.rabbit.batch_window,
+        max_outstanding=settings.rabbit.max_outstanding_confirms,
+        confirm_timeout=settings.rabbit.confirm_timeout,
+        encoding=settings.rabbit.encoding,
+        events_per_message=settings.rabbit.events_per_message,
     )
+    logger.info("RabbitMQ connection and channel initialized.")
 
-    print(f"[Publisher] Sent event: {event}")
+def publish_event(event: EnterEvent) -> asyncio.Future:
+    """Publish a Pydantic event to RabbitMQ; the future resolves on broker confirm."""
+    if _publisher is None:
+        raise RuntimeError("RabbitMQ channel not initialized. Call init_rabbit() first.")
+    return _publisher.publish(event)
+
+async def publish_events(events: list[EnterEvent]) -> list[asyncio.Future]:
+    """Publish a batch of events drained from the pipeline."""
+    if _publisher is None:
+        raise RuntimeError("RabbitMQ channel not initialized. Call init_rabbit() first.")
+    futures = _publisher.publish_many(events)
+    await _publisher.flush()
+    return futures
 
 async def close_rabbit():
-    """Close RabbitMQ connection."""
+    """Wait for outstanding confirms and close RabbitMQ connection."""
+    if _publisher:
+        await _publisher.close()
     if _connection:
         await _connection.close()
-        print("[RabbitMQ] Connection closed.")
+        logger.info("RabbitMQ connection closed.")
@@ -0,0 +1,115 @@
+import logging
+import re
+from typing import Callable
+
+from health import DeviceHealth, HealthRegistry, StreamState
+from http_server import HttpServer, Request, Response
+from multipart import MultipartParser, Part
+
+
+logger = logging.getLogger("push")
+
+_BOUNDARY_RE = re.compile(r'boundary="?([^";]+)"?', re.IGNORECASE)
+
+
+class PushListener:
+    """Receive events that devices push through ISAPI HTTP host notification.
+
+    Devices are configured to POST their alarms to ``path`` on this listener.
+    Each request is mapped to a configured device by its source IP and handed
+    to that device's connection object (built by ``make_connection``), so
+    pushed events go through the same ``process_part``, dedupe stage and
+    publishing pipeline as the pull streams. Parts whose content type starts
+    with one of ``skip_types`` are dropped, as on the streams. The port is
+    opened with SO_REUSEPORT so every supervisor worker can accept notifications.
+    """
+
+    def __init__(
+        self,
+        devices: list[dict],
+        make_connection: Callable[[dict, DeviceHealth], object],
+        host: str,
+        port: int,
+        path: str,
+        skip_types: tuple[str, ...] = (),
+    ):
+        self.make_connection = make_connection
+        self.skip_types = skip_types
+        self.registry = HealthRegistry()
+        self.path = path
+        self.server = HttpServer(host, port, reuse_port=True)
+        self.server.route("POST", path, self.handle)
+        self.requests = 0
+        self.parts = 0
+        self.unknown_devices = 0
+        self._connections: dict = {}
+        self.set_devices(devices)
+
+    def set_devices(self, devices: list[dict]):
+        wanted = {device["device_ip"].split(":")[0]: device for device in devices}
+        for ip in list(self._connections):
+            if ip not in wanted:
+                del self._connections[ip]
+                self.registry.unregister(ip)
+        for ip, device in wanted.items():
+            if ip not in self._connections:
+                self._connections[ip] = self.make_connection(device, self.registry.register(ip))
+
+    async def start(self):
+        await self.server.start()
+
+    async def stop(self):
+        await self.server.stop()
+
+    async def handle(self, request: Request) -> Response:
+        self.requests += 1
+        conn = self._connections.get(request.client_ip)
+        if conn is None:
+            self.unknown_devices += 1
+            logger.warning("Notification from unknown device %s, ignored", request.client_ip)
+            return Response(403)
+
+        if conn.health.state != StreamState.STREAMING:
+            conn.health.transition(StreamState.STREAMING)
+        conn.health.source = "push"
+        conn.health.data_received(len(request.body))
+
+        content_type = request.headers.get("content-type", "")
+        if content_type.lower().startswith("multipart/"):
+            match = _BOUNDARY_RE.search(content_type)
+            if match is None:
+                return Response(400, b"missing multipart boundary")
+            parser = MultipartParser(boundary=b"--" + match.group(1).encode("latin-1"), skip_types=self.skip_types)
+            for part in parser.feed(request.body):
+                self.parts += 1
+                conn.health.part_received()
+                await conn.process_part(part)
+            if parser.skipped_parts:
+                conn.health.parts_dropped(parser.skipped_parts)
+        elif self.skip_types and content_type.lower().startswith(self.skip_types):
+            # A bare snapshot upload: nothing to process.
+            conn.health.parts_dropped(1)
+        else:
+            body = memoryview(request.body)
+            part = Part(
+                headers=memoryview(b""),
+                body=body,
+                content_type=content_type.split(";")[0].strip().lower(),
+                content_length=len(request.body),
+            )
+            self.parts += 1
+            conn.health.part_received()
+            try:
+                await conn.process_part(part)
+            finally:
+                part.release()
+
+        return Response(200)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "parts": self.parts,
+            "unknown_devices": self.unknown_devices,
+            "devices": len(self._connections),
+        }
@@ -6,6 +6,13 @@ class EnterEvent(BaseModel):
     user_id: str | None = None
     time: datetime | None = None
     camera_type: str
+    device_ip: str | None = None
+    serial_no: int | None = None
+    # Where the device is; the producer routes on site.building.camera_type.
+    site: str | None = None
+    building: str | None = None
+    # Path of the event's image relative to the snapshot store, if one was captured.
+    snapshot: str | None = None
 
     
 
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+
+logger = logging.getLogger("snapshots")
+
+
+class SnapshotStore:
+    """Content-addressed JPEG store written by a thread pool.
+
+    ``save`` hashes the image, returns its path relative to ``root`` right away and
+    leaves the write to the pool, so the caller never waits on disk. Images land in
+    ``YYYY/MM/DD/<first two hex digits>/<sha256>.jpg``; identical images are
+    stored once. When more than ``max_pending`` writes are queued new snapshots are
+    dropped instead of buffering without bound.
+
+    Retention works on whole day directories: ``sweep`` deletes days older than
+    ``max_age_days`` and then the oldest days until the store fits in ``max_bytes``.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        workers: int = 2,
+        max_pending: int = 100,
+        max_bytes: int = 10 * 1024 ** 3,
+        max_age_days: int = 30,
+    ):
+        self.root = root
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.saved = 0
+        self.existing = 0
+        self.dropped = 0
+        self.failed = 0
+        self.bytes_written = 0
+        self.swept_bytes = 0
+        os.makedirs(root, exist_ok=True)
+
+    def save(self, image: bytes, day: date | None = None) -> str | None:
+        """Queue ``image`` for writing; return its relative path, or None if dropped."""
+        if self._pending >= self.max_pending:
+            self.dropped += 1
+            return None
+        day = day or datetime.now().date()
+        digest = hashlib.sha256(image).hexdigest()
+        path = os.path.join(f"{day:%Y}", f"{day:%m}", f"{day:%d}", digest[:2], f"{digest}.jpg")
+        with self._lock:
+            self._pending += 1
+        self._executor.submit(self._write, path, image)
+        return path
+
+    def _write(self, path: str, image: bytes):
+        full_path = os.path.join(self.root, path)
+        try:
+            if os.path.exists(full_path):
+                with self._lock:
+                    self.existing += 1
+                return
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            tmp_path = f"{full_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(image)
+            os.replace(tmp_path, full_path)
+            with self._lock:
+                self.saved += 1
+                self.bytes_written += len(image)
+        except OSError:
+            with self._lock:
+                self.failed += 1
+            logger.exception("Failed to write snapshot %s", path)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _days(self) -> list[tuple[date, str]]:
+        days = []
+        for year in _numeric_dirs(self.root):
+            for month in _numeric_dirs(os.path.join(self.root, year)):
+                for day in _numeric_dirs(os.path.join(self.root, year, month)):
+                    try:
+                        days.append((date(int(year), int(month), int(day)), os.path.join(self.root, year, month, day)))
+                    except ValueError:
+                        continue
+        return sorted(days)
+
+    def sweep(self) -> int:
+        """Apply retention; blocking, run it in a thread. Returns bytes removed."""
+        days = [(day, path, _tree_size(path)) for day, path in self._days()]
+        total = sum(size for _, _, size in days)
+        oldest_kept = datetime.now().date() - timedelta(days=self.max_age_days)
+        removed = 0
+        # Never delete today's directory to make room; writes are still landing in it.
+        if days and days[-1][0] >= datetime.now().date():
+            days.pop()
+        for day, path, size in days:
+            if day >= oldest_kept and total - removed <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            removed += size
+            logger.info("Removed snapshots of %s (%d bytes)", day, size)
+        with self._lock:
+            self.swept_bytes += removed
+        return removed
+
+    async def run_retention(self, interval: float):
+        """Sweep every ``interval`` seconds until cancelled."""
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception:
+                logger.exception("Snapshot retention sweep failed")
+            await asyncio.sleep(interval)
+
+    def close(self):
+        """Wait for queued writes; blocking."""
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._pending,
+            "saved": self.saved,
+            "existing": self.existing,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "bytes_written": self.bytes_written,
+            "swept_bytes": self.swept_bytes,
+        }
+
+
+def _numeric_dirs(path: str) -> list[str]:
+    try:
+        return [entry.name for entry in os.scandir(path) if entry.is_dir() and entry.name.isdigit()]
+    except OSError:
+        return []
+
+
+def _tree_size(path: str) -> int:
+    size = 0
+    for directory, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(directory, name))
+            except OSError:
+                pass
+    return size
+
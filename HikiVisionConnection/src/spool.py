@@ -0,0 +1,391 @@
+import argparse
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from datetime import datetime
+
+
+logger = logging.getLogger("spool")
+
+# length (4 bytes) + crc32 (4 bytes), both big-endian, then the payload
+RECORD_HEADER = struct.Struct(">II")
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+QUARANTINE_FILE = "quarantine.jsonl"
+LOCK_FILE = "lock"
+
+
+class SpoolLocked(Exception):
+    """Another process (the service or a spool command) has the spool directory open."""
+
+
+class SpoolCursor:
+    """Position of the next unread record: segment sequence number and byte offset."""
+
+    __slots__ = ("segment", "offset")
+
+    def __init__(self, segment: int, offset: int):
+        self.segment = segment
+        self.offset = offset
+
+    def __repr__(self):
+        return f"SpoolCursor(segment={self.segment}, offset={self.offset})"
+
+
+class Spool:
+    """Append-only, segment-rotated write-ahead log for events the broker did not take.
+
+    Records are appended to the newest segment and read back in order from a
+    persisted cursor. Segments are rotated at ``segment_bytes`` and deleted once the
+    cursor has moved past them. ``fsync`` is batched: it runs after ``fsync_every``
+    records or ``fsync_interval`` seconds, whichever comes first. When the spool
+    grows beyond ``max_bytes`` the oldest segments are dropped.
+
+    The methods are blocking; async callers run them with ``asyncio.to_thread``.
+
+    One process at a time: the directory is locked (``flock`` on its ``lock``
+    file) from construction until ``close``, so the spool command cannot replay
+    or move the cursor under the running service, nor the other way round.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_bytes: int = 16 * 1024 * 1024,
+        max_bytes: int = 512 * 1024 * 1024,
+        fsync_every: int = 100,
+        fsync_interval: float = 1.0,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+
+        self.appended = 0
+        self.dropped_segments = 0
+        self.dropped_bytes = 0
+        self.quarantined = 0
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._active = 0
+        self._active_size = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, LOCK_FILE), "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise SpoolLocked(f"Spool {directory} is in use by another process") from None
+        self._cursor = self._load_cursor()
+
+    # Writing
+
+    def append(self, payloads: list[bytes]):
+        """Append records and fsync if the batching thresholds are reached."""
+        with self._lock:
+            if self._file is None:
+                self._open_active()
+
+            for payload in payloads:
+                if self._active_size >= self.segment_bytes:
+                    self._rotate()
+                record = RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+                self._file.write(record)
+                self._active_size += len(record)
+
+            self.appended += len(payloads)
+            self._unsynced += len(payloads)
+            self._file.flush()
+            if self._unsynced >= self.fsync_every or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._fsync()
+
+            self._enforce_cap()
+
+    def sync(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._fsync()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+                self._fsync()
+                self._file.close()
+                self._file = None
+            # Closing the file releases the flock.
+            self._lock_file.close()
+
+    def _fsync(self):
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _open_active(self):
+        segments = self._segment_numbers()
+        self._active = segments[-1] if segments else max(self._cursor.segment, 1)
+        path = self._segment_path(self._active)
+        self._file = open(path, "ab")
+        self._active_size = self._file.tell()
+        valid = self._valid_length(path)
+        if valid < self._active_size:
+            # A crash tore the last record; appending after it would hide every later record from read().
+            logger.warning(
+                "Truncating torn tail of segment %d from %d to %d bytes", self._active, self._active_size, valid
+            )
+            self._file.truncate(valid)
+            self._active_size = valid
+            if self._cursor.segment == self._active and self._cursor.offset > valid:
+                self._cursor = SpoolCursor(self._active, valid)
+                self._save_cursor()
+
+    def _valid_length(self, path: str) -> int:
+        """Offset just past the last intact record of a segment."""
+        offset = 0
+        with open(path, "rb") as f:
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    return offset
+                length, crc = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    return offset
+                offset += RECORD_HEADER.size + length
+
+    def _rotate(self):
+        self._file.flush()
+        self._fsync()
+        self._file.close()
+        self._active += 1
+        self._file = open(self._segment_path(self._active), "ab")
+        self._active_size = 0
+
+    def _enforce_cap(self):
+        segments = self._segment_numbers()
+        total = sum(os.path.getsize(self._segment_path(n)) for n in segments)
+        for number in segments[:-1]:
+            if total <= self.max_bytes:
+                break
+            path = self._segment_path(number)
+            size = os.path.getsize(path)
+            os.remove(path)
+            total -= size
+            self.dropped_segments += 1
+            self.dropped_bytes += size
+            logger.warning("Size cap reached, dropped segment %s (%d bytes)", os.path.basename(path), size)
+            if self._cursor.segment <= number:
+                self._cursor = SpoolCursor(number + 1, 0)
+                self._save_cursor()
+
+    # Reading
+
+    def read(self, max_records: int, positions: list[SpoolCursor] | None = None) -> tuple[list[bytes], SpoolCursor]:
+        """Return up to ``max_records`` unread records and the cursor just past them.
+
+        The cursor is not advanced until ``commit`` is called with it, so records
+        are re-read if publishing them fails. With ``positions`` the cursor just
+        past each record is appended to it, to commit part of what was read.
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+            records: list[bytes] = []
+            cursor = SpoolCursor(self._cursor.segment, self._cursor.offset)
+            for number in self._segment_numbers():
+                if number < cursor.segment:
+                    continue
+                if number > cursor.segment:
+                    cursor = SpoolCursor(number, 0)
+                cursor.offset = self._read_segment(
+                    number, cursor.offset, max_records - len(records), records, positions
+                )
+                if len(records) >= max_records:
+                    break
+            return records, cursor
+
+    def commit(self, cursor: SpoolCursor):
+        """Persist the read position and delete segments that are fully consumed."""
+        with self._lock:
+            self._cursor = cursor
+            self._save_cursor()
+            for number in self._segment_numbers():
+                if number >= cursor.segment or (self._file is not None and number == self._active):
+                    break
+                os.remove(self._segment_path(number))
+
+    def _read_segment(
+        self, number: int, offset: int, limit: int, out: list[bytes], positions: list[SpoolCursor] | None = None
+    ) -> int:
+        with open(self._segment_path(number), "rb") as f:
+            f.seek(offset)
+            while limit > 0:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                length, crc = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    # Torn write at the end of a segment; nothing after it is trustworthy.
+                    logger.warning("Corrupt record in segment %d at offset %d, skipping rest of segment", number, offset)
+                    return os.path.getsize(self._segment_path(number))
+                out.append(payload)
+                offset += RECORD_HEADER.size + length
+                if positions is not None:
+                    positions.append(SpoolCursor(number, offset))
+                limit -= 1
+        return offset
+
+    def quarantine(self, payload: bytes, error: str):
+        """Set aside a record that cannot be published, as a JSON line in ``quarantine.jsonl``."""
+        entry = {
+            "at": datetime.now().astimezone().isoformat(),
+            "error": error,
+            "payload": payload.decode(errors="replace"),
+        }
+        with self._lock:
+            with open(os.path.join(self.directory, QUARANTINE_FILE), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.quarantined += 1
+
+    # Bookkeeping
+
+    def stats(self) -> dict:
+        segments = self._segment_numbers()
+        size = sum(os.path.getsize(self._segment_path(n)) for n in segments)
+        pending = size
+        if segments and self._cursor.segment in segments:
+            pending -= self._cursor.offset
+        for number in segments:
+            if number < self._cursor.segment:
+                pending -= os.path.getsize(self._segment_path(number))
+        return {
+            "segments": len(segments),
+            "bytes": size,
+            "pending_bytes": max(pending, 0),
+            "appended": self.appended,
+            "dropped_segments": self.dropped_segments,
+            "dropped_bytes": self.dropped_bytes,
+            "quarantined": self.quarantined,
+        }
+
+    def has_pending(self) -> bool:
+        return self.stats()["pending_bytes"] > 0
+
+    def _segment_numbers(self) -> list[int]:
+        return sorted(
+            int(name[:-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"{number:012d}{SEGMENT_SUFFIX}")
+
+    def _load_cursor(self) -> SpoolCursor:
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE)) as f:
+                segment, offset = f.read().split()
+                return SpoolCursor(int(segment), int(offset))
+        except (FileNotFoundError, ValueError):
+            return SpoolCursor(1, 0)
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(f"{self._cursor.segment} {self._cursor.offset}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+def _cmd_list(spool: Spool, args):
+    print(f"cursor: {spool._cursor}")
+    for number in spool._segment_numbers():
+        path = spool._segment_path(number)
+        print(f"{os.path.basename(path)}  {os.path.getsize(path)} bytes")
+    print(json.dumps(spool.stats()))
+
+
+def _cmd_inspect(spool: Spool, args):
+    records, cursor = spool.read(args.limit)
+    for payload in records:
+        print(payload.decode(errors="replace"))
+    print(f"# {len(records)} records, next cursor {cursor}")
+
+
+async def _drain(spool: Spool, batch_size: int) -> bool:
+    from config import settings
+    from pipeline import EventPipeline
+    from producer import init_rabbit, close_rabbit, publish_events
+
+    await init_rabbit()
+    # The service's replay: bad records are quarantined, not fatal.
+    pipeline = EventPipeline(
+        publish_batch=publish_events,
+        spool=spool,
+        replay_batch_size=batch_size,
+        replay_interval=settings.spool.replay_interval,
+        replay_max_attempts=settings.spool.replay_max_attempts,
+    )
+    try:
+        drained = await pipeline.drain_spool()
+    finally:
+        await close_rabbit()
+    stats = pipeline.stats()
+    print(f"[Spool] {'Drained' if drained else 'Stopped, the broker keeps failing'}: "
+          f"{stats['replayed']} records published, {stats['spool']['quarantined']} quarantined")
+    return drained
+
+
+def _cmd_drain(spool: Spool, args):
+    if not asyncio.run(_drain(spool, args.batch_size)):
+        raise SystemExit(1)
+
+
+def main():
+    from config import settings
+
+    parser = argparse.ArgumentParser(description="Inspect and drain the event spool.")
+    parser.add_argument("--dir", default=settings.spool.directory, help="spool directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="list segments and the read cursor").set_defaults(func=_cmd_list)
+
+    inspect = commands.add_parser("inspect", help="print unread records without consuming them")
+    inspect.add_argument("--limit", type=int, default=20)
+    inspect.set_defaults(func=_cmd_inspect)
+
+    drain = commands.add_parser("drain", help="publish all unread records to RabbitMQ")
+    drain.add_argument("--batch-size", type=int, default=settings.spool.replay_batch_size)
+    drain.set_defaults(func=_cmd_drain)
+
+    args = parser.parse_args()
+    try:
+        spool = Spool(directory=args.dir)
+    except SpoolLocked as e:
+        raise SystemExit(f"{e}; stop the service first") from None
+    try:
+        args.func(spool, args)
+    finally:
+        spool.close()
+
+
+if __name__ == "__main__":
+    main()
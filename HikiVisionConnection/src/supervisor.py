@@ -0,0 +1,213 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+
+from config import settings
+from devices import load_devices
+
+
+logger = logging.getLogger("supervisor")
+
+
+class HashRing:
+    """Consistent hash ring: adding or removing a node only moves the keys it owns."""
+
+    def __init__(self, nodes: list[str], replicas: int = 100):
+        self._ring: list[tuple[int, str]] = sorted(
+            (self._hash(f"{node}#{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self._keys = [key for key, _ in self._ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._ring[index][1]
+
+
+def assign_devices(devices: list[dict], workers: list[str]) -> dict[str, list[dict]]:
+    ring = HashRing(workers)
+    assignment: dict[str, list[dict]] = {worker: [] for worker in workers}
+    for device in devices:
+        assignment[ring.node_for(device["device_ip"])].append(device)
+    return assignment
+
+
+def _run_worker(worker_id: str, index: int, devices: list[dict], control: multiprocessing.Queue):
+    """Worker process entry point: stream the assigned devices, follow reassignments."""
+    from connection import run_ingestion
+    from log_setup import setup_logging
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(settings.logging.level, settings.logging.sample_burst, settings.logging.sample_interval)
+
+    async def worker_main():
+        loop = asyncio.get_running_loop()
+        # Let the ingestion stack flush its pipeline and spool when the supervisor stops us.
+        loop.add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+        updates: asyncio.Queue = asyncio.Queue()
+
+        def read_control():
+            while True:
+                new_devices = control.get()
+                loop.call_soon_threadsafe(updates.put_nowait, new_devices)
+
+        threading.Thread(target=read_control, daemon=True).start()
+        spool_directory = os.path.join(settings.spool.directory, worker_id)
+        status_port = settings.status.port + index if settings.status.port is not None else None
+        await run_ingestion(devices, spool_directory, device_updates=updates, status_port=status_port)
+
+    logger.info("%s started with %d devices (pid %d)", worker_id, len(devices), os.getpid())
+    try:
+        asyncio.run(worker_main())
+    except asyncio.CancelledError:
+        pass
+
+
+class Worker:
+    def __init__(self, worker_id: str, index: int, context):
+        self.worker_id = worker_id
+        self.index = index
+        self.context = context
+        self.devices: list[dict] = []
+        self.process: multiprocessing.Process | None = None
+        self.control: multiprocessing.Queue | None = None
+        self.restarts = 0
+
+    def start(self):
+        self.control = self.context.Queue()
+        self.process = self.context.Process(
+            target=_run_worker,
+            args=(self.worker_id, self.index, self.devices, self.control),
+            name=self.worker_id,
+            daemon=True,
+        )
+        self.process.start()
+
+    def assign(self, devices: list[dict]):
+        self.devices = devices
+        if self.process is not None and self.process.is_alive():
+            self.control.put(devices)
+
+    def stop(self, timeout: float):
+        if self.process is None:
+            return
+        self.process.terminate()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.kill()
+
+
+class Supervisor:
+    """Shard cameras across worker processes and keep the workers running.
+
+    Devices are placed on workers by consistent hashing of their IP. Crashed
+    workers are restarted with the same devices. When the devices file changes
+    only the workers whose share changed receive their new device list, and they
+    apply it without restarting their other streams.
+    """
+
+    def __init__(self, workers: int, poll_interval: float = 5.0, restart_delay: float = 1.0):
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = {
+            f"worker-{index}": Worker(f"worker-{index}", index, self.context)
+            for index in range(workers)
+        }
+        self.poll_interval = poll_interval
+        self.restart_delay = restart_delay
+        self._devices_mtime: float | None = None
+        self._running = True
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self._devices_changed()
+        self._rebalance(load_devices())
+        for worker in self.workers.values():
+            worker.start()
+
+        try:
+            while True:
+                time.sleep(self.poll_interval)
+                if not self._running:
+                    break
+                self._restart_crashed()
+                if self._devices_changed():
+                    self._reload_devices()
+        finally:
+            for worker in self.workers.values():
+                worker.stop(timeout=10)
+            logger.info("All workers stopped.")
+
+    def _stop(self, signum, frame):
+        self._running = False
+
+    def _restart_crashed(self):
+        for worker in self.workers.values():
+            if worker.process is not None and not worker.process.is_alive():
+                worker.restarts += 1
+                logger.warning(
+                    "%s exited with code %s, restarting (restart #%d)",
+                    worker.worker_id, worker.process.exitcode, worker.restarts,
+                )
+                time.sleep(self.restart_delay)
+                worker.start()
+
+    def _devices_changed(self) -> bool:
+        path = settings.devices.file
+        try:
+            mtime = os.path.getmtime(path) if path else None
+        except OSError:
+            mtime = None
+        changed = mtime != self._devices_mtime
+        self._devices_mtime = mtime
+        return changed
+
+    def _reload_devices(self):
+        """Rebalance on the edited devices file; keep the current assignment if it is unusable."""
+        path = settings.devices.file
+        if path and not os.path.exists(path):
+            # Deleted or being replaced: not a reason to switch every worker to the built-in cameras.
+            logger.error("Devices file %s is gone, keeping the current devices", path)
+            return
+        try:
+            devices = load_devices()
+        except (ValueError, OSError) as e:
+            logger.error("Could not reload devices, keeping the current assignment: %s", e)
+            return
+        self._rebalance(devices)
+
+    def _rebalance(self, devices: list[dict]):
+        assignment = assign_devices(devices, list(self.workers))
+        for worker_id, worker_devices in assignment.items():
+            worker = self.workers[worker_id]
+            if worker_devices != worker.devices:
+                logger.info("%s now has %d devices", worker_id, len(worker_devices))
+                worker.assign(worker_devices)
+
+
+def main():
+    from log_setup import setup_logging
+
+    setup_logging(settings.logging.level, settings.logging.sample_burst, settings.logging.sample_interval)
+    supervisor = Supervisor(
+        workers=settings.supervisor.workers,
+        poll_interval=settings.supervisor.poll_interval,
+        restart_delay=settings.supervisor.restart_delay,
+    )
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
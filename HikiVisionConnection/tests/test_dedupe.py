@@ -0,0 +1,74 @@
+import pytest
+
+import dedupe
+from dedupe import EventDeduplicator, TTLCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dedupe.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_repeated_serial_within_the_ttl_is_suppressed(clock):
+    deduplicator = EventDeduplicator(serial_ttl=300.0, employee_window=2.0)
+
+    assert not deduplicator.is_duplicate("10.0.0.1", 7, "1")
+    clock[0] += 100
+    # Another employee number: only the serial says it is a repeat.
+    assert deduplicator.is_duplicate("10.0.0.1", 7, "2")
+    # The same serial from another device is another event.
+    assert not deduplicator.is_duplicate("10.0.0.2", 7, "3")
+
+    assert deduplicator.stats()["suppressed_serial"] == 1
+
+
+def test_employee_window_slides_while_events_keep_coming(clock):
+    deduplicator = EventDeduplicator(serial_ttl=300.0, employee_window=2.0)
+
+    assert not deduplicator.is_duplicate("10.0.0.1", 1, "1")
+    # New serials every 1.5 s: each is within 2 s of the previous one, so the window keeps extending.
+    for serial_no in (2, 3, 4):
+        clock[0] += 1.5
+        assert deduplicator.is_duplicate("10.0.0.1", serial_no, "1")
+    # Another person at the same terminal is not held back.
+    assert not deduplicator.is_duplicate("10.0.0.1", 5, "2")
+
+    stats = deduplicator.stats()
+    assert (stats["passed"], stats["suppressed_employee"]) == (2, 3)
+
+
+def test_entries_are_allowed_again_after_they_expire(clock):
+    deduplicator = EventDeduplicator(serial_ttl=300.0, employee_window=2.0)
+
+    assert not deduplicator.is_duplicate("10.0.0.1", 7, "1")
+    clock[0] += 2.0
+    assert not deduplicator.is_duplicate("10.0.0.1", 8, "1")
+    clock[0] += 300.0
+    assert not deduplicator.is_duplicate("10.0.0.1", 7, "1")
+    # Expired entries are gone, not just ignored: serial 8 expired too, 7 is tracked anew.
+    assert deduplicator.stats()["tracked_serials"] == 1
+
+
+def test_lru_eviction_at_max_entries():
+    cache = TTLCache(ttl=60.0, max_entries=2)
+
+    assert not cache.seen("a", now=0.0)
+    assert not cache.seen("b", now=1.0)
+    # Touching "a" makes "b" the least recently used.
+    assert cache.seen("a", now=2.0)
+    assert not cache.seen("c", now=3.0)
+
+    assert (len(cache), cache.evicted) == (2, 1)
+    assert cache.seen("a", now=4.0)
+    assert not cache.seen("b", now=5.0)
+    assert cache.evicted == 2
+
+
+def test_deduplicator_reports_evictions(clock):
+    deduplicator = EventDeduplicator(max_entries=2)
+    for serial_no in range(4):
+        deduplicator.is_duplicate("10.0.0.1", serial_no, str(serial_no))
+
+    assert deduplicator.stats()["evicted"] == 4
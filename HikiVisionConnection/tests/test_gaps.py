@@ -0,0 +1,117 @@
+import asyncio
+import json
+
+import httpx
+
+from backfill import Backfiller, Checkpoint
+from gaps import GapJournal, GapTracker
+
+
+DEVICE = {"device_ip": "10.0.0.1", "username": "admin", "password": "secret", "camera_type": "enter"}
+
+
+def test_serial_jump_is_a_gap(tmp_path):
+    journal = GapJournal(str(tmp_path))
+    tracker = GapTracker("10.0.0.1", journal)
+    tracker.event_seen(10, "2026-10-17T08:00:00+05:00")
+    tracker.event_seen(11, "2026-10-17T08:01:00+05:00")
+    tracker.event_seen(15, "2026-10-17T08:05:00+05:00")
+
+    [gap] = journal.read("10.0.0.1")
+    assert (gap["reason"], gap["after_serial"], gap["before_serial"]) == ("serial", 11, 15)
+    assert (gap["start"], gap["end"]) == ("2026-10-17T08:01:00+05:00", "2026-10-17T08:05:00+05:00")
+
+
+def test_downtime_is_bounded_by_the_serials_streamed_around_it(tmp_path):
+    journal = GapJournal(str(tmp_path))
+    tracker = GapTracker("10.0.0.1", journal)
+    tracker.event_seen(10, "2026-10-17T08:00:00+05:00")
+    tracker.stream_down()
+    tracker.stream_down()
+    assert journal.read("10.0.0.1") == []
+
+    # The first event after the reconnect ends the outage; no serial gap on top of it.
+    tracker.event_seen(14, "2026-10-17T08:30:00+05:00")
+    tracker.event_seen(15, "2026-10-17T08:31:00+05:00")
+
+    [gap] = journal.read("10.0.0.1")
+    assert (gap["reason"], gap["after_serial"], gap["before_serial"]) == ("downtime", 10, 14)
+    assert gap["start"] == "2026-10-17T08:00:00+05:00"
+
+
+def test_downtime_across_a_reset_has_no_serial_bounds(tmp_path):
+    journal = GapJournal(str(tmp_path))
+    tracker = GapTracker("10.0.0.1", journal)
+    tracker.event_seen(10, "2026-10-17T08:00:00+05:00")
+    tracker.stream_down()
+    tracker.event_seen(3, "2026-10-17T08:30:00+05:00")
+
+    [gap] = journal.read("10.0.0.1")
+    assert (gap["after_serial"], gap["before_serial"]) == (None, None)
+
+
+def test_close_records_an_open_outage(tmp_path):
+    journal = GapJournal(str(tmp_path))
+    tracker = GapTracker("10.0.0.1", journal)
+    tracker.event_seen(10, "2026-10-17T08:00:00+05:00")
+    tracker.stream_down()
+    tracker.close()
+    tracker.close()
+
+    [gap] = journal.read("10.0.0.1")
+    assert (gap["after_serial"], gap["before_serial"]) == (10, None)
+
+
+def device_log(serials: list[int], page_size: int):
+    """A device answering AcsEvent searches from a log of ``serials``."""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        condition = json.loads(request.content)["AcsEventCond"]
+        requests.append(condition)
+        position = condition["searchResultPosition"]
+        page = serials[position:position + page_size]
+        return httpx.Response(200, json={"AcsEvent": {
+            "numOfMatches": len(page),
+            "responseStatusStrg": "MORE" if position + page_size < len(serials) else "OK",
+            "InfoList": [
+                {"serialNo": serial, "employeeNoString": f"u{serial}", "time": "2026-10-17T08:10:00+05:00", "minor": 75}
+                for serial in page
+            ],
+        }})
+
+    return httpx.MockTransport(handler), requests
+
+
+def test_backfill_publishes_only_the_serials_inside_a_gap(tmp_path):
+    journal = GapJournal(str(tmp_path))
+    tracker = GapTracker("10.0.0.1", journal)
+    tracker.event_seen(10, "2026-10-17T08:00:00+05:00")
+    tracker.stream_down()
+    tracker.event_seen(14, "2026-10-17T08:30:00+05:00")
+    [gap] = journal.read("10.0.0.1")
+
+    published = []
+
+    async def publish(event):
+        published.append(event.serial_no)
+
+    async def run():
+        transport, requests = device_log(list(range(8, 17)), page_size=3)
+        backfiller = Backfiller(journal, publish, requests_per_second=0, page_size=3)
+        checkpoint = Checkpoint(journal.checkpoint_path("10.0.0.1"))
+        async with httpx.AsyncClient(transport=transport) as client:
+            await backfiller.backfill_range(
+                client, DEVICE, tracker.last_time, tracker.last_time,
+                gap["after_serial"], gap["before_serial"], checkpoint,
+            )
+        return backfiller, checkpoint, requests
+
+    backfiller, checkpoint, requests = asyncio.run(run())
+
+    # 8-10 were streamed before the outage, 14-16 after it.
+    assert published == [11, 12, 13]
+    assert backfiller.stats()["skipped"] == 6
+    assert [request["searchResultPosition"] for request in requests] == [0, 3, 6]
+    assert (checkpoint.position, checkpoint.published) == (9, 3)
+    assert Checkpoint(checkpoint.path).position == 9
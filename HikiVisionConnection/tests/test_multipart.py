@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from multipart import MultipartParser
+
+
+BOUNDARY = b"--MIME_boundary"
+
+
+def part(content_type: bytes, body: bytes, content_length: bool = True) -> bytes:
+    headers = b"Content-Type: " + content_type + b"\r\n"
+    if content_length:
+        headers += b"Content-Length: " + str(len(body)).encode() + b"\r\n"
+    return BOUNDARY + b"\r\n" + headers + b"\r\n" + body + b"\r\n"
+
+
+EVENT = b'{"eventType": "AccessControllerEvent", "AccessControllerEvent": {"serialNo": 7}}'
+HEARTBEAT = b'{"eventType": "heartBeat"}'
+IMAGE = bytes(range(256)) * 8 + b"--MIME_bound"  # a near-boundary inside a body
+
+STREAM = (
+    part(b'application/json; charset="UTF-8"', EVENT)
+    + part(b"image/jpeg", IMAGE)
+    + part(b"application/json", HEARTBEAT, content_length=False)
+    + part(b"image/jpeg", IMAGE[:100], content_length=False)
+    + part(b"text/plain", b"")
+    + BOUNDARY + b"--\r\n"
+)
+
+EXPECTED = [
+    ("application/json", EVENT),
+    ("image/jpeg", IMAGE),
+    ("application/json", HEARTBEAT),
+    ("image/jpeg", IMAGE[:100]),
+    ("text/plain", b""),
+]
+
+
+def parse(chunks: list[bytes], **kwargs) -> tuple[list[tuple[str, bytes]], MultipartParser]:
+    parser = MultipartParser(boundary=BOUNDARY, **kwargs)
+    parts = []
+    for chunk in chunks:
+        # Views are only valid until the parser resumes.
+        parts.extend((part.content_type, bytes(part.body)) for part in parser.feed(chunk))
+    return parts, parser
+
+
+def split_at(data: bytes, *offsets: int) -> list[bytes]:
+    edges = [0, *sorted(offsets), len(data)]
+    return [data[start:end] for start, end in zip(edges, edges[1:])]
+
+
+def random_chunks(data: bytes, seed: int) -> list[bytes]:
+    rng = random.Random(seed)
+    return split_at(data, *rng.sample(range(1, len(data)), rng.randint(1, 40)))
+
+
+SPLITS = {
+    "whole": [STREAM],
+    "bytewise": [STREAM[i:i + 1] for i in range(len(STREAM))],
+    "inside boundary": split_at(STREAM, STREAM.index(BOUNDARY, 1) + 5),
+    "inside every boundary": split_at(
+        STREAM, *(index + 7 for index in range(len(STREAM)) if STREAM.startswith(BOUNDARY, index))
+    ),
+    "inside headers": split_at(STREAM, STREAM.index(b"Content-Length") + 9, STREAM.index(b"\r\n\r\n") + 2),
+    "inside body": split_at(STREAM, STREAM.index(IMAGE) + 1000),
+    **{f"random {seed}": random_chunks(STREAM, seed) for seed in range(20)},
+}
+
+
+@pytest.mark.parametrize("chunks", SPLITS.values(), ids=SPLITS.keys())
+def test_parts_are_the_same_however_the_stream_is_split(chunks):
+    assert b"".join(chunks) == STREAM
+
+    parts, _ = parse(chunks)
+
+    assert parts == EXPECTED
+
+
+@pytest.mark.parametrize("chunks", SPLITS.values(), ids=SPLITS.keys())
+def test_skipped_types_are_dropped_however_the_stream_is_split(chunks):
+    parts, parser = parse(chunks, skip_types=("image/",))
+
+    assert parts == [expected for expected in EXPECTED if not expected[0].startswith("image/")]
+    assert parser.skipped_parts == 2
+    assert parser.skipped_bytes == len(IMAGE) + 100
+
+
+@pytest.mark.parametrize("compact_threshold", [0, 1, 1 << 40])
+@pytest.mark.parametrize("seed", range(5))
+def test_compact_threshold_does_not_change_the_parts(compact_threshold, seed, monkeypatch):
+    monkeypatch.setattr(MultipartParser, "compact_threshold", compact_threshold)
+    # Several streams in a row, so compaction happens between parts and mid-part.
+    data = STREAM[:-len(BOUNDARY) - 4] * 3 + BOUNDARY + b"--\r\n"
+
+    parts, parser = parse(random_chunks(data, seed))
+
+    assert parts == EXPECTED * 3
+    if compact_threshold <= 1:
+        # Consumed bytes were dropped from the buffer along the way.
+        assert len(parser._buf) < len(data)
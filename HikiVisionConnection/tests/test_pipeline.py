@@ -0,0 +1,144 @@
+import asyncio
+import json
+
+from pipeline import EventPipeline
+from schemas import EnterEvent
+from spool import Spool
+
+
+def event(user_id: str) -> bytes:
+    return EnterEvent(user_id=user_id, camera_type="enter").model_dump_json().encode()
+
+
+def test_replay_quarantines_a_bad_record_after_max_attempts(tmp_path):
+    published = []
+
+    async def publish_batch(events):
+        published.extend(event.user_id for event in events)
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return [future for _ in events]
+
+    async def replay():
+        spool = Spool(str(tmp_path))
+        spool.append([event("1"), b"{not json", event("2")])
+        pipeline = EventPipeline(publish_batch, spool=spool, replay_max_attempts=2)
+        for _ in range(3):
+            await pipeline._replay_spool()
+        return spool
+
+    spool = asyncio.run(replay())
+
+    assert published == ["1", "2"]
+    assert spool.read(10)[0] == []
+    assert spool.quarantined == 1
+    quarantined = [json.loads(line) for line in (tmp_path / "quarantine.jsonl").read_text().splitlines()]
+    assert [entry["payload"] for entry in quarantined] == ["{not json"]
+
+
+def test_replay_keeps_records_while_the_broker_fails(tmp_path):
+    async def publish_batch(events):
+        raise ConnectionError("broker down")
+
+    async def replay():
+        spool = Spool(str(tmp_path))
+        spool.append([event("1"), event("2")])
+        pipeline = EventPipeline(publish_batch, spool=spool, replay_max_attempts=1)
+        for _ in range(3):
+            await pipeline._replay_spool()
+        return spool
+
+    spool = asyncio.run(replay())
+
+    assert len(spool.read(10)[0]) == 2
+    assert spool.quarantined == 0
+
+
+def test_partly_confirmed_batch_is_not_published_again(tmp_path):
+    published = []
+    fail_from = ["3"]
+
+    async def publish_batch(events):
+        loop = asyncio.get_running_loop()
+        futures = []
+        for event in events:
+            future = loop.create_future()
+            if fail_from and event.user_id >= fail_from[0]:
+                future.set_exception(ConnectionError("nack"))
+            else:
+                published.append(event.user_id)
+                future.set_result(None)
+            futures.append(future)
+        return futures
+
+    async def replay():
+        spool = Spool(str(tmp_path))
+        spool.append([event(str(n)) for n in range(1, 6)])
+        pipeline = EventPipeline(publish_batch, spool=spool)
+        await pipeline._replay_spool()
+        fail_from.clear()
+        await pipeline._replay_spool()
+        return spool
+
+    spool = asyncio.run(replay())
+
+    assert published == ["1", "2", "3", "4", "5"]
+    assert spool.read(10)[0] == []
+
+
+def test_record_by_record_replay_checkpoints_before_a_broker_failure(tmp_path):
+    published = []
+    broker_down = [True]
+
+    async def publish_batch(events):
+        future = asyncio.get_running_loop().create_future()
+        if events[0].user_id == "3" and broker_down[0]:
+            future.set_exception(ConnectionError("broker down"))
+        else:
+            published.append(events[0].user_id)
+            future.set_result(None)
+        return [future]
+
+    async def replay():
+        spool = Spool(str(tmp_path))
+        spool.append([event("1"), event("2"), event("3"), event("4")])
+        pipeline = EventPipeline(publish_batch, spool=spool, replay_max_attempts=0)
+        await pipeline._replay_spool()
+        remaining = spool.read(10)[0]
+        broker_down[0] = False
+        await pipeline._replay_spool()
+        return remaining
+
+    remaining = asyncio.run(replay())
+
+    assert len(remaining) == 2
+    assert published == ["1", "2", "3", "4"]
+
+
+def test_drain_spool_quarantines_bad_records_and_reports_a_failing_broker(tmp_path):
+    published = []
+    broker_up = [True]
+
+    async def publish_batch(events):
+        if not broker_up[0]:
+            raise ConnectionError("broker down")
+        published.extend(event.user_id for event in events)
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(None)
+        return [future for _ in events]
+
+    async def drain():
+        spool = Spool(str(tmp_path))
+        spool.append([event("1"), b"{not json", event("2")])
+        pipeline = EventPipeline(publish_batch, spool=spool, replay_interval=0, replay_max_attempts=2)
+        drained = await pipeline.drain_spool()
+        spool.append([event("3")])
+        broker_up[0] = False
+        return drained, await pipeline.drain_spool(), spool
+
+    drained, drained_while_down, spool = asyncio.run(drain())
+
+    assert (drained, drained_while_down) == (True, False)
+    assert published == ["1", "2"]
+    assert spool.quarantined == 1
+    assert spool.read(10)[0] == [event("3")]
@@ -0,0 +1,16 @@
+from config import settings
+from producer import topic_routing_key
+from schemas import EnterEvent
+
+
+def test_topic_routing_key(monkeypatch):
+    monkeypatch.setattr(settings.devices, "site", "campus.a")
+    monkeypatch.setattr(settings.devices, "building", "main")
+    event = EnterEvent(user_id="42", camera_type="enter")
+
+    assert topic_routing_key()(event) == "campus_a.main.enter"
+    # The device's own location wins over the configured one.
+    assert topic_routing_key()(event.model_copy(update={"site": "b"})) == "b.main.enter"
+    # crc32 partitions, as the consumer's partition_for: every event of a user lands in one queue.
+    assert topic_routing_key(4)(event) == "campus_a.main.enter.0"
+    assert topic_routing_key(4)(EnterEvent(user_id="7", camera_type="exit")) == "campus_a.main.exit.2"
@@ -0,0 +1,79 @@
+import asyncio
+
+from health import DeviceHealth
+from http_server import HttpServer, Request, Response
+from push import PushListener
+
+
+class FakeConnection:
+    def __init__(self, health: DeviceHealth):
+        self.health = health
+        self.parts = []
+
+    async def process_part(self, part):
+        self.parts.append((part.content_type, bytes(part.body)))
+
+
+def push_request(body: bytes, content_type: str) -> Request:
+    return Request(
+        method="POST",
+        path="/notify",
+        query={},
+        headers={"content-type": content_type},
+        body=body,
+        client_ip="10.0.0.1",
+    )
+
+
+def test_push_skips_image_parts():
+    connections = []
+
+    def make_connection(device, health):
+        connections.append(FakeConnection(health))
+        return connections[-1]
+
+    listener = PushListener(
+        [{"device_ip": "10.0.0.1", "camera_type": "enter"}],
+        make_connection,
+        host="127.0.0.1",
+        port=0,
+        path="/notify",
+        skip_types=("image/",),
+    )
+    body = (
+        b"--boundary\r\nContent-Type: application/json\r\nContent-Length: 2\r\n\r\n{}\r\n"
+        b"--boundary\r\nContent-Type: image/jpeg\r\nContent-Length: 4\r\n\r\n\xff\xd8\xff\xd9\r\n"
+        b"--boundary--\r\n"
+    )
+
+    response = asyncio.run(listener.handle(push_request(body, 'multipart/form-data; boundary="boundary"')))
+
+    assert response.status == 200
+    assert connections[0].parts == [("application/json", b"{}")]
+    assert connections[0].health.parts_skipped == 1
+
+
+async def exchange(server: HttpServer, raw: bytes) -> bytes:
+    await server.start()
+    try:
+        port = server._server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(raw)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        return response
+    finally:
+        await server.stop()
+
+
+def test_invalid_content_length_is_a_bad_request():
+    async def ok(request):
+        return Response(200)
+
+    server = HttpServer("127.0.0.1", 0)
+    server.route("POST", "/notify", ok)
+
+    for length in (b"abc", b"-5"):
+        response = asyncio.run(exchange(server, b"POST /notify HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n"))
+        assert response.startswith(b"HTTP/1.1 400 ")
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from config import settings
+from devices import load_devices
+from supervisor import Supervisor
+
+
+def write_devices(path, devices):
+    path.write_text(json.dumps(devices), encoding="utf-8")
+
+
+@pytest.fixture
+def devices_file(tmp_path, monkeypatch):
+    path = tmp_path / "devices.json"
+    write_devices(path, [
+        {"device_ip": "10.0.0.1", "camera_type": "enter"},
+        {"device_ip": "10.0.0.2", "camera_type": "exit"},
+    ])
+    monkeypatch.setattr(settings.devices, "file", str(path))
+    return path
+
+
+def assigned(supervisor: Supervisor) -> list[str]:
+    return sorted(device["device_ip"] for worker in supervisor.workers.values() for device in worker.devices)
+
+
+def test_reload_rebalances_an_edited_file(devices_file):
+    supervisor = Supervisor(workers=2)
+    supervisor._reload_devices()
+    write_devices(devices_file, [{"device_ip": "10.0.0.3", "camera_type": "enter"}])
+    supervisor._reload_devices()
+
+    assert assigned(supervisor) == ["10.0.0.3"]
+
+
+@pytest.mark.parametrize("content", ['[{"device_ip": "10.0.0.3", "camera', '[{"device_ip": "10.0.0.3"}]', '{"a": 1}'])
+def test_reload_keeps_the_assignment_on_a_broken_file(devices_file, content):
+    supervisor = Supervisor(workers=2)
+    supervisor._reload_devices()
+    devices_file.write_text(content, encoding="utf-8")
+    supervisor._reload_devices()
+
+    assert assigned(supervisor) == ["10.0.0.1", "10.0.0.2"]
+
+
+def test_reload_keeps_the_assignment_when_the_file_is_deleted(devices_file):
+    supervisor = Supervisor(workers=2)
+    supervisor._reload_devices()
+    devices_file.unlink()
+    supervisor._reload_devices()
+
+    assert assigned(supervisor) == ["10.0.0.1", "10.0.0.2"]
+
+
+def test_load_devices_reports_an_invalid_entry(devices_file):
+    write_devices(devices_file, [{"camera_type": "enter"}])
+
+    with pytest.raises(ValueError, match="device_ip"):
+        load_devices()
@@ -0,0 +1,28 @@
+import argparse
+import asyncio
+import time
+from datetime import date
+
+from core.utils.db_helper import db_helper
+from .service import AccessEventService
+
+
+async def rebuild(start: date, end: date):
+    started = time.monotonic()
+    async with db_helper.session_factory() as session:
+        result = await AccessEventService(session=session).rebuild_user_logs(start, end)
+    print(f"Rebuilt user_logs from {start} to {end}: {result} in {time.monotonic() - started:.1f} s")
+    await db_helper.dispose()
+
+
+def main():
+    """``python -m access_events.rebuild 2026-09-01 2026-10-01`` from src/; the end day is exclusive."""
+    parser = argparse.ArgumentParser(description="Recompute user_logs of a date range from access_events.")
+    parser.add_argument("start", type=date.fromisoformat)
+    parser.add_argument("end", type=date.fromisoformat)
+    args = parser.parse_args()
+    asyncio.run(rebuild(args.start, args.end))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+from datetime import date , datetime , time
+from zoneinfo import ZoneInfo
+from sqlalchemy import String, bindparam, func, select, text
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from core.models import AccessEvent
+from core.models.user_logs import LOCAL_TIMEZONE
+
+
+LOCAL_ZONE = ZoneInfo(LOCAL_TIMEZONE)
+
+# Monthly partitions known to exist, shared by every service instance of the process.
+_partitions: set[date] = set()
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def next_month(month: date) -> date:
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def local_midnight(day: date) -> datetime:
+    return datetime.combine(day, time.min, tzinfo=LOCAL_ZONE)
+
+
+# Replays user_logs from raw events in one statement, with the rules of
+# UserLogService.enter / exit / apply_events:
+#   - an enter opens a log unless the user's previous event is an enter of the same
+#     local day (that log is still open);
+#   - an exit closes the user's latest log if it is open, i.e. the first exit after
+#     an opened log, before the user's next opened log, closes it; further exits
+#     are dropped, they never close an older log left open.
+# Every enter opens a group (running count of opened logs); a group is one log.
+REBUILD_USER_LOGS = text("""
+WITH events AS (
+    SELECT
+        e.user_id,
+        e.event_time,
+        e.camera_type,
+        lag(e.camera_type) OVER w AS previous_type,
+        lag(e.event_time) OVER w AS previous_time
+    FROM access_events AS e
+    JOIN users AS u ON u.id = e.user_id
+    WHERE e.event_time >= :start AND e.event_time < :end
+      AND e.camera_type IN ('enter', 'exit')
+      AND (:user_ids IS NULL OR e.user_id = ANY(:user_ids))
+    WINDOW w AS (PARTITION BY e.user_id ORDER BY e.event_time, e.camera_type, e.serial_no)
+),
+steps AS (
+    SELECT user_id, event_time, camera_type
+    FROM events
+    WHERE camera_type = 'exit'
+       OR previous_type IS DISTINCT FROM 'enter'
+       OR CAST(timezone(:zone, previous_time) AS DATE) < CAST(timezone(:zone, event_time) AS DATE)
+),
+grouped AS (
+    SELECT
+        user_id,
+        event_time,
+        camera_type,
+        count(*) FILTER (WHERE camera_type = 'enter') OVER (
+            PARTITION BY user_id ORDER BY event_time, camera_type ROWS UNBOUNDED PRECEDING
+        ) AS log_number
+    FROM steps
+),
+rebuilt AS (
+    SELECT
+        user_id,
+        min(event_time) FILTER (WHERE camera_type = 'enter') AS enter_time,
+        min(event_time) FILTER (WHERE camera_type = 'exit') AS exit_time
+    FROM grouped
+    WHERE log_number > 0
+    GROUP BY user_id, log_number
+)
+INSERT INTO user_logs (user_id, enter_time, exit_time)
+SELECT user_id, enter_time, exit_time
+FROM rebuilt AS r
+-- A log DELETE_USER_LOGS kept stands for the replayed one; so does a kept open log of the same day.
+WHERE NOT EXISTS (SELECT 1 FROM user_logs AS l WHERE l.user_id = r.user_id AND l.enter_time = r.enter_time)
+ON CONFLICT (user_id, (CAST(timezone('%(zone)s', enter_time) AS DATE))) WHERE exit_time IS NULL DO NOTHING
+""" % {"zone": LOCAL_TIMEZONE}).bindparams(bindparam("user_ids", type_=ARRAY(String)))
+
+# Only logs access_events can reproduce: their enter, and exit if closed before
+# :end, are stored events. Logs written before access_events existed or whose
+# events failed to be stored are kept, as are logs closed after :end.
+DELETE_USER_LOGS = text("""
+DELETE FROM user_logs AS l
+WHERE l.enter_time >= :start AND l.enter_time < :end
+  AND (:user_ids IS NULL OR l.user_id = ANY(:user_ids))
+  AND EXISTS (
+      SELECT 1 FROM access_events AS e
+      WHERE e.user_id = l.user_id AND e.event_time = l.enter_time AND e.camera_type = 'enter'
+  )
+  AND (
+      l.exit_time IS NULL
+      OR l.exit_time < :end AND EXISTS (
+          SELECT 1 FROM access_events AS e
+          WHERE e.user_id = l.user_id AND e.event_time = l.exit_time AND e.camera_type = 'exit'
+      )
+  )
+""").bindparams(bindparam("user_ids", type_=ARRAY(String)))
+
+
+class AccessEventService:
+    def __init__(self , session:AsyncSession):
+        self.session = session
+
+    async def ensure_partitions(self, months: set[date]):
+        """Create the monthly partitions of ``months`` (first days) that are missing."""
+        missing = sorted(month_start(month) for month in months if month_start(month) not in _partitions)
+        if not missing:
+            return
+        # Serialise partition creation between consumers; IF NOT EXISTS alone still races.
+        await self.session.execute(text("SELECT pg_advisory_xact_lock(hashtext('access_events_partitions'))"))
+        for month in missing:
+            start, end = local_midnight(month), local_midnight(next_month(month))
+            await self.session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS access_events_y{month:%Y}m{month:%m} "
+                f"PARTITION OF access_events FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+        await self.session.commit()
+        _partitions.update(missing)
+
+    async def record(self, events: list[dict], commit: bool = True) -> list[tuple[str | None, datetime]]:
+        """Store raw events; returns ``(user_id, event_time)`` of the new ones. Repeated events are skipped.
+
+        With ``commit=False`` the insert stays in the session's transaction.
+        """
+        if not events:
+            return []
+        await self.ensure_partitions({event["event_time"].astimezone(LOCAL_ZONE).date() for event in events})
+        result = await self.session.execute(
+            pg_insert(AccessEvent)
+            .values(events)
+            .on_conflict_do_nothing(constraint="uq_access_events_event")
+            .returning(AccessEvent.user_id, AccessEvent.event_time)
+        )
+        new = [(row.user_id, row.event_time) for row in result]
+        if commit:
+            await self.session.commit()
+        return new
+
+    async def latest_event_time(self, user_ids: list[str]) -> datetime | None:
+        """Time of the newest stored event of any of ``user_ids``."""
+        return await self.session.scalar(
+            select(func.max(AccessEvent.event_time)).where(AccessEvent.user_id.in_(user_ids))
+        )
+
+    async def rebuild_user_logs(self, start: date, end: date, user_ids: list[str] | None = None) -> dict:
+        """Recompute ``user_logs`` of the local days ``start`` to ``end`` (exclusive) from raw events.
+
+        Logs entered in the range are deleted and replayed in one transaction,
+        except the ones ``access_events`` cannot reproduce (see
+        ``DELETE_USER_LOGS``); those are kept and not replayed a second time.
+        Events before ``start`` are not looked at, so an exit on ``start`` whose
+        enter was earlier is dropped; rebuild from the day of the enter to keep
+        it. With ``user_ids`` only those users' logs are rebuilt.
+        """
+        params = {
+            "start": local_midnight(start),
+            "end": local_midnight(end),
+            "zone": LOCAL_TIMEZONE,
+            "user_ids": user_ids,
+        }
+        deleted = await self.session.execute(DELETE_USER_LOGS, params)
+        inserted = await self.session.execute(REBUILD_USER_LOGS, params)
+        await self.session.commit()
+        return {"deleted": deleted.rowcount, "inserted": inserted.rowcount}
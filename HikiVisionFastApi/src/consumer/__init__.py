@@ -0,0 +1,7 @@
+__all__ = (
+    "main",
+    "lifespan",
+)
+
+
+from .main import main, lifespan
@@ -0,0 +1,21 @@
+import asyncio
+import signal
+
+from core.utils.db_helper import db_helper
+from .main import main
+
+
+async def run():
+    """Standalone consumer: ``python -m consumer`` from src/."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await main(stop)
+    finally:
+        await db_helper.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,170 @@
+import asyncio
+import time
+
+import aio_pika
+
+from .partitioner import PartitionedConsumer
+
+
+class Autoscaler:
+    """Adapt the consumer's concurrency and batch size to the backlog.
+
+    Every ``interval`` seconds the backlog in events (ready messages in the
+    broker queue, read with a passive declare and converted with the recent
+    events per message, plus events delivered but not handled yet) and the
+    event-time lag of the latest batch are sampled:
+
+    - backlog at or above ``catch_up_depth``: catch-up mode, every worker runs
+      with ``catch_up_batch_size`` events per transaction and a longer batch
+      window, until the backlog is below half the threshold again;
+    - backlog at or above ``scale_up_depth`` or lag above ``max_lag``: double
+      concurrency and batch size, up to ``max_workers`` / ``max_batch_size``;
+    - backlog below a quarter of ``scale_up_depth`` and lag below half of
+      ``max_lag``: step down by one worker and halve the batch size, down to
+      ``min_workers`` / ``min_batch_size``.
+
+    Quiet hours thus run on a few DB connections with small, low-latency
+    batches, and morning and evening peaks get the full pool and bulk writes.
+    """
+
+    def __init__(
+        self,
+        consumer: PartitionedConsumer,
+        connection: aio_pika.abc.AbstractConnection,
+        queue_name: str,
+        min_workers: int = 2,
+        max_workers: int = 16,
+        min_batch_size: int = 10,
+        max_batch_size: int = 100,
+        batch_window: float = 0.005,
+        scale_up_depth: int = 1000,
+        catch_up_depth: int = 20000,
+        catch_up_batch_size: int = 500,
+        catch_up_window: float = 0.05,
+        max_lag: float = 30.0,
+        interval: float = 5.0,
+    ):
+        self.consumer = consumer
+        self.connection = connection
+        self.channel: aio_pika.abc.AbstractChannel | None = None
+        self.queue_name = queue_name
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.scale_up_depth = scale_up_depth
+        self.catch_up_depth = catch_up_depth
+        self.catch_up_batch_size = catch_up_batch_size
+        self.catch_up_window = catch_up_window
+        self.max_lag = max_lag
+        self.interval = interval
+        self.mode = "normal"
+        self.workers = min_workers
+        self.batch_size = min_batch_size
+        self.queue_depth: int | None = None
+        self.events_per_message = 1.0
+        self._received = (0, 0)
+        self.backlog: int | None = None
+        self.lag: float | None = None
+        self.decisions = 0
+        self.scale_ups = 0
+        self.scale_downs = 0
+        self.catch_ups = 0
+        self.last_change: str | None = None
+        self.last_change_at: float | None = None
+
+    async def sample(self) -> tuple[int, float | None]:
+        if self.channel is None or self.channel.is_closed:
+            self.channel = await self.connection.channel()
+        queue = await self.channel.declare_queue(self.queue_name, passive=True)
+        self.queue_depth = queue.declaration_result.message_count
+        # The broker counts messages, the consumer events; an envelope carries many.
+        messages, events = self.consumer.messages, self.consumer.events
+        if messages > self._received[0]:
+            self.events_per_message = (events - self._received[1]) / (messages - self._received[0])
+        self._received = (messages, events)
+        self.backlog = round(self.queue_depth * self.events_per_message) + self.consumer.queued()
+        # An idle consumer has no lag, whatever the last event's age.
+        self.lag = self.consumer.lag if self.backlog else 0.0
+        return self.backlog, self.lag
+
+    def decide(self, backlog: int, lag: float | None) -> tuple[str, int, int, float]:
+        """Mode, concurrency, batch size and batch window for the sampled backlog and lag."""
+        lag = lag or 0.0
+        if backlog >= self.catch_up_depth or (self.mode == "catch_up" and backlog >= self.catch_up_depth // 2):
+            return "catch_up", self.max_workers, self.catch_up_batch_size, self.catch_up_window
+        if backlog >= self.scale_up_depth or lag > self.max_lag:
+            return (
+                "normal",
+                min(self.max_workers, self.workers * 2),
+                min(self.max_batch_size, self.batch_size * 2),
+                self.batch_window,
+            )
+        if backlog < self.scale_up_depth // 4 and lag < self.max_lag / 2:
+            return (
+                "normal",
+                max(self.min_workers, self.workers - 1),
+                # Coming out of catch-up the current size is above the normal maximum.
+                min(self.max_batch_size, max(self.min_batch_size, self.batch_size // 2)),
+                self.batch_window,
+            )
+        # Coming out of catch-up, or in between: keep the current scale but normal batches.
+        return "normal", self.workers, min(self.batch_size, self.max_batch_size), self.batch_window
+
+    async def apply(self, mode: str, workers: int, batch_size: int, batch_window: float):
+        if (mode, workers, batch_size) == (self.mode, self.workers, self.batch_size):
+            return
+        if mode == "catch_up" and self.mode != "catch_up":
+            self.catch_ups += 1
+        elif (workers, batch_size) > (self.workers, self.batch_size):
+            self.scale_ups += 1
+        elif (workers, batch_size) < (self.workers, self.batch_size):
+            self.scale_downs += 1
+        self.last_change = (
+            f"{self.mode}/{self.workers}x{self.batch_size} -> {mode}/{workers}x{batch_size} "
+            f"(backlog {self.backlog}, lag {self.lag if self.lag is None else round(self.lag, 1)} s)"
+        )
+        self.last_change_at = time.time()
+        self.decisions += 1
+        self.mode, self.workers, self.batch_size = mode, workers, batch_size
+        self.consumer.batch_size = batch_size
+        self.consumer.batch_window = batch_window
+        await self.consumer.concurrency.set_limit(workers)
+        print(f"[Autoscaler] {self.last_change}")
+
+    async def run(self):
+        """Sample and rescale every ``interval`` seconds until cancelled."""
+        await self.apply(*self.decide(0, 0.0))
+        while True:
+            try:
+                backlog, lag = await self.sample()
+                await self.apply(*self.decide(backlog, lag))
+            except (aio_pika.exceptions.AMQPError, ConnectionError) as e:
+                print(f"[Autoscaler] Could not read the queue depth: {e}")
+                # A failed passive declare closes the channel; open a new one next time.
+                channel, self.channel = self.channel, None
+                if channel is not None and not channel.is_closed:
+                    try:
+                        await channel.close()
+                    except (aio_pika.exceptions.AMQPError, ConnectionError):
+                        pass
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "workers": self.workers,
+            "active_workers": self.consumer.concurrency.active,
+            "batch_size": self.batch_size,
+            "queue_depth": self.queue_depth,
+            "events_per_message": round(self.events_per_message, 1),
+            "backlog": self.backlog,
+            "lag_seconds": round(self.lag, 2) if self.lag is not None else None,
+            "decisions": self.decisions,
+            "scale_ups": self.scale_ups,
+            "scale_downs": self.scale_downs,
+            "catch_ups": self.catch_ups,
+            "last_change": self.last_change,
+            "last_change_at": self.last_change_at,
+        }
@@ -0,0 +1,97 @@
+import asyncio
+from collections import Counter
+
+import asyncpg
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from core.models import User
+from core.utils.db_helper import db_helper
+from .schemas import Event
+
+
+CHANNEL = "users_changed"
+
+
+class KnownUsers:
+    """In-memory set of valid user ids, kept current with LISTEN/NOTIFY.
+
+    Events of unknown users (stale device entries, test cards) are rejected
+    here instead of failing a transaction on the user_logs foreign key.
+    ``listen`` subscribes to the ``users_changed`` notifications sent by a
+    trigger on ``users`` and reloads the whole set every time it (re)connects,
+    so changes made while it was not listening are not missed.
+
+    Until the first load everything is accepted, and so the database decides.
+    """
+
+    def __init__(self):
+        self.ids: set[str] | None = None
+        self.rejected: Counter[str] = Counter()
+        self.notifications = 0
+        self.reloads = 0
+
+    async def load(self):
+        async with db_helper.session_factory() as session:
+            ids = set((await session.scalars(select(User.id))).all())
+        self.ids = ids
+        self.reloads += 1
+        print(f"[Consumer] Loaded {len(ids)} known users")
+
+    def filter(self, events: list[Event]) -> list[Event]:
+        """Events whose user is known; the others are counted per device."""
+        if self.ids is None:
+            return events
+        accepted = []
+        for event in events:
+            if event.user_id in self.ids:
+                accepted.append(event)
+            else:
+                self.rejected[event.device_ip or "unknown"] += 1
+        return accepted
+
+    def _notified(self, connection, pid, channel, payload: str):
+        self.notifications += 1
+        operation, _, user_id = payload.partition(":")
+        if self.ids is None:
+            return
+        if operation == "INSERT":
+            self.ids.add(user_id)
+        elif operation == "DELETE":
+            self.ids.discard(user_id)
+
+    async def listen(self, dsn: str, retry_interval: float = 5.0, max_retry_interval: float = 60.0):
+        """Follow ``users_changed`` until cancelled, reconnecting as needed.
+
+        Failed attempts are retried after ``retry_interval`` seconds, doubling up
+        to ``max_retry_interval`` while the database stays unreachable.
+        """
+        delay = retry_interval
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                closed = asyncio.Event()
+                connection.add_termination_listener(lambda _: closed.set())
+                await connection.add_listener(CHANNEL, self._notified)
+                # Listening first: nothing changed between the load and the first notification is lost.
+                await self.load()
+                delay = retry_interval
+                await closed.wait()
+                print("[Consumer] Lost the users_changed listener connection")
+            except (OSError, asyncpg.PostgresError, SQLAlchemyError) as e:
+                # The reload goes through the SQLAlchemy pool and fails with its own errors.
+                print(f"[Consumer] Could not listen for user changes, retrying in {delay:.0f} s: {e}")
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_retry_interval)
+
+    def stats(self) -> dict:
+        return {
+            "users": len(self.ids) if self.ids is not None else None,
+            "rejected": dict(self.rejected),
+            "notifications": self.notifications,
+            "reloads": self.reloads,
+        }
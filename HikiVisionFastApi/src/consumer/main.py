@@ -0,0 +1,334 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import aio_pika
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from access_events.service import LOCAL_ZONE, AccessEventService
+from user_logs.service import UserLogService
+from user_logs.schemas import UserLogEnterCreate, UserLogExitCreate
+from user_logs.state_cache import UserLogStateCache
+from core.config import settings
+from core.utils.db_helper import db_helper
+from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from .autoscaler import Autoscaler
+from .known_users import KnownUsers
+from .partitioner import PartitionedConsumer
+from .schemas import Event, EnterEvent, ExitEvent
+
+
+state_cache = UserLogStateCache(
+    max_entries=settings.rabbit.state_cache_size,
+    ttl=settings.rabbit.state_cache_ttl,
+)
+
+
+known_users = KnownUsers()
+
+
+async def warm_state_cache():
+    async with db_helper.session_factory() as session:
+        states = await UserLogService(session=session).load_log_states(limit=state_cache.max_entries)
+    state_cache.put_many(states)
+    print(f"[Consumer] State cache warmed with {len(states)} users")
+
+
+async def process_event(event: Event):
+    async with db_helper.session_factory() as session:
+        service = UserLogService(session=session)
+        if event.camera_type == "enter":
+            enter_event = EnterEvent(user_id=event.user_id , enter_time=event.time)
+            await service.enter(user_id=enter_event.user_id , enter_time=enter_event.enter_time)
+        elif event.camera_type == "exit":
+            exit_event = ExitEvent(user_id=event.user_id ,  exit_time=event.time)
+            await service.exit(user_id=exit_event.user_id , exit_time=exit_event.exit_time)
+        else:
+            print(f"[Consumer] Unknown camera_type: {event.camera_type}")
+
+
+def raw_event(event: Event) -> dict:
+    return {
+        "device_ip": event.device_ip,
+        "serial_no": event.serial_no,
+        "event_time": event.time,
+        "user_id": event.user_id,
+        "camera_type": event.camera_type,
+    }
+
+
+def only_new(events: list[Event], new: list[tuple[str | None, datetime]]) -> list[Event]:
+    """The ``events`` that ``AccessEventService.record`` stored for the first time, in order."""
+    remaining = Counter(new)
+    kept = []
+    for event in events:
+        key = (event.user_id, event.time)
+        if remaining[key]:
+            remaining[key] -= 1
+            kept.append(event)
+    return kept
+
+
+async def record_events(events: list[Event]) -> list[Event] | None:
+    """Keep every received event in access_events, whatever happens to it next.
+
+    Returns the events that were not stored yet, or None if they could not be stored.
+    """
+    async with db_helper.session_factory() as session:
+        try:
+            new = await AccessEventService(session=session).record([raw_event(event) for event in events])
+        except SQLAlchemyError as e:
+            await session.rollback()
+            print(f"[Consumer] Could not record {len(events)} raw events: {e}")
+            return None
+    return only_new(events, new)
+
+
+async def apply_late_events(events: list[Event]):
+    """Events behind the reorder watermark, mostly backfilled ones: store them and rebuild.
+
+    Applied one by one they would be out of order with the logs already written,
+    so the affected users' logs are rebuilt from access_events instead, from the
+    day before the earliest new event (its open log may have been entered then)
+    through the day after the latest, or through the users' latest stored event
+    if that is later (a log entered on a late day may be closed days after).
+    The events are stored and the logs rebuilt in one transaction, so a rebuild
+    never runs on a store that is missing the events that triggered it.
+    Repeats are skipped by the raw store and trigger nothing. Events older than
+    ``late_rebuild_days`` are only stored; rebuild those days by hand with
+    ``access_events.rebuild``.
+    """
+    async with db_helper.session_factory() as session:
+        service = AccessEventService(session=session)
+        try:
+            new = await service.record([raw_event(event) for event in events], commit=False)
+            if settings.rabbit.late_rebuild_days:
+                oldest = datetime.now(timezone.utc) - timedelta(days=settings.rabbit.late_rebuild_days)
+                new = [(user_id, time) for user_id, time in new if user_id is not None and time >= oldest]
+            else:
+                new = []
+            if not new:
+                await session.commit()
+                return
+            user_ids = sorted({user_id for user_id, _ in new})
+            days = [time.astimezone(LOCAL_ZONE).date() for _, time in new]
+            latest = (await service.latest_event_time(user_ids)).astimezone(LOCAL_ZONE).date()
+            # Both ends are local days; the end is exclusive.
+            start = min(days) - timedelta(days=1)
+            end = max(max(days) + timedelta(days=1), latest) + timedelta(days=1)
+            result = await service.rebuild_user_logs(start, end, user_ids=user_ids)
+        except SQLAlchemyError as e:
+            await session.rollback()
+            print(f"[Consumer] Could not store {len(events)} late events and rebuild their users' logs: {e}")
+            return
+    state_cache.invalidate(user_ids)
+    print(f"[Consumer] Rebuilt user_logs of {len(user_ids)} users from {start} to {end} after {len(new)} late events: {result}")
+
+
+def user_log_items(events: list[Event]) -> list[UserLogEnterCreate | UserLogExitCreate]:
+    if settings.rabbit.known_users_filter:
+        events = known_users.filter(events)
+    items = []
+    for event in events:
+        if event.camera_type == "enter":
+            items.append(UserLogEnterCreate(user_id=event.user_id, enter_time=event.time))
+        elif event.camera_type == "exit":
+            items.append(UserLogExitCreate(user_id=event.user_id, exit_time=event.time))
+        else:
+            print(f"[Consumer] Unknown camera_type: {event.camera_type}")
+    return items
+
+
+async def process_events(events: list[Event]):
+    """Apply a micro-batch in one transaction, falling back to one event at a time.
+
+    With ``raw_events`` the batch is stored in access_events in the same
+    transaction, and only the events stored for the first time are applied.
+    Repeats (redeliveries, spool replays, backfill of what the live stream
+    delivered) were applied when they first came; after a restart, with the
+    reorder watermarks and state cache empty, a repeated enter could otherwise
+    open a second log.
+
+    The fallback keeps a single bad event (e.g. an unknown user_id violating the
+    foreign key) from failing the whole batch.
+    """
+    async with db_helper.session_factory() as session:
+        try:
+            new_events = events
+            if settings.rabbit.raw_events:
+                new = await AccessEventService(session=session).record(
+                    [raw_event(event) for event in events], commit=False
+                )
+                new_events = only_new(events, new)
+            items = user_log_items(new_events)
+            if items:
+                await UserLogService(session=session).apply_events(items, cache=state_cache)
+            else:
+                await session.commit()
+            return
+        except SQLAlchemyError as e:
+            await session.rollback()
+            print(f"[Consumer] Batch of {len(events)} events failed ({e}), applying them one by one")
+
+    if settings.rabbit.raw_events:
+        # Unless the raw store itself fails: then everything is applied, as without it.
+        new_events = await record_events(events)
+        if new_events is not None:
+            events = new_events
+    if settings.rabbit.known_users_filter:
+        events = known_users.filter(events)
+    # The one-by-one path writes around the cache.
+    state_cache.invalidate(event.user_id for event in events)
+    for event in events:
+        try:
+            await process_event(event)
+        except Exception as e:
+            print(f"[Consumer] Error processing event {event}: {e}")
+
+
+def consumed_queue() -> tuple[str, list[str]]:
+    """Name and binding keys of the queue this consumer reads: its hash partition's, if partitioned."""
+    partitions, partition = settings.rabbit.partitions, settings.rabbit.partition
+    if not partitions:
+        return settings.rabbit.queue_name, settings.rabbit.bindings
+    if not settings.rabbit.exchange:
+        raise ValueError("APP_CONFIG__RABBIT__PARTITIONS needs APP_CONFIG__RABBIT__EXCHANGE")
+    if not 0 <= partition < partitions:
+        raise ValueError(f"APP_CONFIG__RABBIT__PARTITION must be in 0..{partitions - 1}, got {partition}")
+    return f"{settings.rabbit.queue_name}.{partition}", [f"*.*.*.{partition}"]
+
+
+async def report_stats(interval: float, **sources):
+    """Periodically log the stats of the running consumer's parts."""
+    while True:
+        await asyncio.sleep(interval)
+        for name, source in sources.items():
+            if source is not None:
+                print(f"[Consumer] Stats {name}: {source.stats()}")
+
+
+async def main(stop: asyncio.Event | None = None):
+    """Consume until ``stop`` is set, then shut down gracefully.
+
+    Shutdown cancels the subscription so no new messages arrive, lets the
+    workers finish and ack everything already delivered (bounded by
+    ``drain_timeout``), and only then closes the connection; unacked messages
+    go back to the queue for another replica.
+    """
+    stop = stop or asyncio.Event()
+    queue_name, bindings = consumed_queue()
+    if settings.rabbit.state_cache_size:
+        await warm_state_cache()
+    listener = None
+    if settings.rabbit.known_users_filter:
+        await known_users.load()
+        dsn = make_url(str(settings.db.url)).set(drivername="postgresql").render_as_string(hide_password=False)
+        listener = asyncio.create_task(known_users.listen(dsn, settings.rabbit.known_users_retry))
+    connection = await aio_pika.connect_robust(settings.rabbit.url)
+    consumer = PartitionedConsumer(
+        handler=process_events,
+        workers=settings.rabbit.workers,
+        batch_size=settings.rabbit.batch_size,
+        batch_window=settings.rabbit.batch_window,
+        reorder_delay=settings.rabbit.reorder_delay,
+        # Late events are stored and their users' logs rebuilt from the raw store.
+        on_dropped=apply_late_events if settings.rabbit.raw_events else None,
+        concurrency=settings.rabbit.min_workers if settings.rabbit.autoscale else None,
+    )
+    consumer.start()
+    autoscaler = None
+    autoscaling = None
+    reporting = None
+    try:
+        async with connection:
+            channel = await connection.channel()
+            await channel.set_qos(prefetch_count=settings.rabbit.prefetch_count)
+
+            queue = await channel.declare_queue(queue_name, durable=True)
+            if settings.rabbit.exchange:
+                exchange = await channel.declare_exchange(
+                    settings.rabbit.exchange, aio_pika.ExchangeType.TOPIC, durable=True
+                )
+                for binding in bindings:
+                    await queue.bind(exchange, routing_key=binding)
+            consumer_tag = await queue.consume(consumer.on_message)
+
+            if settings.rabbit.autoscale:
+                # Own channels: a failed passive declare closes its channel, not the consuming one.
+                autoscaler = Autoscaler(
+                    consumer,
+                    connection,
+                    queue_name,
+                    min_workers=settings.rabbit.min_workers,
+                    max_workers=settings.rabbit.workers,
+                    min_batch_size=settings.rabbit.min_batch_size,
+                    max_batch_size=settings.rabbit.batch_size,
+                    batch_window=settings.rabbit.batch_window,
+                    scale_up_depth=settings.rabbit.scale_up_depth,
+                    catch_up_depth=settings.rabbit.catch_up_depth,
+                    catch_up_batch_size=settings.rabbit.catch_up_batch_size,
+                    max_lag=settings.rabbit.max_lag,
+                    interval=settings.rabbit.autoscale_interval,
+                )
+                autoscaling = asyncio.create_task(autoscaler.run())
+
+            if settings.rabbit.stats_interval:
+                reporting = asyncio.create_task(report_stats(
+                    settings.rabbit.stats_interval,
+                    consumer=consumer,
+                    state_cache=state_cache if settings.rabbit.state_cache_size else None,
+                    known_users=known_users if settings.rabbit.known_users_filter else None,
+                    autoscaler=autoscaler,
+                ))
+
+            print(
+                f"[Consumer] Waiting for messages on {queue_name} "
+                f"({', '.join(bindings) if settings.rabbit.exchange else 'no exchange'}) "
+                f"with {settings.rabbit.workers} workers..."
+            )
+            await stop.wait()
+
+            print("[Consumer] Stopping: no new deliveries, draining in-flight events...")
+            await queue.cancel(consumer_tag)
+            if autoscaling is not None:
+                autoscaling.cancel()
+                await asyncio.gather(autoscaling, return_exceptions=True)
+                # Drain with everything available.
+                await consumer.concurrency.set_limit(settings.rabbit.workers)
+            await consumer.drain(settings.rabbit.drain_timeout)
+            print(f"[Consumer] Drained: {consumer.stats()}, state cache: {state_cache.stats()}")
+            print(f"[Consumer] Known users: {known_users.stats()}")
+            if autoscaler is not None:
+                print(f"[Consumer] Autoscaler: {autoscaler.stats()}")
+    finally:
+        if reporting is not None:
+            reporting.cancel()
+        if autoscaling is not None:
+            autoscaling.cancel()
+        await consumer.stop()
+        if listener is not None:
+            listener.cancel()
+            await asyncio.gather(listener, return_exceptions=True)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if not settings.rabbit.consume_in_api:
+        print("[Lifespan] Ingestion disabled; run the consumer service instead.")
+        yield
+        return
+
+    stop = asyncio.Event()
+    task = asyncio.create_task(main(stop))
+    print("[Lifespan] RabbitMQ consumer started.")
+        
+    try:
+        yield
+    finally:
+        stop.set()
+        try:
+            await task
+        except Exception as e:
+            print(f"[Lifespan] RabbitMQ consumer failed: {e}")
+        print("[Lifespan] RabbitMQ consumer stopped.")
@@ -0,0 +1,306 @@
+import asyncio
+import zlib
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+import aio_pika
+from pydantic import ValidationError
+
+from . import envelope
+from .reorder import ReorderBuffer
+from .schemas import Event
+
+
+Handler = Callable[[list[Event]], Awaitable[None]]
+
+
+def partition_for(user_id: str | None, partitions: int) -> int:
+    """Stable partition of a user; crc32 so it does not change between processes."""
+    return zlib.crc32((user_id or "").encode()) % partitions
+
+
+class Delivery:
+    """An AMQP message and how many of its events are still being processed."""
+
+    __slots__ = ("message", "remaining")
+
+    def __init__(self, message: aio_pika.abc.AbstractIncomingMessage, events: int):
+        self.message = message
+        self.remaining = events
+
+
+def decode_message(message: aio_pika.abc.AbstractIncomingMessage) -> tuple[list[Event], list[str]]:
+    """Events of a message: a binary envelope, or a single JSON event.
+
+    Each event of an envelope is validated on its own; the errors of the
+    invalid ones are returned instead, so they do not cost the others.
+    """
+    if message.content_type != envelope.CONTENT_TYPE:
+        return [Event.model_validate_json(message.body)], []
+    events = []
+    errors = []
+    for data in envelope.decode(message.body):
+        try:
+            events.append(
+                Event(
+                    user_id=data["user_id"],
+                    time=data["time"],
+                    camera_type=data["camera_type"],
+                    device_ip=data["device_ip"],
+                    serial_no=data["serial_no"],
+                )
+            )
+        except ValidationError as e:
+            errors.append(f"{data['device_ip']} #{data['serial_no']}: {e}")
+    return events, errors
+
+
+class ConcurrencyLimit:
+    """Semaphore whose limit can be changed while it is in use."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._changed = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+
+    async def __aexit__(self, *exc):
+        async with self._changed:
+            self.active -= 1
+            self._changed.notify_all()
+
+    async def set_limit(self, limit: int):
+        async with self._changed:
+            self.limit = limit
+            self._changed.notify_all()
+
+
+class PartitionedConsumer:
+    """Process messages on ``workers`` async workers, partitioned by ``user_id``.
+
+    A message is a single JSON event or a binary envelope of many (see
+    ``envelope``); its events are spread over the partitions and the message is
+    acked once the last of them was handled.
+
+    Every worker owns a FIFO queue and handles its messages one after another,
+    so events of one person are applied strictly in delivery order while
+    different people are processed in parallel.
+
+    Workers hand their events to the handler in micro-batches: whatever is
+    queued, topped up for at most ``batch_window`` seconds, up to
+    ``batch_size`` events. Messages are acked only after the handler returned,
+    i.e. after the batch's transaction was committed. With manual acks the
+    broker never has more than ``prefetch_count`` unacknowledged messages out,
+    which bounds the worker queues.
+
+    With ``reorder_delay`` every worker first passes its events through a
+    ``ReorderBuffer``, so each user's events reach the handler in device time
+    order even if they were delivered out of order. Held messages stay unacked,
+    so ``prefetch_count`` must cover ``reorder_delay`` seconds of traffic.
+    Events that arrive behind the watermark (e.g. backfilled ones) are not
+    applied; ``on_dropped`` still gets them, to keep a record.
+
+    ``workers`` is the number of partitions and never changes, so a user always
+    maps to the same worker; ``concurrency`` bounds how many of them run the
+    handler at once. ``concurrency``, ``batch_size`` and ``batch_window`` may be
+    changed while running (see ``Autoscaler``).
+    """
+
+    def __init__(
+        self,
+        handler: Handler,
+        workers: int = 16,
+        batch_size: int = 100,
+        batch_window: float = 0.005,
+        reorder_delay: float = 0.0,
+        on_dropped: Handler | None = None,
+        concurrency: int | None = None,
+    ):
+        self.handler = handler
+        self.on_dropped = on_dropped
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.concurrency = ConcurrencyLimit(concurrency or workers)
+        self.queues: list[asyncio.Queue] = [asyncio.Queue() for _ in range(workers)]
+        self.buffers: list[ReorderBuffer] | None = (
+            [ReorderBuffer(reorder_delay) for _ in range(workers)] if reorder_delay > 0 else None
+        )
+        self._tasks: list[asyncio.Task] = []
+        self.processed = 0
+        self.failed = 0
+        self.invalid = 0
+        self.batches = 0
+        self.messages = 0
+        self.events = 0
+        # Seconds between an event's device time and its batch being handled, latest batch.
+        self.lag: float | None = None
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self._work(queue, self.buffers[index] if self.buffers else None))
+            for index, queue in enumerate(self.queues)
+        ]
+
+    async def drain(self, timeout: float):
+        """Wait until every queued event has been processed and acked."""
+        try:
+            await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in self.queues)), timeout)
+        except asyncio.TimeoutError:
+            left = sum(queue.qsize() for queue in self.queues)
+            print(f"[Consumer] Drain timed out with {left} events queued; they will be redelivered")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def on_message(self, message: aio_pika.abc.AbstractIncomingMessage):
+        # No await before put_nowait: messages reach the worker queues in delivery order.
+        try:
+            events, errors = decode_message(message)
+        except (ValidationError, envelope.EnvelopeError) as e:
+            self.invalid += 1
+            print(f"[Consumer] Dropping malformed message: {e}")
+            await message.ack()
+            return
+        if errors:
+            self.invalid += len(errors)
+            print(f"[Consumer] Dropping {len(errors)} invalid events of an envelope, keeping {len(events)}: {errors[0]}")
+        if not events:
+            await message.ack()
+            return
+        self.messages += 1
+        self.events += len(events)
+        delivery = Delivery(message, len(events))
+        for event in events:
+            self.queues[partition_for(event.user_id, len(self.queues))].put_nowait((delivery, event))
+
+    async def _next_batch(self, queue: asyncio.Queue) -> list:
+        batch = [await queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.batch_window
+        while len(batch) < self.batch_size:
+            if queue.empty():
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            else:
+                batch.append(queue.get_nowait())
+        return batch
+
+    async def _next_reordered(self, queue: asyncio.Queue, buffer: ReorderBuffer) -> list:
+        loop = asyncio.get_running_loop()
+        while True:
+            released = buffer.release(loop.time(), self.batch_size)
+            if released:
+                return released
+            deadline = buffer.next_deadline()
+            try:
+                if deadline is None:
+                    item = await queue.get()
+                else:
+                    item = await asyncio.wait_for(queue.get(), max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                continue
+            items = [item]
+            while not queue.empty():
+                items.append(queue.get_nowait())
+            dropped = []
+            for delivery, event in items:
+                try:
+                    accepted = buffer.add((delivery, event), event, loop.time())
+                except Exception as e:
+                    # One bad event must not take the partition down: log it and ack it.
+                    self.invalid += 1
+                    print(f"[Consumer] Dropping event {event}: {e!r}")
+                    await self._ack(queue, delivery)
+                    continue
+                if not accepted:
+                    dropped.append((delivery, event))
+            if dropped:
+                print(f"[Consumer] Dropping {len(dropped)} events behind the reorder watermark")
+                if self.on_dropped is not None:
+                    try:
+                        await self.on_dropped([event for _, event in dropped])
+                    except Exception as e:
+                        print(f"[Consumer] Error handling dropped events: {e}")
+                for delivery, _ in dropped:
+                    await self._ack(queue, delivery)
+
+    async def _ack(self, queue: asyncio.Queue, delivery: Delivery):
+        """Ack the message once its last event was handled."""
+        delivery.remaining -= 1
+        try:
+            if delivery.remaining == 0:
+                await delivery.message.ack()
+        except aio_pika.exceptions.AMQPError as e:
+            # The channel was lost; the broker redelivers the message.
+            print(f"[Consumer] Could not ack message: {e}")
+        finally:
+            queue.task_done()
+
+    async def _work(self, queue: asyncio.Queue, buffer: ReorderBuffer | None = None):
+        while True:
+            try:
+                if buffer is None:
+                    batch = await self._next_batch(queue)
+                else:
+                    batch = await self._next_reordered(queue, buffer)
+            except Exception as e:
+                # Keep the worker: a dead one would stall its partition with every message unacked.
+                print(f"[Consumer] Error reading the partition queue: {e!r}")
+                await asyncio.sleep(1)
+                continue
+            async with self.concurrency:
+                if buffer is None:
+                    # Whatever queued up while waiting for a slot rides along.
+                    while len(batch) < self.batch_size and not queue.empty():
+                        batch.append(queue.get_nowait())
+                events = [event for _, event in batch]
+                try:
+                    await self.handler(events)
+                    self.processed += len(events)
+                except Exception as e:
+                    self.failed += len(events)
+                    print(f"[Consumer] Error processing batch of {len(events)} events: {e}")
+            self.batches += 1
+            self._measure_lag(events)
+            # Same as before: a failed event is logged and acked, not redelivered forever.
+            for delivery, _ in batch:
+                await self._ack(queue, delivery)
+
+    def _measure_lag(self, events: list[Event]):
+        newest = max((event.time for event in events if event.time.tzinfo is not None), default=None)
+        if newest is not None:
+            self.lag = (datetime.now(timezone.utc) - newest).total_seconds()
+
+    def queued(self) -> int:
+        """Events delivered but not handled yet, held ones included."""
+        return sum(queue.qsize() for queue in self.queues) + sum(len(buffer) for buffer in self.buffers or ())
+
+    def stats(self) -> dict:
+        return {
+            "processed": self.processed,
+            "failed": self.failed,
+            "invalid": self.invalid,
+            "batches": self.batches,
+            "queued": [queue.qsize() for queue in self.queues],
+            "reorder": self.reorder_stats(),
+        }
+
+    def reorder_stats(self) -> dict | None:
+        if self.buffers is None:
+            return None
+        totals = {"held": 0, "late": 0, "dropped": 0, "released": 0}
+        for buffer in self.buffers:
+            for key, value in buffer.stats().items():
+                totals[key] += value
+        return totals
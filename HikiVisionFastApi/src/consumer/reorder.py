@@ -0,0 +1,87 @@
+import heapq
+import itertools
+from collections import OrderedDict
+from datetime import datetime
+
+from .schemas import Event
+
+
+class ReorderBuffer:
+    """Per-user buffer that puts a user's events back in device ``dateTime`` order.
+
+    Cameras, network jitter and the connection service's spool can deliver an
+    exit before the enter it closes. Every event is held for ``delay`` seconds
+    after it arrived; a user's events leave the buffer oldest ``time`` first, and
+    only once the oldest one has been held long enough, so anything that arrives
+    up to ``delay`` seconds out of order is put back in place.
+
+    The watermark of a user is the ``time`` of their last released event. An
+    event older than that arrived too late to be reordered: it is dropped rather
+    than applied out of order. Watermarks are kept for the ``max_users`` most
+    recently seen users.
+    """
+
+    def __init__(self, delay: float, max_users: int = 100_000):
+        self.delay = delay
+        self.max_users = max_users
+        self._held: dict[str, list] = {}
+        self._watermarks: OrderedDict[str, datetime] = OrderedDict()
+        self._latest: dict[str, datetime] = {}
+        self._seq = itertools.count()
+        self.held = 0
+        self.late = 0
+        self.dropped = 0
+        self.released = 0
+
+    def __len__(self):
+        return self.held
+
+    def add(self, item, event: Event, now: float) -> bool:
+        """Hold ``item``; False if ``event`` is behind its user's watermark and must be dropped."""
+        user_id = event.user_id or ""
+        watermark = self._watermarks.get(user_id)
+        if watermark is not None and event.time < watermark:
+            self.dropped += 1
+            return False
+        latest = self._latest.get(user_id)
+        if latest is not None and event.time < latest:
+            # Out of order, but still in time to be reordered.
+            self.late += 1
+        if latest is None or event.time > latest:
+            self._latest[user_id] = event.time
+        heapq.heappush(self._held.setdefault(user_id, []), (event.time, next(self._seq), now, item))
+        self.held += 1
+        return True
+
+    def next_deadline(self) -> float | None:
+        """When the next held event may be released, or None if nothing is held."""
+        return min((held[0][2] + self.delay for held in self._held.values()), default=None)
+
+    def release(self, now: float, limit: int) -> list:
+        """Up to ``limit`` items whose hold expired, each user's in event time order."""
+        released = []
+        for user_id in list(self._held):
+            held = self._held[user_id]
+            while held and held[0][2] + self.delay <= now and len(released) < limit:
+                event_time, _, _, item = heapq.heappop(held)
+                released.append(item)
+                self._watermarks[user_id] = event_time
+                self._watermarks.move_to_end(user_id)
+            if not held:
+                del self._held[user_id]
+                del self._latest[user_id]
+            if len(released) >= limit:
+                break
+        self.held -= len(released)
+        self.released += len(released)
+        while len(self._watermarks) > self.max_users:
+            self._watermarks.popitem(last=False)
+        return released
+
+    def stats(self) -> dict:
+        return {
+            "held": self.held,
+            "late": self.late,
+            "dropped": self.dropped,
+            "released": self.released,
+        }
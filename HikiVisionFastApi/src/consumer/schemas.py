@@ -0,0 +1,32 @@
+from pydantic import BaseModel, field_validator
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from core.models.user_logs import LOCAL_TIMEZONE
+
+
+LOCAL_ZONE = ZoneInfo(LOCAL_TIMEZONE)
+
+
+class Event(BaseModel):
+    user_id: str | None = None
+    time: datetime
+    camera_type: str
+    device_ip: str | None = None
+    serial_no: int | None = None
+
+    @field_validator("time")
+    @classmethod
+    def site_time(cls, value: datetime) -> datetime:
+        # A device clock without an offset is in site time; naive and aware times do not compare.
+        return value if value.tzinfo is not None else value.replace(tzinfo=LOCAL_ZONE)
+
+
+class EnterEvent(BaseModel):
+    user_id: str | None = None
+    enter_time: datetime
+
+
+class ExitEvent(BaseModel):
+    user_id: str | None = None
+    exit_time: datetime
@@ -4,6 +4,7 @@ __all__ = (
     "Role",
     "UserLog",
     "UserInfo",
+    "AccessEvent",
     
 )
 
@@ -13,4 +14,5 @@ from .user import User
 from .role import Role
 from .user_info import UserInfo
 from .user_logs import UserLog
+from .access_event import AccessEvent
 
@@ -0,0 +1,34 @@
+from .base import Base
+from sqlalchemy.orm import Mapped , mapped_column
+from datetime import datetime
+from sqlalchemy import BigInteger , DateTime , Identity , Index , PrimaryKeyConstraint , String , UniqueConstraint , func
+
+
+# Append-only record of every event the consumer received, partitioned by month of
+# event_time (see access_events.service). No foreign key on user_id: events of
+# unknown users are kept too.
+class AccessEvent(Base):
+
+    id: Mapped[int] = mapped_column(BigInteger, Identity())
+    device_ip: Mapped[str | None] = mapped_column(String, nullable=True)
+    serial_no: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    event_time: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    user_id: Mapped[str | None] = mapped_column(String, nullable=True)
+    camera_type: Mapped[str] = mapped_column(String)
+    received_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # Unique keys of a partitioned table must contain the partition key.
+        PrimaryKeyConstraint("id", "event_time"),
+        # Dedupe key of redelivered, replayed and backfilled events. NULLS NOT DISTINCT:
+        # events without a serial (or device) are repeats too; user_id tells apart
+        # different people on a serial-less device in the same second.
+        UniqueConstraint(
+            "device_ip", "serial_no", "event_time", "user_id",
+            name="uq_access_events_event",
+            postgresql_nulls_not_distinct=True,
+        ),
+        # A user's events in a time range: the late-event rebuild.
+        Index("ix_access_events_user_id_event_time", "user_id", "event_time"),
+        {"postgresql_partition_by": "RANGE (event_time)"},
+    )
@@ -2,7 +2,7 @@ from .base import Base
 from .mixins.int_id_pk import IntIdPkMixin
 from sqlalchemy.orm import Mapped , mapped_column , relationship
 from datetime import datetime 
-from sqlalchemy import DateTime , ForeignKey 
+from sqlalchemy import DateTime , ForeignKey , Date , Index , cast , func , literal_column
 
 
 from typing import TYPE_CHECKING
@@ -11,6 +11,16 @@ if TYPE_CHECKING:
     from .user import User
 
 
+# Attendance days are counted in the sites' local time.
+LOCAL_TIMEZONE = "Asia/Tashkent"
+
+
+def local_day(value):
+    """Local calendar day of a timestamptz column or value, as SQL."""
+    # A literal zone, not a bind parameter: ON CONFLICT must match the index expression.
+    return cast(func.timezone(literal_column(f"'{LOCAL_TIMEZONE}'"), value), Date)
+
+
 
 class UserLog(Base , IntIdPkMixin):
     
@@ -20,6 +30,24 @@ class UserLog(Base , IntIdPkMixin):
     
     
     user: Mapped["User"] = relationship("User" , back_populates="user_logs")
-    
-    
 
+
+# At most one open log per user per local day; lets enters be a single INSERT ... ON CONFLICT.
+Index(
+    "uq_user_logs_user_id_open_day",
+    UserLog.user_id,
+    local_day(UserLog.enter_time),
+    unique=True,
+    postgresql_where=UserLog.exit_time.is_(None),
+)
+
+# Hot query paths; built CONCURRENTLY by migration e27c5a9d4b13.
+Index("ix_user_logs_user_id_enter_time", UserLog.user_id, UserLog.enter_time.desc())
+Index(
+    "ix_user_logs_user_id_open",
+    UserLog.user_id,
+    UserLog.enter_time.desc(),
+    postgresql_where=UserLog.exit_time.is_(None),
+)
+Index("ix_user_logs_enter_time", UserLog.enter_time)
+Index("ix_user_logs_exit_time", UserLog.exit_time)
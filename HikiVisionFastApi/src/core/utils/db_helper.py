@@ -22,6 +22,7 @@ class DatabaseHelper:
         echo_pool: bool = False,
         pool_size: int = 5,
         max_overflow: int = 10,
+        pool_pre_ping: bool = True,
     ) -> None:
 
         self.engine: AsyncEngine = create_async_engine(
@@ -30,6 +31,8 @@ class DatabaseHelper:
             echo_pool=echo_pool,
             pool_size=pool_size,
             max_overflow=max_overflow,
+            # Long-lived consumers outlive database restarts; test connections before use.
+            pool_pre_ping=pool_pre_ping,
         )
 
         self.session_factory: async_sessionmaker[AsyncSession] = async_sessionmaker(
@@ -54,6 +57,7 @@ db_helper = DatabaseHelper(
     echo_pool=settings.db.echo_pool,
     pool_size=settings.db.pool_size,
     max_overflow=settings.db.max_overflow,
+    pool_pre_ping=settings.db.pool_pre_ping,
 )
 
 
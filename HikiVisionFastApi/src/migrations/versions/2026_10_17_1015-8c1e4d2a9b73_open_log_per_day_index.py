@@ -0,0 +1,96 @@
+"""One open user log per user per day
+
+Revision ID: 8c1e4d2a9b73
+Revises: 3fa54ddb480f
+Create Date: 2026-10-17 10:15:08.214731
+
+Existing duplicates (several open logs of one user on the same local day) are
+closed first, keeping the earliest one open, so that the unique index can be
+built. Closed duplicates get ``exit_time = enter_time``.
+
+The index is built with CREATE INDEX CONCURRENTLY, outside the migration
+transaction, so the consumer keeps writing while it builds. Duplicates written
+after the cleanup stop the upgrade with the offending users and days instead
+of a unique violation; close them and run the upgrade again. An interrupted
+build leaves an INVALID index behind; drop it and run the upgrade again.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1e4d2a9b73'
+down_revision: Union[str, Sequence[str], None] = '3fa54ddb480f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+LOCAL_DAY = "CAST(timezone('Asia/Tashkent', enter_time) AS DATE)"
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        f"""
+        UPDATE user_logs SET exit_time = enter_time
+        WHERE id IN (
+            SELECT id FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY user_id, {LOCAL_DAY} ORDER BY enter_time, id
+                ) AS n
+                FROM user_logs
+                WHERE exit_time IS NULL AND enter_time IS NOT NULL
+            ) AS open_logs
+            WHERE n > 1
+        )
+        """
+    )
+    with op.get_context().autocommit_block():
+        check_no_duplicates()
+        try:
+            op.create_index(
+                'uq_user_logs_user_id_open_day',
+                'user_logs',
+                ['user_id', sa.text(LOCAL_DAY)],
+                unique=True,
+                postgresql_where=sa.text('exit_time IS NULL'),
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+        except sa.exc.IntegrityError:
+            # A duplicate written during the build; the failed build left an INVALID index.
+            op.drop_index(
+                'uq_user_logs_user_id_open_day', table_name='user_logs', postgresql_concurrently=True, if_exists=True
+            )
+            check_no_duplicates()
+            raise
+
+
+def check_no_duplicates() -> None:
+    duplicates = op.get_bind().execute(sa.text(
+        f"""
+        SELECT user_id, {LOCAL_DAY} AS day, count(*) AS open_logs
+        FROM user_logs
+        WHERE exit_time IS NULL AND enter_time IS NOT NULL
+        GROUP BY user_id, day
+        HAVING count(*) > 1
+        ORDER BY user_id, day
+        LIMIT 20
+        """
+    )).all()
+    if duplicates:
+        raise RuntimeError(
+            "user_logs has several open logs of one user on one local day (user_id, day, open logs): "
+            + ", ".join(f"({row.user_id}, {row.day}, {row.open_logs})" for row in duplicates)
+            + "; close all but one of each and run the upgrade again"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'uq_user_logs_user_id_open_day', table_name='user_logs', postgresql_concurrently=True, if_exists=True
+        )
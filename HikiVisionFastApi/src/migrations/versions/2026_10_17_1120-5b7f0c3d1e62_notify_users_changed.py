@@ -0,0 +1,54 @@
+"""Notify users_changed on user inserts and deletes
+
+Revision ID: 5b7f0c3d1e62
+Revises: 8c1e4d2a9b73
+Create Date: 2026-10-17 11:20:41.582903
+
+The consumer keeps the set of user ids in memory and LISTENs on the
+``users_changed`` channel to keep it current. Payloads are ``INSERT:<id>`` or
+``DELETE:<id>``; a changed id is sent as a delete of the old and an insert of
+the new one.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7f0c3d1e62'
+down_revision: Union[str, Sequence[str], None] = '8c1e4d2a9b73'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(
+        """
+        CREATE FUNCTION notify_users_changed() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('DELETE', 'UPDATE') THEN
+                PERFORM pg_notify('users_changed', 'DELETE:' || OLD.id);
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                PERFORM pg_notify('users_changed', 'INSERT:' || NEW.id);
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER users_changed
+        AFTER INSERT OR DELETE OR UPDATE OF id ON users
+        FOR EACH ROW EXECUTE FUNCTION notify_users_changed()
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER users_changed ON users")
+    op.execute("DROP FUNCTION notify_users_changed()")
@@ -0,0 +1,42 @@
+"""Add access events
+
+Revision ID: a41d9e6c27f8
+Revises: 5b7f0c3d1e62
+Create Date: 2026-10-17 13:05:19.604117
+
+Only the partitioned parent is created here; monthly partitions are created on
+demand by ``AccessEventService.ensure_partitions``.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a41d9e6c27f8'
+down_revision: Union[str, Sequence[str], None] = '5b7f0c3d1e62'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('access_events',
+    sa.Column('id', sa.BigInteger(), sa.Identity(always=False), nullable=False),
+    sa.Column('device_ip', sa.String(), nullable=True),
+    sa.Column('serial_no', sa.BigInteger(), nullable=True),
+    sa.Column('event_time', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('user_id', sa.String(), nullable=True),
+    sa.Column('camera_type', sa.String(), nullable=False),
+    sa.Column('received_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id', 'event_time', name=op.f('pk_access_events')),
+    sa.UniqueConstraint('device_ip', 'serial_no', 'event_time', name=op.f('uq_access_events_device_ip_serial_no_event_time')),
+    postgresql_partition_by='RANGE (event_time)'
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Drops the partitions too.
+    op.drop_table('access_events')
@@ -0,0 +1,75 @@
+"""Indexes for the user_logs hot queries
+
+Revision ID: e27c5a9d4b13
+Revises: a41d9e6c27f8
+Create Date: 2026-10-17 14:50:42.318906
+
+Built with CREATE INDEX CONCURRENTLY, outside the migration transaction, so the
+consumer keeps writing while they build. An interrupted build leaves an INVALID
+index behind; drop it and run the upgrade again.
+
+- ``(user_id, enter_time DESC)``: the latest log of a user, DISTINCT ON per
+  user, and a user's logs in a time range;
+- ``(user_id, enter_time DESC) WHERE exit_time IS NULL``: the newest open log
+  an exit closes;
+- ``enter_time`` and ``exit_time``: the date filters of the list and reports.
+
+Check the plans with ``python -m user_logs.explain_check``.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e27c5a9d4b13'
+down_revision: Union[str, Sequence[str], None] = 'a41d9e6c27f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_user_logs_user_id_enter_time',
+            'user_logs',
+            ['user_id', sa.text('enter_time DESC')],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_user_logs_user_id_open',
+            'user_logs',
+            ['user_id', sa.text('enter_time DESC')],
+            postgresql_where=sa.text('exit_time IS NULL'),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_user_logs_enter_time',
+            'user_logs',
+            ['enter_time'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            'ix_user_logs_exit_time',
+            'user_logs',
+            ['exit_time'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name in (
+            'ix_user_logs_exit_time',
+            'ix_user_logs_enter_time',
+            'ix_user_logs_user_id_open',
+            'ix_user_logs_user_id_enter_time',
+        ):
+            op.drop_index(name, table_name='user_logs', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,61 @@
+"""Access events dedupe key and user index
+
+Revision ID: 3d8b6f1a7c25
+Revises: e27c5a9d4b13
+Create Date: 2026-10-17 16:20:08.514372
+
+- The dedupe key ``(device_ip, serial_no, event_time)`` let events without a
+  serial or device through any number of times: NULLs are distinct in a
+  unique constraint. It becomes ``(device_ip, serial_no, event_time, user_id)``
+  NULLS NOT DISTINCT (Postgres 15+); repeats already stored are deleted first,
+  keeping the first one received.
+- ``(user_id, event_time)`` serves the late-event rebuild, which reads a few
+  users' events of a few days.
+
+Both are built on the partitioned parent, which builds them on every partition
+inside the migration transaction (CONCURRENTLY is not available there), so
+access_events writes wait until it is done.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d8b6f1a7c25'
+down_revision: Union[str, Sequence[str], None] = 'e27c5a9d4b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("""
+        DELETE FROM access_events AS a
+        USING access_events AS b
+        WHERE a.event_time = b.event_time
+          AND a.device_ip IS NOT DISTINCT FROM b.device_ip
+          AND a.serial_no IS NOT DISTINCT FROM b.serial_no
+          AND a.user_id IS NOT DISTINCT FROM b.user_id
+          AND a.id > b.id
+    """)
+    op.drop_constraint('uq_access_events_device_ip_serial_no_event_time', 'access_events', type_='unique')
+    op.create_unique_constraint(
+        'uq_access_events_event',
+        'access_events',
+        ['device_ip', 'serial_no', 'event_time', 'user_id'],
+        postgresql_nulls_not_distinct=True,
+    )
+    op.create_index('ix_access_events_user_id_event_time', 'access_events', ['user_id', 'event_time'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_access_events_user_id_event_time', table_name='access_events')
+    op.drop_constraint('uq_access_events_event', 'access_events', type_='unique')
+    op.create_unique_constraint(
+        'uq_access_events_device_ip_serial_no_event_time',
+        'access_events',
+        ['device_ip', 'serial_no', 'event_time'],
+    )
@@ -0,0 +1,169 @@
+"""EXPLAIN every query ``UserLogService`` issues; fail on sequential scans of big tables.
+
+The service's methods run against the configured database in one transaction
+that is rolled back at the end (their commits only release savepoints). Each
+statement is captured with its parameters and EXPLAINed. A Seq Scan of a table
+with more than ``--min-rows`` rows is a failure, unless the method reads that
+table whole anyway (the cache warm-up, the Excel export).
+
+Against a copy of production the defaults are meaningful. On a small database
+use ``--min-rows 0 --no-seqscan``: with ``enable_seqscan`` off the planner only
+scans sequentially when no index can serve the query.
+
+    python -m user_logs.explain_check [--min-rows 10000] [--no-seqscan]
+
+from src/; exits with 1 on a failure, so it can gate a deploy. The test suite
+runs the same check on an empty schema (tests/test_explain_check.py).
+"""
+import argparse
+import asyncio
+import sys
+from datetime import date, datetime, timezone
+from typing import Awaitable, Callable
+
+from sqlalchemy import event, select, text
+from sqlalchemy.engine.interfaces import ExecuteStyle
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, AsyncSession
+
+from core.models import User, UserLog
+from core.utils.db_helper import db_helper
+from .schemas import UserLogEnterCreate, UserLogExitCreate
+from .service import UserLogService
+
+
+STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+NOW = datetime.now(timezone.utc)
+TODAY = date.today()
+
+# (name, call, tables it may scan whole)
+CASES: list[tuple[str, Callable[[UserLogService, str], Awaitable], set[str]]] = [
+    ("enter", lambda service, user_id: service.enter(user_id, NOW), set()),
+    # After "enter": the exit closes that log (UPDATE ... FROM VALUES), the enter opens a new one.
+    (
+        "apply_events",
+        lambda service, user_id: service.apply_events([
+            UserLogExitCreate(user_id=user_id, exit_time=NOW),
+            UserLogEnterCreate(user_id=user_id, enter_time=NOW),
+        ]),
+        set(),
+    ),
+    ("exit", lambda service, user_id: service.exit(user_id, NOW), set()),
+    ("load_log_states(user_ids)", lambda service, user_id: service.load_log_states([user_id]), set()),
+    # The consumer's cache warm-up ranks every user by their latest log.
+    ("load_log_states(limit)", lambda service, user_id: service.load_log_states(limit=1000), {"user_logs"}),
+    ("create_user_logs", lambda service, user_id: service.create_user_logs(
+        UserLogEnterCreate(user_id=user_id, enter_time=NOW)
+    ), set()),
+    ("update_user_log_exit_time", lambda service, user_id: service.update_user_log_exit_time(user_id, NOW), set()),
+    ("get_user_logs_by_user_id", lambda service, user_id: service.get_user_logs_by_user_id(user_id), set()),
+    ("get_all_user_logs(enter_date)", lambda service, user_id: service.get_all_user_logs(enter_date=TODAY), set()),
+    ("get_all_user_logs(exit_date)", lambda service, user_id: service.get_all_user_logs(exit_date=TODAY), set()),
+    (
+        "get_all_user_logs(user_id, enter_date)",
+        lambda service, user_id: service.get_all_user_logs(user_id=user_id, enter_date=TODAY),
+        set(),
+    ),
+    # A full export: every user, their info and their logs.
+    (
+        "make_exel_file(filter_data)",
+        lambda service, user_id: service.make_exel_file(filter_data=TODAY),
+        {"users", "user_infos", "user_logs"},
+    ),
+]
+
+
+def seq_scans(plan: dict):
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", ()):
+        yield from seq_scans(child)
+
+
+async def table_rows(connection: AsyncConnection, table: str, cache: dict[str, float]) -> float:
+    if table not in cache:
+        rows = await connection.scalar(
+            text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+        )
+        if rows is None or rows < 0:
+            # Never analyzed: count instead.
+            rows = await connection.scalar(text(f'SELECT count(*) FROM "{table}"'))
+        cache[table] = rows
+    return cache[table]
+
+
+async def check(min_rows: float, no_seqscan: bool, engine: AsyncEngine | None = None) -> list[str]:
+    """EXPLAIN every case against ``engine`` (the configured database by default); returns the failures."""
+    engine = engine or db_helper.engine
+    captured: list[tuple[str, str, tuple]] = []
+    current = [""]
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        # A multi-row INSERT (insertmanyvalues) is one statement, though reported as executemany.
+        single = not executemany or context.execute_style is ExecuteStyle.INSERTMANYVALUES
+        if single and statement.lstrip().split(None, 1)[0].upper() in STATEMENTS:
+            captured.append((current[0], statement, parameters))
+
+    failures = []
+    async with engine.connect() as connection:
+        transaction = await connection.begin()
+        try:
+            user_id = await connection.scalar(select(UserLog.user_id).limit(1))
+            if user_id is None:
+                user_id = await connection.scalar(select(User.id).limit(1))
+            if user_id is None:
+                raise SystemExit("explain_check needs at least one user in the database")
+
+            session = AsyncSession(bind=connection, join_transaction_mode="create_savepoint", expire_on_commit=False)
+            event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+            try:
+                for name, call, _ in CASES:
+                    current[0] = name
+                    try:
+                        await call(UserLogService(session=session), user_id)
+                    except Exception as e:
+                        await session.rollback()
+                        print(f"{name}: raised {e!r}, checking the statements it issued")
+            finally:
+                event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+                await session.close()
+
+            if no_seqscan:
+                await connection.execute(text("SET LOCAL enable_seqscan = off"))
+            allowed = {name: tables for name, _, tables in CASES}
+            rows_cache: dict[str, float] = {}
+            for name, statement, parameters in captured:
+                result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+                plan = result.scalar_one()[0]["Plan"]
+                for table in dict.fromkeys(seq_scans(plan)):
+                    rows = await table_rows(connection, table, rows_cache)
+                    if table in allowed[name] or rows < min_rows:
+                        continue
+                    failures.append(f"{name}: Seq Scan on {table} ({rows:.0f} rows)\n    {' '.join(statement.split())}")
+                print(f"{name}: {plan['Node Type']}, cost {plan['Total Cost']}")
+        finally:
+            await transaction.rollback()
+    return failures
+
+
+async def run(min_rows: float, no_seqscan: bool) -> int:
+    try:
+        failures = await check(min_rows, no_seqscan)
+    finally:
+        await db_helper.dispose()
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print(f"{len(failures)} sequential scan(s) above {min_rows:.0f} rows")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN the UserLogService queries and fail on sequential scans.")
+    parser.add_argument("--min-rows", type=float, default=10_000, help="tables smaller than this may be scanned")
+    parser.add_argument("--no-seqscan", action="store_true", help="plan with enable_seqscan off")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args.min_rows, args.no_seqscan)))
+
+
+if __name__ == "__main__":
+    main()
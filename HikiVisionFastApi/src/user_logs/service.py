@@ -1,19 +1,80 @@
 from datetime import datetime , timezone , timedelta , date , time
-from sqlalchemy import select , desc , and_  , exists , not_
+from sqlalchemy import select , desc , and_  , exists , not_ , update , values , column , Integer , DateTime , func , or_ , literal
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import joinedload , selectinload
 from sqlalchemy.ext.asyncio import AsyncSession
 from openpyxl import Workbook
 from io import BytesIO
+from zoneinfo import ZoneInfo
 
 from core.utils.basic_service import BasicService
 from core.models import UserLog , User
-from .schemas import UserLogEnterCreate 
+from core.models.user_logs import LOCAL_TIMEZONE , local_day
+from .schemas import UserLogEnterCreate , UserLogExitCreate
+from .state_cache import LogState , UserLogStateCache
 
 
 
 
     
 UTC_PLUS_5 = timezone(timedelta(hours=5))
+LOCAL_ZONE = ZoneInfo(LOCAL_TIMEZONE)
+
+
+def local_date(value: datetime) -> date:
+    """Local calendar day of a time, the Python side of ``local_day``; naive times are site time."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=LOCAL_ZONE).date()
+    return value.astimezone(LOCAL_ZONE).date()
+
+def plan_events(state: LogState, events: list[UserLogEnterCreate | UserLogExitCreate]) -> tuple[list[dict], list[dict], int]:
+    """Apply one user's events to their ``state`` in place, by the rules of ``enter`` and ``exit``.
+
+    Returns the new logs, the logs closed (new ones included) and how many
+    events were rejected.
+    """
+    new_logs: list[dict] = []
+    closed_logs: list[dict] = []
+    rejected = 0
+    for event in events:
+        if isinstance(event, UserLogEnterCreate):
+            last = state["latest"]
+            if (
+                last is None
+                or last["exit_time"] is not None
+                or last["enter_time"] is None
+                or local_date(last["enter_time"]) < local_date(event.enter_time)
+            ):
+                log = {"id": None, "user_id": event.user_id, "enter_time": event.enter_time, "exit_time": None}
+                new_logs.append(log)
+                state["latest"] = log
+                # Keep the DB order: newest enter_time first.
+                user_open = state["open"]
+                position = next(
+                    (
+                        index for index, item in enumerate(user_open)
+                        if item["enter_time"] is not None and item["enter_time"] <= event.enter_time
+                    ),
+                    len(user_open),
+                )
+                user_open.insert(position, log)
+            else:
+                rejected += 1
+        else:
+            log = state["latest"]
+            if (
+                log is None
+                or log["exit_time"] is not None
+                or log["enter_time"] is None
+                or local_date(log["enter_time"]) > local_date(event.exit_time)
+            ):
+                rejected += 1
+                continue
+            state["open"].remove(log)
+            log["exit_time"] = event.exit_time
+            closed_logs.append(log)
+    return new_logs, closed_logs, rejected
+
 
 class UserLogService:
     def __init__(self , session:AsyncSession):
@@ -49,9 +110,180 @@ class UserLogService:
         # Case 4: Last log open today → reject
         return {"message": "You haven't exited yet, so you can't enter again."}
 
+    async def enter(self, user_id: str, enter_time: datetime) -> int | None:
+        """Open a log in one statement; returns its id, or None if rejected.
+
+        The partial unique index ``uq_user_logs_user_id_open_day`` allows one
+        open log per user per local day, so a second enter while the first is
+        still open is dropped by ``ON CONFLICT DO NOTHING`` instead of a
+        read-then-insert that races between consumers.
+        """
+        stmt = (
+            pg_insert(UserLog)
+            .values(user_id=user_id, enter_time=enter_time)
+            .on_conflict_do_nothing(
+                index_elements=[UserLog.user_id, local_day(UserLog.enter_time)],
+                index_where=UserLog.exit_time.is_(None),
+            )
+            .returning(UserLog.id)
+        )
+        result = await self.session.execute(stmt)
+        log_id = result.scalar_one_or_none()
+        await self.session.commit()
+        return log_id
+
 
 
     
+    async def load_log_states(self, user_ids: list[str] | None = None, limit: int | None = None) -> dict[str, LogState]:
+        """Latest log and open logs per user, in one query.
+
+        Without ``user_ids`` the ``limit`` most recently active users are loaded,
+        which is how the consumer warms its state cache.
+        """
+        latest_ids = (
+            select(UserLog.id)
+            .distinct(UserLog.user_id)
+            .order_by(UserLog.user_id, desc(UserLog.enter_time))
+        )
+        stmt = select(UserLog.id, UserLog.user_id, UserLog.enter_time, UserLog.exit_time)
+        if user_ids is not None:
+            latest_ids = latest_ids.where(UserLog.user_id.in_(user_ids))
+            stmt = stmt.where(UserLog.user_id.in_(user_ids))
+        else:
+            active_users = (
+                select(UserLog.user_id)
+                .group_by(UserLog.user_id)
+                .order_by(desc(func.max(UserLog.enter_time)).nulls_last())
+                .limit(limit)
+            )
+            latest_ids = latest_ids.where(UserLog.user_id.in_(active_users))
+            stmt = stmt.where(UserLog.user_id.in_(active_users))
+        stmt = (
+            stmt.where(or_(UserLog.exit_time.is_(None), UserLog.id.in_(latest_ids)))
+            .order_by(UserLog.user_id, desc(UserLog.enter_time))
+        )
+
+        states: dict[str, LogState] = {user_id: {"latest": None, "open": []} for user_id in user_ids or ()}
+        for row in (await self.session.execute(stmt)).mappings():
+            log = dict(row)
+            state = states.setdefault(log["user_id"], {"latest": None, "open": []})
+            # Rows come in the same order as the DISTINCT ON, so a user's first row is the latest.
+            if state["latest"] is None:
+                state["latest"] = log
+            if log["exit_time"] is None:
+                state["open"].append(log)
+        return states
+
+    async def apply_events(
+        self,
+        events: list[UserLogEnterCreate | UserLogExitCreate],
+        cache: UserLogStateCache | None = None,
+    ) -> dict:
+        """Apply a batch of enter/exit events in one transaction.
+
+        Follows the rules of ``enter`` and ``exit`` event by event, days being
+        local days of the events as in the database, but against an in-memory
+        copy of the affected users' logs, taken from ``cache`` or else loaded with one query. New logs are
+        written with a single multi-row INSERT and closed logs with a single
+        ``UPDATE ... FROM (VALUES ...)``; the cache is updated after the commit.
+
+        A cached state may be stale when other processes write the same users.
+        Writes decided on it are guarded by the database (the open-log-per-day
+        index, ``exit_time IS NULL``), but rejections are not, so a user whose
+        events would be rejected on cached state is re-checked on loaded state.
+        """
+        by_user: dict[str, list[UserLogEnterCreate | UserLogExitCreate]] = {}
+        for event in events:
+            by_user.setdefault(event.user_id, []).append(event)
+
+        states: dict[str, LogState] = {}
+        plans: dict[str, tuple[list[dict], list[dict], int]] = {}
+        missing = []
+        for user_id, user_events in by_user.items():
+            state = cache.get(user_id) if cache is not None else None
+            if state is not None:
+                plan = plan_events(state, user_events)
+                if not plan[2]:
+                    states[user_id], plans[user_id] = state, plan
+                    continue
+                # Another writer (a replica, the API) may have changed the logs since
+                # they were cached, and a rejection writes nothing that could notice.
+                cache.rechecked += 1
+            missing.append(user_id)
+        if missing:
+            loaded = await self.load_log_states(missing)
+            for user_id in missing:
+                states[user_id] = loaded[user_id]
+                plans[user_id] = plan_events(loaded[user_id], by_user[user_id])
+
+        new_logs: list[dict] = []
+        closed: dict[int, datetime] = {}
+        closed_users: dict[int, str] = {}
+        rejected = 0
+        for user_id, (user_new_logs, user_closed_logs, user_rejected) in plans.items():
+            new_logs.extend(user_new_logs)
+            rejected += user_rejected
+            for log in user_closed_logs:
+                # Logs opened in this batch are inserted closed already.
+                if log["id"] is not None:
+                    closed[log["id"]] = log["exit_time"]
+                    closed_users[log["id"]] = user_id
+
+        conflicted: set[str] = set()
+        if new_logs:
+            # Another consumer may have opened the same user's log meanwhile; the
+            # open-log-per-day index turns that into a skipped row, not an error.
+            result = await self.session.execute(
+                pg_insert(UserLog)
+                .on_conflict_do_nothing(
+                    index_elements=[UserLog.user_id, local_day(UserLog.enter_time)],
+                    index_where=UserLog.exit_time.is_(None),
+                )
+                .returning(UserLog.id, UserLog.user_id, UserLog.enter_time),
+                [
+                    {"user_id": log["user_id"], "enter_time": log["enter_time"], "exit_time": log["exit_time"]}
+                    for log in new_logs
+                ],
+            )
+            inserted = {(row.user_id, row.enter_time): row.id for row in result}
+            for log in new_logs:
+                log["id"] = inserted.get((log["user_id"], log["enter_time"]))
+                if log["id"] is None:
+                    conflicted.add(log["user_id"])
+            created = len(inserted)
+            rejected += len(new_logs) - created
+        else:
+            created = 0
+        if closed:
+            exits = values(
+                column("id", Integer),
+                column("exit_time", DateTime(timezone=True)),
+                name="exits",
+            ).data(list(closed.items()))
+            # Only still-open logs: another consumer may have closed one since our state was read.
+            result = await self.session.execute(
+                update(UserLog)
+                .where(UserLog.id == exits.c.id, UserLog.exit_time.is_(None))
+                .values(exit_time=exits.c.exit_time)
+                .returning(UserLog.id)
+                .execution_options(synchronize_session=False)
+            )
+            updated = set(result.scalars())
+            for log_id, user_id in closed_users.items():
+                if log_id not in updated:
+                    conflicted.add(user_id)
+            rejected += len(closed) - len(updated)
+        else:
+            updated = set()
+        await self.session.commit()
+        if cache is not None:
+            # The in-memory state of users that lost a conflict is wrong; reload them next time.
+            cache.put_many({user_id: state for user_id, state in states.items() if user_id not in conflicted})
+            cache.invalidate(conflicted)
+
+        return {"created": created, "closed": len(updated), "rejected": rejected}
+
     async def get_user_logs_by_id(self,  user_log_id: int):
         return await self.service.get_by_id(model=UserLog , item_id=user_log_id)
     
@@ -125,6 +357,38 @@ class UserLogService:
             await self.session.commit()
             return user_log_data
 
+    async def exit(self, user_id: str, exit_time: datetime) -> int | None:
+        """Close the user's latest log in one statement; returns its id, or None if rejected.
+
+        Nothing happens when the latest log is already closed or was opened on
+        a later day than ``exit_time``. Unlike ``update_user_log_exit_time``, an
+        exit never closes an older log left open: a repeated exit is dropped, as
+        in the rebuild from access_events (``REBUILD_USER_LOGS``).
+        """
+        latest = (
+            select(UserLog.id)
+            .where(UserLog.user_id == user_id)
+            .order_by(desc(UserLog.enter_time))
+            .limit(1)
+            .scalar_subquery()
+        )
+        stmt = (
+            update(UserLog)
+            .where(
+                UserLog.id == latest,
+                # Re-checked by the UPDATE itself: a concurrent exit may have closed it.
+                UserLog.exit_time.is_(None),
+                local_day(UserLog.enter_time) <= local_day(literal(exit_time, DateTime(timezone=True))),
+            )
+            .values(exit_time=exit_time)
+            .returning(UserLog.id)
+            .execution_options(synchronize_session=False)
+        )
+        result = await self.session.execute(stmt)
+        log_id = result.scalar_one_or_none()
+        await self.session.commit()
+        return log_id
+
     
     async def make_exel_file(
         self, 
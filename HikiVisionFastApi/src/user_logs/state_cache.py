@@ -0,0 +1,109 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from core.models.user_logs import LOCAL_TIMEZONE
+
+
+# Per-user attendance state, as loaded by UserLogService.load_log_states:
+#   {"latest": log | None, "open": [log, ...]}
+# where every log is {"id", "user_id", "enter_time", "exit_time"}, "latest" is the
+# newest log by enter_time and "open" lists the open logs newest first. A log that
+# is both latest and open is the same dict in both places.
+LogState = dict
+
+LOCAL_ZONE = ZoneInfo(LOCAL_TIMEZONE)
+
+
+def to_utc(value: datetime | None) -> datetime | None:
+    """UTC, as timestamptz values read back from Postgres; naive times are site time."""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=LOCAL_ZONE)
+    return value.astimezone(timezone.utc)
+
+
+def copy_state(state: LogState) -> LogState:
+    """Copy a state, keeping "latest" and "open" pointing at the same log dicts."""
+    copies: dict[int, dict] = {}
+
+    def copy_log(log: dict) -> dict:
+        key = id(log)
+        if key not in copies:
+            copies[key] = dict(log)
+        return copies[key]
+
+    return {
+        "latest": copy_log(state["latest"]) if state["latest"] is not None else None,
+        "open": [copy_log(log) for log in state["open"]],
+    }
+
+
+class UserLogStateCache:
+    """Bounded LRU of per-user attendance state for the consumer.
+
+    With the state cached, deciding what an enter or exit does needs no query;
+    misses fall back to the database. Entries expire after ``ttl`` seconds so
+    writes made elsewhere (the API, another consumer replica) are picked up;
+    until then ``UserLogService.apply_events`` re-checks any rejection.
+    ``get`` returns a copy: callers commit first and ``put`` the result after.
+    """
+
+    def __init__(self, max_entries: int = 100_000, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, LogState]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        # Users re-checked against the database because a cached state rejected an event.
+        self.rechecked = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id: str) -> LogState | None:
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return copy_state(entry[1])
+
+    def put(self, user_id: str, state: LogState):
+        """Cache ``state``, taking it over: its times are converted to UTC in place.
+
+        Loaded states come from the database in UTC, states built from events
+        carry the device's offset; one zone keeps cache hits and misses alike.
+        """
+        for log in (state["latest"], *state["open"]):
+            if log is not None:
+                log["enter_time"] = to_utc(log["enter_time"])
+                log["exit_time"] = to_utc(log["exit_time"])
+        self._entries[user_id] = (time.monotonic() + self.ttl, state)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evicted += 1
+
+    def put_many(self, states: dict[str, LogState]):
+        for user_id, state in states.items():
+            self.put(user_id, state)
+
+    def invalidate(self, user_ids):
+        for user_id in user_ids:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "rechecked": self.rechecked,
+        }
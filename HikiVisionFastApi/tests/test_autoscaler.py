@@ -0,0 +1,33 @@
+import asyncio
+
+from consumer.autoscaler import Autoscaler
+from consumer.partitioner import PartitionedConsumer
+
+
+def test_scales_up_catches_up_and_steps_down():
+    async def run():
+        consumer = PartitionedConsumer(handler=None, workers=8, concurrency=2)
+        autoscaler = Autoscaler(
+            consumer, None, "camera_events",
+            min_workers=2, max_workers=8, min_batch_size=10, max_batch_size=100,
+            scale_up_depth=1000, catch_up_depth=20000, catch_up_batch_size=500, max_lag=30.0,
+        )
+        steps = []
+        for backlog, lag in [(0, 0.0), (1500, 1.0), (100, 45.0), (25000, 1.0), (12000, 1.0), (100, 1.0)]:
+            await autoscaler.apply(*autoscaler.decide(backlog, lag))
+            steps.append((autoscaler.mode, autoscaler.workers, autoscaler.batch_size, consumer.concurrency.limit))
+        return steps, autoscaler.stats()
+
+    steps, stats = asyncio.run(run())
+
+    assert steps == [
+        ("normal", 2, 10, 2),
+        ("normal", 4, 20, 4),
+        # A short queue but events far behind device time.
+        ("normal", 8, 40, 8),
+        ("catch_up", 8, 500, 8),
+        # Stays in catch-up until the backlog is below half the threshold.
+        ("catch_up", 8, 500, 8),
+        ("normal", 7, 100, 7),
+    ]
+    assert (stats["scale_ups"], stats["scale_downs"], stats["catch_ups"], stats["decisions"]) == (2, 1, 1, 4)
@@ -0,0 +1,21 @@
+import asyncio
+
+from core.models import User
+from user_logs.explain_check import CASES, check
+
+
+def test_user_log_queries_use_indexes(session_factory, capsys):
+    async def run():
+        async with session_factory() as session:
+            session.add(User(id="1", username="1"))
+            await session.commit()
+        # With enable_seqscan off, a Seq Scan means no index can serve the query.
+        return await check(min_rows=0, no_seqscan=True, engine=session_factory.kw["bind"])
+
+    failures = asyncio.run(run())
+
+    assert failures == []
+    out = capsys.readouterr().out
+    assert "raised" not in out
+    for name, _, _ in CASES:
+        assert f"{name}: " in out
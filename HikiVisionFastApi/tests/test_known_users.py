@@ -0,0 +1,55 @@
+import asyncio
+
+from sqlalchemy.exc import OperationalError
+
+from consumer import known_users as known_users_module
+from consumer.known_users import KnownUsers
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+
+    def add_termination_listener(self, callback):
+        pass
+
+    async def add_listener(self, channel, callback):
+        pass
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+def test_listen_retries_after_a_failed_reload(monkeypatch):
+    connections = []
+    loads = []
+
+    async def connect(dsn):
+        connections.append(FakeConnection())
+        return connections[-1]
+
+    async def listen():
+        users = KnownUsers()
+        done = asyncio.Event()
+
+        async def load():
+            loads.append(len(connections))
+            if len(loads) == 1:
+                raise OperationalError("SELECT users.id FROM users", {}, ConnectionResetError())
+            done.set()
+
+        users.load = load
+        task = asyncio.create_task(users.listen("postgresql://test", retry_interval=0.01))
+        await asyncio.wait_for(done.wait(), 1)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    monkeypatch.setattr(known_users_module.asyncpg, "connect", connect)
+    asyncio.run(listen())
+
+    assert loads == [1, 2]
+    # The failed attempt's connection was closed before retrying.
+    assert connections[0].closed
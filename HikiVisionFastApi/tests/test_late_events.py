@@ -0,0 +1,107 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+
+from access_events.service import LOCAL_ZONE, AccessEventService
+from consumer.main import apply_late_events, process_events, raw_event, state_cache
+from consumer.schemas import Event
+from core.config import settings
+from core.models import User, UserLog
+from core.utils.db_helper import db_helper
+from user_logs.schemas import UserLogEnterCreate, UserLogExitCreate
+from user_logs.service import UserLogService
+
+
+TODAY = datetime.now(LOCAL_ZONE).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def at(days_ago: int, hour: int, minute: int = 0) -> datetime:
+    return TODAY - timedelta(days=days_ago) + timedelta(hours=hour, minutes=minute)
+
+
+def event(user_id: str, time: datetime, camera_type: str, serial_no: int) -> Event:
+    return Event(user_id=user_id, time=time, camera_type=camera_type, device_ip="10.0.0.1", serial_no=serial_no)
+
+
+@pytest.fixture
+def consumer_db(session_factory, monkeypatch):
+    monkeypatch.setattr(db_helper, "session_factory", session_factory)
+    state_cache.invalidate(list(state_cache._entries))
+    return session_factory
+
+
+async def seed(session_factory, events: list[Event]):
+    """Users of ``events``, and the events recorded and applied as the live path does."""
+    async with session_factory() as session:
+        session.add_all(User(id=user_id, username=user_id) for user_id in sorted({e.user_id for e in events}))
+        await session.commit()
+        await AccessEventService(session=session).record([raw_event(e) for e in events])
+        await UserLogService(session=session).apply_events([
+            UserLogEnterCreate(user_id=e.user_id, enter_time=e.time)
+            if e.camera_type == "enter"
+            else UserLogExitCreate(user_id=e.user_id, exit_time=e.time)
+            for e in events
+        ])
+
+
+async def logs(session_factory) -> list[tuple]:
+    async with session_factory() as session:
+        rows = await session.execute(
+            select(UserLog.user_id, UserLog.enter_time, UserLog.exit_time).order_by(UserLog.user_id, UserLog.enter_time)
+        )
+        return [tuple(row) for row in rows]
+
+
+def test_late_enter_keeps_an_exit_of_a_later_day(consumer_db):
+    async def run():
+        await seed(consumer_db, [event("1", at(2, 8), "enter", 1), event("1", at(1, 17), "exit", 2)])
+        await apply_late_events([event("1", at(2, 7, 50), "enter", 3)])
+        return await logs(consumer_db)
+
+    assert asyncio.run(run()) == [("1", at(2, 7, 50), at(1, 17))]
+
+
+def test_rebuild_keeps_logs_access_events_cannot_reproduce(consumer_db):
+    async def run():
+        await seed(consumer_db, [event("1", at(2, 8), "enter", 1), event("1", at(2, 17), "exit", 2)])
+        async with consumer_db() as session:
+            # Written before access_events existed.
+            session.add(UserLog(user_id="1", enter_time=at(3, 8), exit_time=at(3, 17)))
+            await session.commit()
+        await apply_late_events([event("1", at(2, 12), "exit", 3)])
+        return await logs(consumer_db)
+
+    assert asyncio.run(run()) == [("1", at(3, 8), at(3, 17)), ("1", at(2, 8), at(2, 12))]
+
+
+def test_failed_record_rebuilds_nothing(consumer_db, monkeypatch):
+    async def fail(self, events, commit=True):
+        raise SQLAlchemyError("insert failed")
+
+    async def run():
+        await seed(consumer_db, [event("1", at(2, 8), "enter", 1), event("1", at(2, 17), "exit", 2)])
+        monkeypatch.setattr(AccessEventService, "record", fail)
+        await apply_late_events([event("1", at(2, 12), "exit", 3)])
+        return await logs(consumer_db)
+
+    assert asyncio.run(run()) == [("1", at(2, 8), at(2, 17))]
+
+
+def test_a_redelivered_batch_changes_no_log(consumer_db, monkeypatch):
+    monkeypatch.setattr(settings.rabbit, "known_users_filter", False)
+    batch = [event("1", at(1, 8), "enter", 1), event("1", at(1, 17), "exit", 2)]
+
+    async def run():
+        async with consumer_db() as session:
+            session.add(User(id="1", username="1"))
+            await session.commit()
+        await process_events(batch)
+        # A restart: the state cache is empty when the batch comes again.
+        state_cache.invalidate(["1"])
+        await process_events(batch)
+        return await logs(consumer_db)
+
+    assert asyncio.run(run()) == [("1", at(1, 8), at(1, 17))]
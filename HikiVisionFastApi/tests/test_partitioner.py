@@ -0,0 +1,129 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from pydantic import ValidationError
+
+from consumer import envelope
+from consumer.main import consumed_queue
+from consumer.partitioner import PartitionedConsumer, decode_message
+from core.config import settings
+
+
+TASHKENT = timezone(timedelta(hours=5))
+
+
+class FakeMessage:
+    def __init__(self, body: bytes, content_type: str | None = None):
+        self.body = body
+        self.content_type = content_type
+        self.acked = False
+
+    async def ack(self):
+        self.acked = True
+
+
+def raw(user_id, time, camera_type="enter", serial_no=1):
+    return SimpleNamespace(
+        user_id=user_id, time=time, camera_type=camera_type, device_ip="10.0.0.1", serial_no=serial_no, snapshot=None
+    )
+
+
+def envelope_message(*events) -> FakeMessage:
+    return FakeMessage(envelope.encode(list(events)), envelope.CONTENT_TYPE)
+
+
+def test_decode_envelope_keeps_offsets_and_fields():
+    time = datetime(2026, 10, 17, 8, 0, 1, 123456, tzinfo=TASHKENT)
+    events, errors = decode_message(envelope_message(raw("1", time, "enter", 7), raw(None, time, "exit", 8)))
+
+    assert errors == []
+    assert [(e.user_id, e.time, e.camera_type, e.device_ip, e.serial_no) for e in events] == [
+        ("1", time, "enter", "10.0.0.1", 7),
+        (None, time, "exit", "10.0.0.1", 8),
+    ]
+    assert events[0].time.utcoffset() == timedelta(hours=5)
+
+
+def test_decode_naive_time_is_site_time():
+    events, _ = decode_message(envelope_message(raw("1", datetime(2026, 10, 17, 8, 0))))
+
+    assert events[0].time == datetime(2026, 10, 17, 8, 0, tzinfo=TASHKENT)
+
+
+def test_decode_json_event():
+    events, errors = decode_message(FakeMessage(b'{"user_id": "1", "time": "2026-10-17T08:00:00+05:00", "camera_type": "exit"}'))
+
+    assert errors == []
+    assert [(e.user_id, e.camera_type) for e in events] == [("1", "exit")]
+
+
+def test_decode_invalid_json_event_raises():
+    with pytest.raises(ValidationError):
+        decode_message(FakeMessage(b'{"user_id": "1", "time": null, "camera_type": "exit"}'))
+
+
+def test_decode_skips_invalid_events_of_an_envelope():
+    time = datetime(2026, 10, 17, 8, 0, tzinfo=TASHKENT)
+    events, errors = decode_message(envelope_message(raw("1", time), raw("2", None), raw("3", time)))
+
+    assert [e.user_id for e in events] == ["1", "3"]
+    assert len(errors) == 1
+
+
+def test_on_message_delivers_the_valid_events_of_an_envelope():
+    time = datetime(2026, 10, 17, 8, 0, tzinfo=TASHKENT)
+    message = envelope_message(raw("1", time), raw("2", None), raw("3", time))
+
+    async def run():
+        consumer = PartitionedConsumer(handler=None, workers=4)
+        await consumer.on_message(message)
+        return consumer
+
+    consumer = asyncio.run(run())
+
+    queued = [item for queue in consumer.queues for item in queue._queue]
+    assert sorted(event.user_id for _, event in queued) == ["1", "3"]
+    assert consumer.invalid == 1
+    assert not message.acked
+    assert queued[0][0].remaining == 2
+
+
+
+def test_a_users_events_are_handled_in_order_on_their_partition():
+    time = datetime(2026, 10, 17, 8, 0, tzinfo=TASHKENT)
+    handled = []
+
+    async def handler(events):
+        handled.extend((event.user_id, event.camera_type) for event in events)
+
+    async def run():
+        consumer = PartitionedConsumer(handler=handler, workers=4)
+        for camera_type in ("enter", "exit", "enter"):
+            await consumer.on_message(envelope_message(raw("42", time, camera_type), raw("7", time, camera_type)))
+        queued = [[event.user_id for _, event in queue._queue] for queue in consumer.queues]
+        consumer.start()
+        while consumer.processed < 6:
+            await asyncio.sleep(0.01)
+        await consumer.stop()
+        return queued
+
+    queued = asyncio.run(run())
+
+    # crc32("42") % 4 == 0, crc32("7") % 4 == 2; the producer's topic keys use the same hash.
+    assert queued == [["42"] * 3, [], ["7"] * 3, []]
+    assert [camera_type for user_id, camera_type in handled if user_id == "42"] == ["enter", "exit", "enter"]
+    assert [camera_type for user_id, camera_type in handled if user_id == "7"] == ["enter", "exit", "enter"]
+
+
+def test_a_partitioned_consumer_reads_its_own_queue(monkeypatch):
+    assert consumed_queue() == (settings.rabbit.queue_name, settings.rabbit.bindings)
+
+    monkeypatch.setattr(settings.rabbit, "partitions", 4)
+    monkeypatch.setattr(settings.rabbit, "partition", 2)
+    assert consumed_queue() == (f"{settings.rabbit.queue_name}.2", ["*.*.*.2"])
+
+    monkeypatch.setattr(settings.rabbit, "partition", 4)
+    with pytest.raises(ValueError, match="PARTITION"):
+        consumed_queue()
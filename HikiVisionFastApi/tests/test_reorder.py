@@ -0,0 +1,50 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from consumer.main import report_stats
+from consumer.reorder import ReorderBuffer
+from consumer.schemas import Event
+
+
+START = datetime(2026, 9, 14, 8, tzinfo=timezone.utc)
+
+
+def event(user_id: str, seconds: int, camera_type: str = "enter") -> Event:
+    return Event(user_id=user_id, time=START + timedelta(seconds=seconds), camera_type=camera_type)
+
+
+def test_release_puts_a_users_events_in_device_time_order():
+    buffer = ReorderBuffer(delay=1.0)
+    exit_event, enter_event = event("1", 10, "exit"), event("1", 5, "enter")
+    buffer.add("exit", exit_event, now=0.0)
+    buffer.add("enter", enter_event, now=0.5)
+
+    # The exit's hold is over, but the earlier enter holds it back until it is due too.
+    assert buffer.release(now=1.2, limit=10) == []
+    assert buffer.next_deadline() == 1.5
+    assert buffer.release(now=1.6, limit=10) == ["enter", "exit"]
+    assert buffer.stats() == {"held": 0, "late": 1, "dropped": 0, "released": 2}
+
+
+def test_events_behind_the_watermark_are_dropped():
+    buffer = ReorderBuffer(delay=1.0)
+    buffer.add("a", event("1", 10), now=0.0)
+    buffer.release(now=1.0, limit=10)
+
+    assert not buffer.add("late", event("1", 5), now=2.0)
+    # Other users have their own watermark.
+    assert buffer.add("other", event("2", 5), now=2.0)
+    assert buffer.stats()["dropped"] == 1
+
+
+def test_report_stats_logs_every_source(capsys):
+    async def run():
+        task = asyncio.create_task(report_stats(0.01, reorder=ReorderBuffer(1.0), missing=None))
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    asyncio.run(run())
+
+    out = capsys.readouterr().out
+    assert "[Consumer] Stats reorder: {'held': 0, 'late': 0, 'dropped': 0, 'released': 0}" in out
+    assert "missing" not in out
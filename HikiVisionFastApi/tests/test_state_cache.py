@@ -0,0 +1,29 @@
+from datetime import datetime, timedelta, timezone
+
+from user_logs.state_cache import UserLogStateCache
+
+
+def test_put_stores_times_in_utc():
+    cache = UserLogStateCache()
+    log = {"id": 1, "user_id": "1", "enter_time": datetime(2026, 9, 15, 0, 30, tzinfo=timezone(timedelta(hours=5))), "exit_time": None}
+    cache.put("1", {"latest": log, "open": [log]})
+
+    state = cache.get("1")
+
+    assert state["latest"]["enter_time"] == datetime(2026, 9, 14, 19, 30, tzinfo=timezone.utc)
+    assert state["latest"]["enter_time"].utcoffset() == timedelta(0)
+    # Still one log, shared by "latest" and "open".
+    assert state["open"][0] is state["latest"]
+
+
+def test_get_returns_a_copy():
+    cache = UserLogStateCache()
+    log = {"id": 1, "user_id": "1", "enter_time": datetime(2026, 9, 15, 8, tzinfo=timezone.utc), "exit_time": None}
+    cache.put("1", {"latest": log, "open": [log]})
+
+    state = cache.get("1")
+    state["latest"]["exit_time"] = datetime(2026, 9, 15, 17, tzinfo=timezone.utc)
+    state["open"].clear()
+
+    assert cache.get("1")["latest"]["exit_time"] is None
+    assert len(cache.get("1")["open"]) == 1
@@ -0,0 +1,188 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from access_events.service import LOCAL_ZONE, AccessEventService
+from core.models import User, UserLog
+from user_logs.schemas import UserLogEnterCreate, UserLogExitCreate
+from user_logs.service import UserLogService
+from user_logs.state_cache import UserLogStateCache
+
+
+DAY = datetime(2026, 9, 14, tzinfo=LOCAL_ZONE)
+
+
+def at(day: int, hour: int, minute: int = 0) -> datetime:
+    return DAY + timedelta(days=day, hours=hour, minutes=minute)
+
+
+# (user_id, camera_type, time), in device time order.
+EVENTS = [
+    ("1", "enter", at(0, 8)),  # never exited
+    ("1", "enter", at(1, 8)),
+    ("2", "enter", at(1, 9)),
+    ("1", "exit", at(1, 17)),
+    ("1", "exit", at(1, 18)),  # repeated: must not close day 0's log
+    ("1", "exit", at(2, 7)),  # nothing open
+    ("1", "enter", at(2, 8)),
+    ("1", "enter", at(2, 9)),  # still inside
+    ("2", "exit", at(2, 10)),  # closes yesterday's log
+    ("1", "exit", at(2, 12)),
+    ("1", "enter", at(2, 13)),
+    ("1", "exit", at(2, 17)),
+    # Still the previous day in UTC: one local day all the same.
+    ("2", "enter", at(3, 0, 30)),
+    ("2", "enter", at(3, 8)),
+    ("2", "exit", at(3, 17)),
+]
+
+EXPECTED = [
+    ("1", at(0, 8), None),
+    ("1", at(1, 8), at(1, 17)),
+    ("1", at(2, 8), at(2, 12)),
+    ("1", at(2, 13), at(2, 17)),
+    ("2", at(1, 9), at(2, 10)),
+    ("2", at(3, 0, 30), at(3, 17)),
+]
+
+
+def item(user_id: str, camera_type: str, time: datetime):
+    if camera_type == "enter":
+        return UserLogEnterCreate(user_id=user_id, enter_time=time)
+    return UserLogExitCreate(user_id=user_id, exit_time=time)
+
+
+async def add_users(session_factory, user_ids):
+    async with session_factory() as session:
+        session.add_all(User(id=user_id, username=user_id) for user_id in user_ids)
+        await session.commit()
+
+
+async def logs(session_factory) -> list[tuple]:
+    async with session_factory() as session:
+        rows = await session.execute(
+            select(UserLog.user_id, UserLog.enter_time, UserLog.exit_time).order_by(UserLog.user_id, UserLog.enter_time)
+        )
+        return [tuple(row) for row in rows]
+
+
+@pytest.fixture
+def users(session_factory):
+    asyncio.run(add_users(session_factory, ["1", "2"]))
+    return session_factory
+
+
+def test_apply_events_in_one_batch(users):
+    async def run():
+        async with users() as session:
+            result = await UserLogService(session=session).apply_events([item(*e) for e in EVENTS])
+        return result, await logs(users)
+
+    result, rows = asyncio.run(run())
+
+    assert rows == EXPECTED
+    # Logs opened and closed in the same batch are inserted closed.
+    assert result == {"created": 6, "closed": 0, "rejected": 4}
+
+
+def test_apply_events_in_batches_through_the_cache(users):
+    cache = UserLogStateCache()
+
+    async def run():
+        for start in range(0, len(EVENTS), 3):
+            async with users() as session:
+                await UserLogService(session=session).apply_events(
+                    [item(*e) for e in EVENTS[start:start + 3]], cache=cache
+                )
+        return await logs(users)
+
+    assert asyncio.run(run()) == EXPECTED
+    assert cache.hits > 0
+
+
+def test_enter_and_exit_one_by_one(users):
+    async def run():
+        for user_id, camera_type, time in EVENTS:
+            async with users() as session:
+                service = UserLogService(session=session)
+                if camera_type == "enter":
+                    await service.enter(user_id, time)
+                else:
+                    await service.exit(user_id, time)
+        return await logs(users)
+
+    assert asyncio.run(run()) == EXPECTED
+
+
+def test_rebuild_matches_live_apply(users):
+    async def run():
+        async with users() as session:
+            await AccessEventService(session=session).record([
+                {"device_ip": "10.0.0.1", "serial_no": serial_no, "event_time": time, "user_id": user_id, "camera_type": camera_type}
+                for serial_no, (user_id, camera_type, time) in enumerate(EVENTS)
+            ])
+            await UserLogService(session=session).apply_events([item(*e) for e in EVENTS])
+        live = await logs(users)
+        async with users() as session:
+            result = await AccessEventService(session=session).rebuild_user_logs(
+                (DAY - timedelta(days=1)).date(), (DAY + timedelta(days=5)).date()
+            )
+        return live, await logs(users), result
+
+    live, rebuilt, result = asyncio.run(run())
+
+    assert live == EXPECTED
+    assert rebuilt == live
+    assert result == {"deleted": 6, "inserted": 6}
+
+
+def test_repeated_events_without_serial_are_stored_once(users):
+    row = {"device_ip": None, "serial_no": None, "event_time": at(0, 8), "user_id": "1", "camera_type": "enter"}
+
+    async def run():
+        async with users() as session:
+            service = AccessEventService(session=session)
+            first = await service.record([row])
+            second = await service.record([row, {**row, "user_id": "2"}])
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first == [("1", at(0, 8))]
+    # Another user in the same second is a different event.
+    assert second == [("2", at(0, 8))]
+
+
+def test_rejection_on_a_stale_cache_is_checked_against_the_database(users):
+    cache = UserLogStateCache()
+
+    async def run():
+        async with users() as session:
+            service = UserLogService(session=session)
+            # Warm: user 1 inside since 08:00, user 2 gone since yesterday 17:00.
+            await service.apply_events([item("1", "enter", at(0, 8)), item("2", "enter", at(-1, 8)), item("2", "exit", at(-1, 17))], cache=cache)
+        async with users() as session:
+            # Another replica: user 1 leaves, user 2 comes in today.
+            other = UserLogService(session=session)
+            await other.exit("1", at(0, 12))
+            await other.enter("2", at(0, 9))
+        async with users() as session:
+            # On the cached state both would be rejected: user 1 still inside, user 2 not.
+            result = await UserLogService(session=session).apply_events(
+                [item("1", "enter", at(0, 13)), item("2", "exit", at(0, 17))], cache=cache
+            )
+        return result, await logs(users)
+
+    result, rows = asyncio.run(run())
+
+    assert result == {"created": 1, "closed": 1, "rejected": 0}
+    assert rows == [
+        ("1", at(0, 8), at(0, 12)),
+        ("1", at(0, 13), None),
+        ("2", at(-1, 8), at(-1, 17)),
+        ("2", at(0, 9), at(0, 17)),
+    ]
+    assert cache.rechecked == 2
+    assert cache.get("1")["latest"]["enter_time"] == at(0, 13)